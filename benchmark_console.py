@@ -0,0 +1,114 @@
+import argparse
+import importlib.util
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Заглушка вместо yt-dlp: печатает заданное число строк как можно быстрее
+STUB_SCRIPT = (
+    "import sys\n"
+    "write = sys.stdout.write\n"
+    "for i in range({lines}):\n"
+    "    write(f'[download] Stub line {{i}} of {lines}: lorem ipsum dolor sit amet\\n')\n"
+)
+
+def load_gui_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gui_yt-dlp.py")
+    spec = importlib.util.spec_from_file_location("gui_yt_dlp", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк передачи вывода yt-dlp в консоль GUI")
+    parser.add_argument("--lines", type=int, default=100000, help="Количество строк, которое выводит заглушка")
+    parser.add_argument("--probe-ms", type=int, default=5, help="Интервал таймера для замера задержки UI-потока")
+    args = parser.parse_args()
+
+    gui = load_gui_module()
+
+    # Файлы состояния приложения (настройки, журнал, лог) создаются во временном
+    # каталоге, который удаляется после замера
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="gfyt-bench-") as work_dir:
+        os.chdir(work_dir)
+        try:
+            run_benchmark(gui, args)
+        finally:
+            os.chdir(original_dir)
+
+def run_benchmark(gui, args):
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtCore import QTimer
+
+    # Пустой файл, чтобы окно не пыталось скачать yt-dlp при запуске
+    open(gui.ConfigManager.get_ytdlp_path(), "w").close()
+
+    app = QApplication(sys.argv)
+
+    class StubDownloadThread(gui.DownloadThread):
+        def build_command(self):
+            return [sys.executable, "-c", STUB_SCRIPT.format(lines=args.lines)]
+
+    window = gui.YTDLPGUI()
+    window.download_queue.thread_class = StubDownloadThread
+
+    delays = []
+    last_tick = [time.perf_counter()]
+
+    def probe():
+        now = time.perf_counter()
+        delays.append(max(0.0, (now - last_tick[0]) * 1000 - args.probe_ms))
+        last_tick[0] = now
+
+    probe_timer = QTimer()
+    probe_timer.setInterval(args.probe_ms)
+    probe_timer.timeout.connect(probe)
+
+    result = {}
+
+    def check_done():
+        queue = window.download_queue
+        if not queue.has_active() and queue.output.empty() and 'end' not in result:
+            result['end'] = time.perf_counter()
+            app.quit()
+
+    done_timer = QTimer()
+    done_timer.setInterval(10)
+    done_timer.timeout.connect(check_done)
+
+    def start():
+        result['start'] = time.perf_counter()
+        last_tick[0] = result['start']
+        probe_timer.start()
+        done_timer.start()
+        window.url_input.setText("https://example.com/benchmark")
+        window.start_download()
+
+    QTimer.singleShot(0, start)
+    app.exec()
+
+    elapsed = result['end'] - result['start']
+    blocks = window.console_output.document().blockCount()
+    # Закрываем окно и лог до удаления каталога, чтобы не держать открытые файлы
+    window.close()
+    gui.ConfigManager.close_log()
+    print(f"Строк:                {args.lines}")
+    print(f"Блоков в консоли:     {blocks}")
+    print(f"Время:                {elapsed:.2f} с")
+    print(f"Пропускная способность: {args.lines / elapsed:,.0f} строк/с")
+    print(f"Задержка UI (сверх {args.probe_ms} мс): "
+          f"медиана {statistics.median(delays) if delays else 0:.1f} мс, "
+          f"p99 {percentile(delays, 0.99):.1f} мс, "
+          f"макс {max(delays) if delays else 0:.1f} мс")
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,44 @@
 import os
 import sys
+import gzip
+import hashlib
+import atexit
+import io
+import json
+import threading
+import itertools
+import random
+import shlex
+import signal
 import subprocess
-import requests
 import re
 import shutil
 import tempfile
-import zipfile
-import tarfile
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from queue import SimpleQueue, Empty
 from pathlib import Path
-from PyQt6.QtWidgets import (
+
+# Отметка для профиля запуска: стандартная библиотека загружается быстро,
+# основное время уходит на импорт PyQt6 ниже
+STARTUP_STARTED = time.perf_counter()
+
+from PyQt6.QtWidgets import (  # noqa: E402
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QCheckBox, QComboBox,
-    QTextEdit, QFileDialog, QMessageBox, QProgressDialog,
+    QPlainTextEdit, QFileDialog, QMessageBox, QProgressDialog,
     QRadioButton, QDialog, QTableWidget, QTableWidgetItem,
-    QDialogButtonBox, QHeaderView, QStatusBar, QGroupBox, QFormLayout, QButtonGroup
+    QDialogButtonBox, QHeaderView, QStatusBar, QGroupBox, QFormLayout, QButtonGroup,
+    QTableView, QAbstractItemView, QInputDialog, QStyledItemDelegate,
+    QStyleOptionProgressBar, QStyle, QMenu
 )
-from PyQt6.QtCore import QThread, pyqtSignal, Qt, QUrl, QTimer
-from PyQt6.QtGui import QDesktopServices, QIcon, QGuiApplication, QAction
+from PyQt6.QtCore import (  # noqa: E402
+    QThread, QObject, pyqtSignal, Qt, QUrl, QTimer, QAbstractTableModel, QModelIndex,
+    QCoreApplication, QLockFile
+)
+from PyQt6.QtGui import QDesktopServices, QIcon, QGuiApplication, QAction, QTextCursor  # noqa: E402
 
 # Константы
 YTDLP_RELEASES_URL = "https://api.github.com/repos/yt-dlp/yt-dlp/releases/latest"
@@ -26,6 +47,33 @@ FFMPEG_RELEASES_URL = "https://api.github.com/repos/yt-dlp/FFmpeg-Builds/release
 USER_AGENT = "yt-dlp-gui/1.0"
 SUPPORTED_BROWSERS = ["brave", "chrome", "firefox", "vivaldi"]
 
+class StartupProfile:
+    ENV_VAR = "GFYT_PROFILE_STARTUP"
+    FLAG = "--profile-startup"
+
+    def __init__(self):
+        self.enabled = False
+        self.phases = []
+        self._last = STARTUP_STARTED
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        lines = [f"{phase:<32} {duration * 1000:8.1f} мс" for phase, duration in self.phases]
+        lines.append(f"{'Всего':<32} {(self._last - STARTUP_STARTED) * 1000:8.1f} мс")
+        print("Профиль запуска:\n" + "\n".join(lines), file=sys.stderr)
+        ConfigManager.log_download("Профиль запуска: " + ", ".join(
+            f"{phase} {duration * 1000:.1f} мс" for phase, duration in self.phases))
+
+startup_profile = StartupProfile()
+
 def get_version():
     try:
         with open("version.txt", "r", encoding="utf-8") as f:
@@ -33,49 +81,403 @@ def get_version():
     except FileNotFoundError:
         return "1.0.0"  # Fallback version
 
+class HttpClient:
+    CACHE_FILE = "yt-dlp-gui-http-cache.json"
+    TIMEOUT = 30
+
+    _session = None
+    _session_lock = threading.Lock()
+    _cache = None
+    _cache_lock = threading.Lock()
+
+    @classmethod
+    def session(cls):
+        # Одна сессия на всё приложение: соединения с GitHub переиспользуются между запросами
+        with cls._session_lock:
+            if cls._session is None:
+                # requests загружается при первом сетевом запросе, а не при запуске окна
+                import requests
+                session = requests.Session()
+                session.headers["User-Agent"] = USER_AGENT
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                cls._session = session
+            return cls._session
+
+    @classmethod
+    def _load_cache(cls):
+        if cls._cache is None:
+            try:
+                with open(cls.CACHE_FILE, 'r', encoding='utf-8') as f:
+                    cls._cache = json.load(f)
+            except (OSError, ValueError):
+                cls._cache = {}
+        return cls._cache
+
+    @classmethod
+    def _save_cache(cls):
+        tmp_path = cls.CACHE_FILE + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cls._cache, f, ensure_ascii=False)
+        os.replace(tmp_path, cls.CACHE_FILE)
+
+    @classmethod
+    def get_json(cls, url):
+        # Условный запрос: при неизменившемся ответе GitHub вернёт 304,
+        # который не расходует лимит анонимных запросов
+        with cls._cache_lock:
+            entry = cls._load_cache().get(url)
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers["If-None-Match"] = entry['etag']
+            if entry.get('last_modified'):
+                headers["If-Modified-Since"] = entry['last_modified']
+
+        response = cls.session().get(url, headers=headers, timeout=cls.TIMEOUT)
+        if response.status_code == 304 and entry:
+            return entry['data']
+        response.raise_for_status()
+        data = response.json()
+
+        with cls._cache_lock:
+            cls._load_cache()[url] = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'data': data,
+            }
+            try:
+                cls._save_cache()
+            except OSError:
+                pass
+        return data
+
 class DownloaderThread(QThread):
     progress = pyqtSignal(int)
     finished = pyqtSignal(bool, str)
 
+    MAX_SEGMENTS = 8
+    MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+    MIN_CHUNK_SIZE = 64 * 1024
+    MAX_CHUNK_SIZE = 4 * 1024 * 1024
+    SEGMENT_RETRIES = 3
+    PROGRESS_INTERVAL = 0.1
+    STATE_SAVE_INTERVAL = 1.0
+    TIMEOUT = 30
+
     def __init__(self, url, destination):
         super().__init__()
         self.url = url
         self.destination = destination
+        # Недокачанные данные и состояние сегментов лежат рядом с целевым файлом,
+        # чтобы прерванную загрузку можно было продолжить
+        self.part_path = destination + ".part"
+        self.state_path = destination + ".part.json"
         self._is_running = True
+        self._error = None
+        self._lock = threading.Lock()
+        self._segments = []
+        self._downloaded = 0
+        self._last_percent = -1
+        self._last_progress_emit = 0.0
 
     def run(self):
         try:
-            headers = {"User-Agent": USER_AGENT}
-            response = requests.get(self.url, headers=headers, stream=True)
-            response.raise_for_status()
+            self.download()
+            self.finished.emit(True, "Файл успешно загружен")
+        except Exception as e:
+            self.finished.emit(False, f"Ошибка загрузки: {str(e)}")
 
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
+    def download(self):
+        session = HttpClient.session()
 
-            with open(self.destination, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if not self._is_running:
-                        raise Exception("Загрузка отменена пользователем")
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        progress = int((downloaded / total_size) * 100) if total_size > 0 else 0
-                        self.progress.emit(progress)
+        total_size, final_url, etag = self.probe(session)
+        if total_size:
+            self.download_segmented(session, final_url, total_size, etag)
+        else:
+            self.download_single(session)
 
-            # Логируем размер скачанного файла
-            file_size = os.path.getsize(self.destination) / (1024 * 1024)  # Размер в МБ
-            ConfigManager.log_download(f"Скачан файл {self.destination}, размер: {file_size:.2f} MB")
+        os.replace(self.part_path, self.destination)
+        self.remove_state()
 
-            self.finished.emit(True, "Файл успешно загружен")
-        except Exception as e:
-            self.finished.emit(False, f"Ошибка загрузки: {str(e)}")
+        # Логируем размер скачанного файла
+        file_size = os.path.getsize(self.destination) / (1024 * 1024)  # Размер в МБ
+        ConfigManager.log_download(f"Скачан файл {self.destination}, размер: {file_size:.2f} MB")
 
     def stop(self):
         self._is_running = False
 
+    def check_running(self):
+        if not self._is_running:
+            raise Exception("Загрузка отменена пользователем")
+        if self._error is not None:
+            raise self._error
+
+    def probe(self, session):
+        # Запрос первого байта показывает, поддерживает ли сервер Range, и даёт полный размер
+        with session.get(self.url, headers={"Range": "bytes=0-0"}, stream=True, timeout=self.TIMEOUT) as response:
+            response.raise_for_status()
+            if response.status_code == 206:
+                match = re.match(r'bytes 0-0/(\d+)', response.headers.get('Content-Range', ''))
+                if match:
+                    return int(match.group(1)), response.url, response.headers.get('ETag')
+            return None, response.url, None
+
+    def load_state(self, total_size, etag):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if (state['url'] != self.url or state['size'] != total_size or state.get('etag') != etag
+                    or os.path.getsize(self.part_path) != total_size):
+                return None
+            return state['segments']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save_state(self, total_size, etag):
+        with self._lock:
+            state = {'url': self.url, 'size': total_size, 'etag': etag,
+                     'segments': [list(segment) for segment in self._segments]}
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def remove_state(self):
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+
+    def download_segmented(self, session, url, total_size, etag):
+        segments = self.load_state(total_size, etag)
+        if segments is None:
+            count = max(1, min(self.MAX_SEGMENTS, total_size // self.MIN_SEGMENT_SIZE))
+            step = -(-total_size // count)
+            segments = [[start, min(start + step, total_size) - 1, 0] for start in range(0, total_size, step)]
+            # Файл сразу создаётся полного размера, сегменты пишут каждый в своё смещение
+            with open(self.part_path, 'wb') as f:
+                f.truncate(total_size)
+        else:
+            ConfigManager.log_download(f"Продолжение загрузки {self.destination} с {self.part_path}")
+
+        self._segments = segments
+        self._downloaded = sum(segment[2] for segment in segments)
+        remaining = [segment for segment in segments if segment[2] < segment[1] - segment[0] + 1]
+
+        with ThreadPoolExecutor(max_workers=max(1, len(remaining))) as pool:
+            futures = [pool.submit(self.download_segment, session, url, segment) for segment in remaining]
+            last_save = time.monotonic()
+            while not all(future.done() for future in futures):
+                wait(futures, timeout=self.PROGRESS_INTERVAL)
+                self.report_progress(total_size)
+                if time.monotonic() - last_save >= self.STATE_SAVE_INTERVAL:
+                    self.save_state(total_size, etag)
+                    last_save = time.monotonic()
+            self.save_state(total_size, etag)
+        self.check_running()
+        self.report_progress(total_size, force=True)
+
+    @staticmethod
+    def retry_errors():
+        import requests
+        import urllib3
+        # Чтение из response.raw отдаёт ошибки urllib3 напрямую, без обёртки requests
+        return (requests.RequestException, urllib3.exceptions.HTTPError, OSError)
+
+    def download_segment(self, session, url, segment):
+        retry_errors = self.retry_errors()
+        try:
+            for attempt in range(self.SEGMENT_RETRIES):
+                start = segment[0] + segment[2]
+                end = segment[1]
+                if start > end:
+                    return
+                try:
+                    self.read_range(session, url, segment, start, end)
+                    return
+                except retry_errors:
+                    if attempt == self.SEGMENT_RETRIES - 1 or not self._is_running or self._error is not None:
+                        raise
+                    time.sleep(1 + attempt)
+        except Exception as e:
+            with self._lock:
+                if self._error is None and self._is_running:
+                    self._error = e
+
+    def read_range(self, session, url, segment, start, end):
+        headers = {"Range": f"bytes={start}-{end}"}
+        with session.get(url, headers=headers, stream=True, timeout=self.TIMEOUT) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise Exception("Сервер перестал поддерживать загрузку по частям")
+            # Без буферизации: всё, что учтено в состоянии сегмента, уже передано ОС
+            with open(self.part_path, 'r+b', buffering=0) as f:
+                f.seek(start)
+                chunk_size = self.MIN_CHUNK_SIZE
+                while start <= end:
+                    self.check_running()
+                    started = time.monotonic()
+                    chunk = response.raw.read(min(chunk_size, end - start + 1))
+                    if not chunk:
+                        raise ConnectionError("Соединение прервано")
+                    f.write(chunk)
+                    start += len(chunk)
+                    with self._lock:
+                        segment[2] += len(chunk)
+                        self._downloaded += len(chunk)
+                    # Размер блока подстраивается под скорость канала
+                    elapsed = time.monotonic() - started
+                    if elapsed < 0.05 and chunk_size < self.MAX_CHUNK_SIZE:
+                        chunk_size *= 2
+                    elif elapsed > 0.5 and chunk_size > self.MIN_CHUNK_SIZE:
+                        chunk_size //= 2
+
+    def download_single(self, session):
+        # Сервер не поддерживает Range: обычная потоковая загрузка крупными блоками
+        with session.get(self.url, stream=True, timeout=self.TIMEOUT) as response:
+            response.raise_for_status()
+            total_size = int(response.headers.get('content-length', 0))
+            with open(self.part_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=self.MAX_CHUNK_SIZE // 4):
+                    self.check_running()
+                    if chunk:
+                        f.write(chunk)
+                        self._downloaded += len(chunk)
+                        self.report_progress(total_size)
+        self.report_progress(total_size, force=True)
+
+    def report_progress(self, total_size, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_progress_emit < self.PROGRESS_INTERVAL:
+            return
+        percent = int(self._downloaded * 100 / total_size) if total_size > 0 else 0
+        if percent != self._last_percent:
+            self._last_percent = percent
+            self._last_progress_emit = now
+            self.progress.emit(percent)
+
+class LogWriter(threading.Thread):
+    # Журнал пишется фоновым потоком: вызывающий код только кладёт запись в очередь,
+    # а файл дописывается пачками и сбрасывается на диск не чаще FLUSH_INTERVAL
+    # (ошибки - сразу). По достижении MAX_BYTES файл сжимается в .1.gz, старые
+    # архивы сдвигаются, а всё старше BACKUP_COUNT удаляется
+    FLUSH_INTERVAL = 1.0
+    BUFFER_SIZE = 64 * 1024
+    MAX_BYTES = 5 * 1024 * 1024
+    BACKUP_COUNT = 5
+    FORMATS = ("text", "json")
+
+    def __init__(self, path, log_format="text", max_bytes=None, backup_count=None):
+        super().__init__(name="log-writer", daemon=True)
+        self.path = path
+        self.log_format = log_format if log_format in self.FORMATS else "text"
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.backup_count = self.BACKUP_COUNT if backup_count is None else backup_count
+        self.queue = SimpleQueue()
+        self.stream = None
+        self.size = 0
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def write(self, success, message, fields):
+        self.queue.put((time.time(), success, message, fields))
+
+    def stop(self, timeout=5):
+        if self.is_alive():
+            self.queue.put(None)
+            self.join(timeout)
+
+    def run(self):
+        while True:
+            timeout = None
+            if self._dirty:
+                timeout = max(0.0, self.FLUSH_INTERVAL - (time.monotonic() - self._last_flush))
+            try:
+                record = self.queue.get(timeout=timeout)
+            except Empty:
+                self.flush()
+                continue
+            if record is None:
+                self.close()
+                return
+            try:
+                self.emit(record)
+                if not record[1] or time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+                    self.flush()
+            except OSError:
+                # Журнал не должен ронять приложение: запись теряется, файл переоткрывается
+                self.close()
+
+    def format(self, record):
+        created, success, message, fields = record
+        level = "INFO" if success else "ERROR"
+        if self.log_format == "json":
+            entry = {"time": datetime.fromtimestamp(created).isoformat(timespec='milliseconds'),
+                     "level": level, "message": message}
+            entry.update(fields)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        line = f"[{datetime.fromtimestamp(created)}] [{level}] {message}"
+        if fields:
+            line += " (" + ", ".join(f"{key}={value}" for key, value in fields.items()) + ")"
+        return line
+
+    def emit(self, record):
+        data = (self.format(record) + "\n").encode('utf-8')
+        if self.stream is None:
+            self.open()
+        if self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        self.stream.write(data)
+        self.size += len(data)
+        self._dirty = True
+
+    def open(self):
+        self.stream = open(self.path, 'ab', buffering=self.BUFFER_SIZE)
+        # Размер отслеживается счётчиком, чтобы не спрашивать его у ОС на каждую запись
+        self.size = self.stream.tell()
+
+    def flush(self):
+        if self.stream is not None and self._dirty:
+            self.stream.flush()
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self.stream is not None:
+            try:
+                self.stream.close()
+            except OSError:
+                pass
+            self.stream = None
+        self._dirty = False
+
+    def backup_path(self, index):
+        return f"{self.path}.{index}.gz"
+
+    def rotate(self):
+        self.close()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(self.backup_path(index)):
+                    os.replace(self.backup_path(index), self.backup_path(index + 1))
+            part_path = self.backup_path(1) + ".part"
+            with open(self.path, 'rb') as src, gzip.open(part_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(part_path, self.backup_path(1))
+        os.remove(self.path)
+        self.open()
+
 class ConfigManager:
     CONFIG_FILE = "yt-dlp.conf"
     LOG_FILE = "yt-dlp-gui.log"
+    SETTINGS_FILE = "yt-dlp-gui.json"
+    INSTANCE_LOCK_FILE = "yt-dlp-gui.lock"
+
+    _settings = None
+    _config = None
+    _log_writer = None
 
     DEFAULT_CONFIG = """# yt-dlp Configuration File
 --output "%(title)s.%(ext)s"
@@ -87,81 +489,75 @@ class ConfigManager:
     @classmethod
     def init_config(cls):
         if not os.path.exists(cls.CONFIG_FILE):
-            with open(cls.CONFIG_FILE, 'w', encoding='utf-8') as f:
-                f.write(cls.DEFAULT_CONFIG)
+            cls.config().save_text(cls.DEFAULT_CONFIG)
 
         if not os.path.exists(cls.LOG_FILE):
             with open(cls.LOG_FILE, 'w', encoding='utf-8') as f:
                 f.write(f"YT-DLP GUI Log - Created {datetime.now()}\n")
 
     @classmethod
-    def save_config(cls, config_text):
+    def config(cls):
+        # Конфиг разбирается один раз и перечитывается, только если файл изменили снаружи
+        if cls._config is None:
+            cls._config = ConfigModel(cls.CONFIG_FILE)
+        cls._config.reload_if_changed()
+        return cls._config
+
+    @classmethod
+    def load_params(cls):
+        config = cls.config()
+        return config.params if config.exists else None
+
+    @classmethod
+    def load_settings(cls):
+        if cls._settings is None:
+            try:
+                with open(cls.SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                    cls._settings = json.load(f)
+            except (OSError, ValueError):
+                cls._settings = {}
+        return cls._settings
+
+    @classmethod
+    def get_setting(cls, key, default=None):
+        return cls.load_settings().get(key, default)
+
+    @classmethod
+    def set_setting(cls, key, value):
+        settings = cls.load_settings()
+        if settings.get(key) == value:
+            return True
+        settings[key] = value
         try:
-            with open(cls.CONFIG_FILE, 'w', encoding='utf-8') as f:
-                f.write(config_text)
+            with open(cls.SETTINGS_FILE, 'w', encoding='utf-8') as f:
+                json.dump(settings, f, ensure_ascii=False, indent=2)
             return True
-        except Exception as e:
+        except OSError:
             return False
 
     @classmethod
-    def load_config(cls):
-        try:
-            with open(cls.CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return f.read()
-        except Exception:
-            return None
+    def log_writer(cls):
+        if cls._log_writer is None:
+            max_mb = cls.get_setting('log_max_mb')
+            cls._log_writer = LogWriter(
+                cls.LOG_FILE,
+                cls.get_setting('log_format', "text"),
+                int(max_mb * 1024 * 1024) if max_mb else None,
+                cls.get_setting('log_backups'))
+            cls._log_writer.start()
+            atexit.register(cls.close_log)
+        return cls._log_writer
 
     @classmethod
-    def parse_config(cls, config_text):
-        params = {
-            'output': '%(title)s.%(ext)s',
-            'paths': str(Path.home() / "Videos"),
-            'merge_format': 'mp4',
-            'proxy': None,
-            'cookies': None,
-            'cookies_from_browser': None,
-            'no_overwrites': False,
-            'sponsorblock_remove': False,
-            'add_metadata': False,
-            'embed_thumbnail': False,
-            'ffmpeg_location': None
-        }
-
-        lines = [line.strip() for line in config_text.split('\n') if line.strip() and not line.strip().startswith('#')]
-
-        for line in lines:
-            if line.startswith('--output'):
-                params['output'] = line.split('"')[1]
-            elif line.startswith('--paths'):
-                params['paths'] = line.split('"')[1]
-            elif line.startswith('--merge-output-format'):
-                params['merge_format'] = line.split()[-1]
-            elif line.startswith('--proxy'):
-                params['proxy'] = line.split()[-1]
-            elif line.startswith('--cookies'):
-                match = re.search(r'--cookies\s+"(.+?)"', line)
-                if match:
-                    params['cookies'] = match.group(1)
-            elif line.startswith('--cookies-from-browser'):
-                params['cookies_from_browser'] = ' '.join(line.split()[1:])
-            elif line.startswith('--ffmpeg-location'):
-                params['ffmpeg_location'] = line.split('"')[1]
-            elif line == '--no-overwrites':
-                params['no_overwrites'] = True
-            elif line == '--sponsorblock-remove all':
-                params['sponsorblock_remove'] = True
-            elif line == '--add-metadata':
-                params['add_metadata'] = True
-            elif line == '--embed-thumbnail':
-                params['embed_thumbnail'] = True
-
-        return params
+    def close_log(cls):
+        if cls._log_writer is not None:
+            cls._log_writer.stop()
 
     @classmethod
-    def log_download(cls, message, success=True):
-        with open(cls.LOG_FILE, 'a', encoding='utf-8') as f:
-            status = "INFO" if success else "ERROR"
-            f.write(f"[{datetime.now()}] [{status}] {message}\n")
+    def log_download(cls, message, success=True, **fields):
+        # Дополнительные поля (job, duration и т. п.) попадают в JSON-журнал как
+        # отдельные ключи, а в текстовый - в скобках после сообщения
+        cls.log_writer().write(success, message, fields)
 
     @classmethod
     def get_ytdlp_path(cls):
@@ -177,24 +573,13 @@ class ConfigManager:
     def get_ytdlp_version(cls):
         if not cls.check_ytdlp_exists():
             return None
-
-        try:
-            result = subprocess.run(
-                [cls.get_ytdlp_path(), "--version"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            return result.stdout.strip()
-        except Exception:
-            return None
+        tool = ToolRegistry.ytdlp()
+        return tool['version'] if tool else None
 
     @classmethod
     def get_ffmpeg_path(cls):
-        config_text = cls.load_config()
-        if config_text:
-            params = cls.parse_config(config_text)
+        params = cls.load_params()
+        if params:
             if params['ffmpeg_location'] and os.path.isdir(params['ffmpeg_location']):
                 ffmpeg_bin = 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg'
                 ffmpeg_path = os.path.join(params['ffmpeg_location'], ffmpeg_bin)
@@ -203,116 +588,1378 @@ class ConfigManager:
         return "ffmpeg"  # Default to system ffmpeg
 
     @classmethod
-    def check_ffmpeg_exists(cls):
-        ffmpeg_path = cls.get_ffmpeg_path()
+    def check_ffmpeg_exists(cls, path):
+        # Путь определяется в потоке GUI: рабочие потоки не обращаются к ConfigModel
+        tool = ToolRegistry.ffmpeg(path)
+        return bool(tool and tool['ok'])
+
+    @classmethod
+    def get_ffmpeg_version(cls, path):
+        tool = ToolRegistry.ffmpeg(path)
+        return tool['version'] if tool else None
+
+class ConfigLine(namedtuple('ConfigLine', ['text', 'key', 'tokens'])):
+    # text - строка как в файле; key - параметр GUI, который задаёт строка (None для
+    # комментариев и опций, которые GUI не редактирует); tokens - опция и её аргументы
+    __slots__ = ()
+
+def quote_config_value(value, force=False):
+    if not force and value and not re.search(r'[\s"\'\\#]', value):
+        return value
+    # Внутри двойных кавычек shlex снимает обратную косую черту только перед " и \,
+    # поэтому пути Windows записываются как есть
+    escaped = re.sub(r'(\\+)(?="|$)', r'\1\1', value).replace('"', '\\"')
+    return f'"{escaped}"'
+
+class ConfigModel(QObject):
+    changed = pyqtSignal()
+
+    # Опции, которые редактирует GUI: опция -> (параметр, обязательные аргументы или их число)
+    MANAGED_OPTIONS = {
+        '--output': ('output', 1),
+        '-o': ('output', 1),
+        '--paths': ('paths', 1),
+        '-P': ('paths', 1),
+        '--merge-output-format': ('merge_format', 1),
+        '--proxy': ('proxy', 1),
+        '--cookies': ('cookies', 1),
+        '--cookies-from-browser': ('cookies_from_browser', 1),
+        '--ffmpeg-location': ('ffmpeg_location', 1),
+        '--no-overwrites': ('no_overwrites', 0),
+        '-w': ('no_overwrites', 0),
+        '--sponsorblock-remove': ('sponsorblock_remove', ('all',)),
+        '--add-metadata': ('add_metadata', 0),
+        '--embed-metadata': ('add_metadata', 0),
+        '--embed-thumbnail': ('embed_thumbnail', 0),
+    }
+    # Параметры, которые записываются в кавычках, как в исходном формате файла
+    QUOTED_PARAMS = {'output', 'paths', 'cookies', 'ffmpeg_location'}
+
+    def __init__(self, path=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.exists = False
+        self.lines = []
+        self.params = self.default_params()
+        self.extra_args = ()
+        self._stamp = None
+        self._trailing_newline = True
+
+    @staticmethod
+    def default_params():
+        return {
+            'output': '%(title)s.%(ext)s',
+            'paths': str(Path.home() / "Videos"),
+            'merge_format': 'mp4',
+            'proxy': None,
+            'cookies': None,
+            'cookies_from_browser': None,
+            'no_overwrites': False,
+            'sponsorblock_remove': False,
+            'add_metadata': False,
+            'embed_thumbnail': False,
+            'ffmpeg_location': None
+        }
+
+    @classmethod
+    def parse_line(cls, text):
+        stripped = text.strip()
+        if not stripped or stripped.startswith('#'):
+            return ConfigLine(text, None, ())
         try:
-            result = subprocess.run(
-                [ffmpeg_path, "-version"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
-            return result.returncode == 0
-        except Exception:
+            tokens = shlex.split(stripped, comments=True)
+        except ValueError:
+            # Строку с незакрытой кавычкой сохраняем, но yt-dlp её не передаём
+            return ConfigLine(text, None, ())
+        if not tokens:
+            return ConfigLine(text, None, ())
+
+        option, args = tokens[0], tokens[1:]
+        if option.startswith('--') and '=' in option:
+            option, value = option.split('=', 1)
+            args = [value] + args
+        managed = cls.MANAGED_OPTIONS.get(option)
+        if managed:
+            key, expected = managed
+            if isinstance(expected, tuple) and tuple(args) == expected:
+                return ConfigLine(text, key, tuple(tokens))
+            if isinstance(expected, int) and len(args) == expected:
+                return ConfigLine(text, key, tuple(tokens))
+        return ConfigLine(text, None, tuple(tokens))
+
+    @classmethod
+    def line_value(cls, line):
+        option = line.tokens[0].split('=', 1)
+        args = option[1:] + list(line.tokens[1:])
+        expected = cls.MANAGED_OPTIONS[option[0]][1]
+        return args[0] if expected == 1 else True
+
+    @classmethod
+    def render_line(cls, option, value):
+        expected = cls.MANAGED_OPTIONS[option][1]
+        if expected == 0:
+            return option
+        if isinstance(expected, tuple):
+            return " ".join((option,) + expected)
+        key = cls.MANAGED_OPTIONS[option][0]
+        return f"{option} {quote_config_value(value, key in cls.QUOTED_PARAMS)}"
+
+    def set_text(self, text):
+        self._trailing_newline = text.endswith('\n') or not text
+        self.lines = [self.parse_line(line) for line in text.splitlines()]
+        self._apply()
+
+    def text(self):
+        text = '\n'.join(line.text for line in self.lines)
+        return text + '\n' if self._trailing_newline and text else text
+
+    def _apply(self):
+        params = self.default_params()
+        extra_args = []
+        for line in self.lines:
+            if line.key:
+                params[line.key] = self.line_value(line)
+            else:
+                extra_args.extend(line.tokens)
+        self.params = params
+        self.extra_args = tuple(extra_args)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload_if_changed(self):
+        if self.path is None:
+            return False
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return False
+        old_text = self.text() if self.exists else None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            self.exists = True
+        except OSError:
+            text = ""
+            self.exists = False
+        self._stamp = stamp
+        self.set_text(text)
+        if old_text is not None and old_text != self.text():
+            self.changed.emit()
+        return True
+
+    def update(self, options):
+        # Меняются только строки опций GUI: порядок, комментарии и опции,
+        # добавленные вручную, остаются на своих местах
+        entries = options.config_entries()
+        desired = {key: value for key, _, value in entries}
+        rendered = {key: self.render_line(option, value) for key, option, value in entries}
+
+        lines = []
+        written = set()
+        for line in self.lines:
+            if not line.key:
+                lines.append(line)
+                continue
+            if line.key not in desired or line.key in written:
+                continue
+            written.add(line.key)
+            if self.line_value(line) == desired[line.key]:
+                lines.append(line)
+            else:
+                lines.append(self.parse_line(rendered[line.key]))
+        for key, _, _ in entries:
+            if key not in written:
+                lines.append(self.parse_line(rendered[key]))
+
+        old_text = self.text()
+        self.lines = lines
+        self._apply()
+        return self._write(old_text)
+
+    def save_text(self, text):
+        # Импорт и сброс настроек заменяют файл целиком
+        old_text = self.text()
+        self.set_text(text)
+        return self._write(old_text)
+
+    def _write(self, old_text):
+        new_text = self.text()
+        if new_text == old_text and self.exists:
             return False
 
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(new_text)
+        os.replace(tmp_path, self.path)
+        self.exists = True
+        self._stamp = self._file_stamp()
+        self.changed.emit()
+        return True
+
+class ToolRegistry:
+    STATE_FILE = "yt-dlp-gui-tools.json"
+    PROBE_TIMEOUT = 30
+
+    _tools = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _load(cls):
+        if cls._tools is None:
+            try:
+                with open(cls.STATE_FILE, 'r', encoding='utf-8') as f:
+                    cls._tools = json.load(f)
+            except (OSError, ValueError):
+                cls._tools = {}
+        return cls._tools
+
+    @classmethod
+    def _save(cls):
+        tmp_path = cls.STATE_FILE + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cls._tools, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, cls.STATE_FILE)
+
     @classmethod
-    def get_ffmpeg_version(cls):
-        ffmpeg_path = cls.get_ffmpeg_path()
+    def resolve(cls, path):
+        if os.path.dirname(path):
+            return os.path.abspath(path) if os.path.isfile(path) else None
+        return shutil.which(path)
+
+    @classmethod
+    def probe(cls, path, args, parser):
+        # Запуск бинарника дорогой (у yt-dlp около секунды), поэтому результат хранится,
+        # пока не изменятся путь, время модификации или размер файла
+        resolved = cls.resolve(path)
+        if not resolved:
+            return None
+        try:
+            stat = os.stat(resolved)
+        except OSError:
+            return None
+
+        with cls._lock:
+            tool = cls._load().get(resolved)
+        if tool and tool['mtime'] == stat.st_mtime_ns and tool['size'] == stat.st_size:
+            return tool
+
         try:
             result = subprocess.run(
-                [ffmpeg_path, "-version"],
+                [resolved] + args,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
+                timeout=cls.PROBE_TIMEOUT,
                 creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
             )
-            if result.returncode != 0:
-                return None
-            version_line = result.stdout.split('\n')[0]
-            match = re.search(r'ffmpeg version (\S+)', version_line)
-            if match:
-                return match.group(1)
-            return None
-        except Exception:
+        except (OSError, subprocess.SubprocessError):
             return None
 
+        ok = result.returncode == 0
+        version, capabilities = parser(result.stdout) if ok else (None, [])
+        tool = {
+            'path': resolved,
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'ok': ok,
+            'version': version,
+            'capabilities': capabilities,
+        }
+        with cls._lock:
+            cls._load()[resolved] = tool
+            try:
+                cls._save()
+            except OSError:
+                pass
+        return tool
+
+    @staticmethod
+    def parse_ytdlp(output):
+        return output.strip() or None, []
+
+    @staticmethod
+    def parse_ffmpeg(output):
+        lines = output.split('\n')
+        match = re.search(r'ffmpeg version (\S+)', lines[0])
+        capabilities = []
+        for line in lines:
+            if line.startswith('configuration:'):
+                capabilities = [flag[len('--enable-'):] for flag in line.split() if flag.startswith('--enable-')]
+                break
+        return match.group(1) if match else None, capabilities
+
+    @classmethod
+    def ytdlp(cls):
+        return cls.probe(ConfigManager.get_ytdlp_path(), ["--version"], cls.parse_ytdlp)
+
+    @classmethod
+    def ffmpeg(cls, path):
+        return cls.probe(path, ["-version"], cls.parse_ffmpeg)
+
+class DownloadOptions(namedtuple('DownloadOptions', [
+    'output', 'paths', 'merge_format', 'proxy', 'cookies', 'cookies_from_browser',
+    'no_overwrites', 'sponsorblock_remove', 'add_metadata', 'embed_thumbnail', 'ffmpeg_location',
+    'download_archive', 'extra_args'
+])):
+    # Неизменяемый снимок настроек: каждая задача получает свой набор аргументов,
+    # поэтому общий yt-dlp.conf не переписывается перед каждой загрузкой
+    __slots__ = ()
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(**{field: params.get(field) for field in cls._fields})
+
+    def to_args(self):
+        args = ["--output", self.output]
+        if self.paths:
+            args += ["--paths", self.paths]
+        args += ["--merge-output-format", self.merge_format]
+
+        if self.proxy:
+            args += ["--proxy", self.proxy]
+
+        if self.cookies:
+            args += ["--cookies", self.cookies]
+        elif self.cookies_from_browser:
+            args += ["--cookies-from-browser", self.cookies_from_browser]
+
+        if self.no_overwrites:
+            args.append("--no-overwrites")
+        if self.sponsorblock_remove:
+            args += ["--sponsorblock-remove", "all"]
+        if self.add_metadata:
+            args.append("--add-metadata")
+        if self.embed_thumbnail:
+            args.append("--embed-thumbnail")
+
+        if self.ffmpeg_location:
+            args += ["--ffmpeg-location", self.ffmpeg_location]
+
+        if self.download_archive:
+            args += ["--download-archive", self.download_archive]
+
+        # Опции из yt-dlp.conf, которых нет в интерфейсе (-N, --limit-rate и т.п.)
+        if self.extra_args:
+            args += list(self.extra_args)
+        return args
+
+    def extra_rate_limit(self):
+        # Ограничение --limit-rate из yt-dlp.conf действует на каждый процесс отдельно
+        args = list(self.extra_args or ())
+        for index, arg in enumerate(args):
+            value = None
+            if arg in ("-r", "--limit-rate") and index + 1 < len(args):
+                value = args[index + 1]
+            elif arg.startswith("--limit-rate="):
+                value = arg.split("=", 1)[1]
+            if value is not None:
+                try:
+                    return parse_rate(value)
+                except ValueError:
+                    return None
+        return None
+
+    def to_command(self, url, extra_args=()):
+        # Без URL видео берётся из --load-info-json в extra_args
+        return ([ConfigManager.get_ytdlp_path(), "--ignore-config"] + self.to_args() + list(extra_args)
+                + ([url] if url else []))
+
+    def config_entries(self):
+        # Строки yt-dlp.conf, за которые отвечает GUI: (параметр, опция, значение)
+        entries = [
+            ('output', '--output', self.output),
+            ('paths', '--paths', self.paths),
+            ('merge_format', '--merge-output-format', self.merge_format),
+        ]
+        if self.proxy:
+            entries.append(('proxy', '--proxy', self.proxy))
+
+        if self.cookies:
+            entries.append(('cookies', '--cookies', self.cookies))
+        elif self.cookies_from_browser:
+            entries.append(('cookies_from_browser', '--cookies-from-browser', self.cookies_from_browser))
+
+        if self.no_overwrites:
+            entries.append(('no_overwrites', '--no-overwrites', True))
+        if self.sponsorblock_remove:
+            entries.append(('sponsorblock_remove', '--sponsorblock-remove', True))
+        if self.add_metadata:
+            entries.append(('add_metadata', '--add-metadata', True))
+        if self.embed_thumbnail:
+            entries.append(('embed_thumbnail', '--embed-thumbnail', True))
+
+        if self.ffmpeg_location:
+            entries.append(('ffmpeg_location', '--ffmpeg-location', self.ffmpeg_location))
+        return entries
+
+def format_bytes(value):
+    if value is None:
+        return ""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(value) < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
+
+def format_eta(seconds):
+    if seconds is None:
+        return ""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+RATE_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*([kmg]?)(i?b|bit|bps)?(?:/s)?$', re.IGNORECASE)
+
+def parse_rate(value):
+    # Скорость в байтах/с. Как в --limit-rate: "500K", "4.2M", "1G" или "2MiB" - байты
+    # с множителем 1024; "20Mbit" и "20Mbps" - мегабиты. Пусто, 0 или None - без ограничения
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    match = RATE_RE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Неверное значение скорости: {value}")
+    number, prefix, unit = float(match.group(1)), match.group(2).lower(), (match.group(3) or "").lower()
+    if unit in ("bit", "bps"):
+        rate = number * {'': 1, 'k': 1e3, 'm': 1e6, 'g': 1e9}[prefix] / 8
+    else:
+        rate = number * {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}[prefix]
+    return rate if rate > 0 else None
+
+def format_rate(rate):
+    return f"{format_bytes(rate)}/s ({rate * 8 / 1e6:.1f} Мбит/с)" if rate else "без ограничения"
+
+def format_command(cmd):
+    if os.name == 'nt':
+        return subprocess.list2cmdline(cmd)
+    return shlex.join(cmd)
+
+def process_group_args():
+    # yt-dlp запускается в своей группе процессов, чтобы при остановке
+    # завершались и запущенные им ffmpeg/aria2c
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+def terminate_process_tree(process):
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == 'nt':
+            # Без ожидания: stop() вызывается из потока GUI
+            subprocess.Popen(["taskkill", "/T", "/F", "/PID", str(process.pid)],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             creationflags=subprocess.CREATE_NO_WINDOW)
+        else:
+            os.killpg(process.pid, signal.SIGTERM)
+    except OSError:
+        process.terminate()
+
 class UpdateChecker(QThread):
-    finished = pyqtSignal(bool, str, str)
+    finished = pyqtSignal(bool, str, str, str)
 
     def run(self):
-        try:
-            headers = {"User-Agent": USER_AGENT}
-            response = requests.get(YTDLP_RELEASES_URL, headers=headers)
-            response.raise_for_status()
+        # Запуск "yt-dlp --version" занимает заметное время, поэтому он тоже выполняется здесь
+        current_version = ConfigManager.get_ytdlp_version()
+        if not current_version:
+            self.finished.emit(False, "Не удалось определить текущую версию yt-dlp", "", "")
+            return
 
-            release_info = response.json()
+        try:
+            release_info = HttpClient.get_json(YTDLP_RELEASES_URL)
             latest_version = release_info['tag_name']
-            self.finished.emit(True, "Проверка завершена", latest_version)
+            self.finished.emit(True, "Проверка завершена", current_version, latest_version)
         except Exception as e:
-            self.finished.emit(False, f"Ошибка проверки обновлений: {str(e)}", "")
-
-class TemplateEditorDialog(QDialog):
-    def __init__(self, current_template, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Конструктор шаблонов")
-        self.setMinimumSize(500, 400)
-        self.current_template = current_template
-        self.setup_ui()
+            self.finished.emit(False, f"Ошибка проверки обновлений: {str(e)}", current_version, "")
 
-    def setup_ui(self):
-        layout = QVBoxLayout()
+class ToolProbeThread(QThread):
+    finished = pyqtSignal(object)
 
-        self.template_edit = QLineEdit(self.current_template)
-        self.template_edit.setPlaceholderText("Введите шаблон или используйте конструктор ниже")
-        layout.addWidget(QLabel("Шаблон имени файла:"))
-        layout.addWidget(self.template_edit)
+    def __init__(self, probe):
+        super().__init__()
+        self.probe = probe
 
-        self.setup_variables_table()
-        layout.addWidget(QLabel("Доступные переменные:"))
-        layout.addWidget(self.variables_table)
+    def run(self):
+        try:
+            result = self.probe()
+        except Exception:
+            result = None
+        self.finished.emit(result)
 
-        self.preview_label = QLabel()
-        self.preview_label.setWordWrap(True)
-        self.update_preview()
-        layout.addWidget(QLabel("Пример:"))
-        layout.addWidget(self.preview_label)
+class HttpRangeFile(io.RawIOBase):
+    # Файл поверх HTTP: чтение идёт одним потоковым запросом с текущей позиции,
+    # новый Range-запрос открывается только после seek в другое место
+    def __init__(self, session, url, size=None, timeout=30, on_read=None):
+        super().__init__()
+        self.session = session
+        self.url = url
+        self.size = size
+        self.timeout = timeout
+        self.on_read = on_read
+        self._position = 0
+        self._response = None
+        self._response_position = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self.size is not None
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            if self.size is None:
+                raise io.UnsupportedOperation("Размер файла неизвестен")
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer):
+        if self.size is not None and self._position >= self.size:
+            return 0
+        if self._response is None or self._response_position != self._position:
+            self._open()
+
+        data = self._response.raw.read(len(buffer), decode_content=True)
+        if not data and self.size is not None:
+            raise IOError("Соединение закрыто до конца файла")
+        buffer[:len(data)] = data
+        self._position += len(data)
+        self._response_position = self._position
+        if self.on_read:
+            self.on_read(len(data))
+        return len(data)
+
+    def _open(self):
+        self._close_response()
+        headers = {"Range": f"bytes={self._position}-"} if self._position else {}
+        response = self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        if self._position and response.status_code != 206:
+            response.close()
+            raise IOError("Сервер не поддерживает докачку по диапазонам")
+        if self.size is None and not self._position and 'Content-Length' in response.headers:
+            self.size = int(response.headers['Content-Length'])
+        self._response = response
+        self._response_position = self._position
+
+    def _close_response(self):
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+
+    def close(self):
+        self._close_response()
+        super().close()
+
+class FFmpegInstallerThread(DownloaderThread):
+    stage_changed = pyqtSignal(str)
+
+    MIN_BINARY_SIZE = 10 * 1024 * 1024
+    WORK_DIR = os.path.join(tempfile.gettempdir(), "yt-dlp-gui-ffmpeg")
+    READ_BUFFER_SIZE = 1024 * 1024
 
-        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
-        button_box.accepted.connect(self.accept)
-        button_box.rejected.connect(self.reject)
-        layout.addWidget(button_box)
+    def __init__(self):
+        if os.name == 'nt':
+            self.asset_name = "ffmpeg-master-latest-win64-gpl.zip"
+        elif sys.platform == 'darwin':
+            self.asset_name = "ffmpeg-master-latest-macos64-gpl.zip"
+        else:
+            self.asset_name = "ffmpeg-master-latest-linux64-gpl.tar.xz"
+        # Архив целиком скачивается только если сервер не отдаёт zip по диапазонам
+        super().__init__(None, os.path.join(self.WORK_DIR, self.asset_name))
+
+        script_dir = os.path.dirname(os.path.abspath(__file__)) if not hasattr(sys, 'frozen') else os.path.dirname(sys.executable)
+        self.script_dir = script_dir
+        self.ffmpeg_dir = os.path.join(script_dir, "ffmpeg")
+        self.binaries = ['ffmpeg.exe', 'ffprobe.exe'] if os.name == 'nt' else ['ffmpeg', 'ffprobe']
+        self.version = None
+        self._expected = 0
+        self._received = 0
 
-        self.setLayout(layout)
-        self.template_edit.textChanged.connect(self.update_preview)
+    def run(self):
+        extracted = {}
+        try:
+            if not os.access(self.script_dir, os.W_OK):
+                raise Exception("Нет прав на запись в директорию скрипта. Укажите другой путь для FFmpeg.")
+            os.makedirs(self.ffmpeg_dir, exist_ok=True)
+
+            self.stage_changed.emit("Поиск сборки FFmpeg...")
+            self.url = self.find_download_url()
+            self.check_running()
+
+            # Бинарники вынимаются из архива прямо во время загрузки,
+            # остальное содержимое архива на диск не попадает
+            self.stage_changed.emit(f"Загрузка и распаковка {self.asset_name}...")
+            session = HttpClient.session()
+            total_size, final_url, _ = self.probe(session)
+            if self.asset_name.endswith('.zip'):
+                self.extract_zip(session, final_url, total_size, extracted)
+            else:
+                self.extract_tar(session, final_url, total_size, extracted)
 
-    def setup_variables_table(self):
-        self.variables_table = QTableWidget()
-        self.variables_table.setColumnCount(3)
-        self.variables_table.setHorizontalHeaderLabels(["Переменная", "Описание", "Действие"])
-        self.variables_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
-        self.variables_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
-        self.variables_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
-        self.variables_table.setRowCount(8)
+            missing = [name for name in self.binaries if name not in extracted]
+            if missing:
+                raise Exception("Не удалось найти ffmpeg и/или ffprobe в архиве")
 
-        variables = [
-            ("%(title)s", "Название видео", "Вставить"),
-            ("%(uploader)s", "Автор канала", "Вставить"),
-            ("%(upload_date)s", "Дата загрузки (YYYYMMDD)", "Вставить"),
-            ("%(id)s", "ID видео", "Вставить"),
-            ("%(ext)s", "Расширение файла", "Вставить"),
-            ("%(playlist_title)s", "Название плейлиста", "Вставить"),
-            ("%(playlist_index)s", "Номер в плейлиста", "Вставить"),
-            ("%(height)s", "Высота видео в пикселях", "Вставить")
-        ]
+            self.stage_changed.emit("Проверка FFmpeg...")
+            self.install(extracted)
+            self.version = self.probe_version()
+            self.finished.emit(True, "FFmpeg установлен")
+        except Exception as e:
+            ConfigManager.log_download(f"Ошибка установки FFmpeg: {str(e)}", False)
+            self.finished.emit(False, str(e))
+        finally:
+            for path in extracted.values():
+                if os.path.exists(path):
+                    os.remove(path)
+            if os.path.exists(self.destination):
+                os.remove(self.destination)
+
+    def find_download_url(self):
+        release_info = HttpClient.get_json(FFMPEG_RELEASES_URL)
+        for asset in release_info['assets']:
+            if asset['name'] == self.asset_name:
+                return asset['browser_download_url']
+        raise Exception(f"Не удалось найти сборку FFmpeg ({self.asset_name})")
+
+    def on_read(self, count):
+        self.check_running()
+        self._received += count
+        if self._expected:
+            percent = min(100, int(self._received * 100 / self._expected))
+            if percent != self._last_percent:
+                self._last_percent = percent
+                self.progress.emit(percent)
+
+    def extract_tar(self, session, url, total_size, extracted):
+        # tar.xz читается строго последовательно, поэтому достаточно одного потокового запроса
+        with HttpRangeFile(session, url, total_size, self.TIMEOUT, self.on_read) as raw, \
+                io.BufferedReader(raw, self.READ_BUFFER_SIZE) as reader:
+            # Без поддержки Range размер становится известен только из ответа на первый запрос
+            reader.peek(1)
+            self._expected = raw.size or 0
+            import tarfile
+            with tarfile.open(fileobj=reader, mode='r|xz') as tar_ref:
+                for member in tar_ref:
+                    name = os.path.basename(member.name)
+                    if member.isfile() and name in self.binaries and name not in extracted:
+                        extracted[name] = self.extract_member(tar_ref.extractfile(member), name)
+                        if len(extracted) == len(self.binaries):
+                            break
+
+    def extract_zip(self, session, url, total_size, extracted):
+        import zipfile
+        if total_size:
+            # Оглавление zip лежит в конце файла: читаем его и нужные записи по диапазонам
+            raw = HttpRangeFile(session, url, total_size, self.TIMEOUT, self.on_read)
+            archive = io.BufferedReader(raw, self.READ_BUFFER_SIZE)
+        else:
+            self.stage_changed.emit(f"Загрузка {self.asset_name}...")
+            os.makedirs(self.WORK_DIR, exist_ok=True)
+            self.download()
+            archive = open(self.destination, 'rb')
+
+        with archive, zipfile.ZipFile(archive) as zip_ref:
+            members = {}
+            for info in zip_ref.infolist():
+                name = os.path.basename(info.filename)
+                if not info.is_dir() and name in self.binaries and name not in members:
+                    members[name] = info
+
+            self._received = 0
+            self._last_percent = -1
+            self._expected = sum(info.compress_size for info in members.values())
+            for name, info in members.items():
+                with zip_ref.open(info) as source:
+                    extracted[name] = self.extract_member(source, name)
+
+    def extract_member(self, source, name):
+        path = os.path.join(self.ffmpeg_dir, name + ".part")
+        size = 0
+        try:
+            with open(path, 'wb') as f:
+                while True:
+                    self.check_running()
+                    chunk = source.read(self.READ_BUFFER_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            os.remove(path)
+            raise
+
+        size_mb = size / (1024 * 1024)
+        ConfigManager.log_download(f"Распакован {name}, размер: {size_mb:.2f} MB")
+        if size < self.MIN_BINARY_SIZE:
+            os.remove(path)
+            raise Exception(f"Файл {name} слишком маленький ({size_mb:.2f} МБ). Возможно, архив поврежден.")
+        return path
+
+    def install(self, extracted):
+        self.check_running()
+        for name in self.binaries:
+            dest_path = os.path.join(self.ffmpeg_dir, name)
+            os.replace(extracted.pop(name), dest_path)
+            if os.name != 'nt':
+                os.chmod(dest_path, 0o755)
+            ConfigManager.log_download(f"Установлен {name} в {dest_path}")
+
+    def probe_version(self):
+        # Проверяется именно установленный файл, без чтения yt-dlp.conf из рабочего потока
+        tool = ToolRegistry.ffmpeg(os.path.join(self.ffmpeg_dir, self.binaries[0]))
+        if not tool or not tool['ok']:
+            raise Exception("Установленный FFmpeg недействителен. Укажите другой путь.")
+        return tool['version']
+
+def make_video_key(extractor, video_id):
+    # Тот же формат, что yt-dlp пишет в --download-archive: "<extractor> <id>"
+    return f"{extractor.lower()} {video_id}"
+
+YOUTUBE_ID_RE = re.compile(
+    r'^https?://(?:(?:www|m|music)\.)?(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)|youtu\.be/)'
+    r'([0-9A-Za-z_-]{11})(?![0-9A-Za-z_-])'
+)
 
-        for row, (var, desc, action) in enumerate(variables):
-            self.variables_table.setItem(row, 0, QTableWidgetItem(var))
-            self.variables_table.setItem(row, 1, QTableWidgetItem(desc))
+def extract_video_key(url):
+    match = YOUTUBE_ID_RE.match(url)
+    if match:
+        return make_video_key("youtube", match.group(1))
+    return None
+
+URL_IN_TEXT_RE = re.compile(r'https?://[^\s<>"\'`]+')
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com', 'youtu.be'}
+# Сайты, у которых параметры ниже и якорь точно не нужны для загрузки. На остальных
+# сайтах ref, pp и т. п. могут быть частью адреса, поэтому их ссылки не меняются
+TRACKING_HOSTS = {
+    'youtube.com', 'youtu.be', 'music.youtube.com', 'vimeo.com', 'twitter.com', 'x.com', 'instagram.com',
+    'facebook.com', 'tiktok.com', 'reddit.com', 'twitch.tv', 'soundcloud.com', 'dailymotion.com',
+}
+# Параметры, которые добавляют кнопки "Поделиться" и счётчики переходов; на загрузку не влияют
+TRACKING_PARAMS = {'si', 'feature', 'pp', 'fbclid', 'gclid', 'yclid', 'igshid', 'ref', 'ref_src', 'mc_cid', 'mc_eid'}
+
+def extract_urls(text):
+    return [url.rstrip('.,;:!?)]}>') for url in URL_IN_TEXT_RE.findall(text)]
+
+def normalize_url(url):
+    # Ссылки на одно и то же видео приводятся к одному виду, чтобы дубликаты находились по строке
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+    url = url.strip()
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    query = parse_qsl(parts.query, keep_blank_values=True)
+
+    if host in YOUTUBE_HOSTS:
+        video_key = extract_video_key(url)
+        list_id = next((value for key, value in query if key == 'list'), None)
+        if video_key:
+            video_id = video_key.split(' ', 1)[1]
+            if list_id:
+                return f"https://www.youtube.com/watch?v={video_id}&list={list_id}"
+            return f"https://www.youtube.com/watch?v={video_id}"
+        if list_id and parts.path.rstrip('/') in ('/playlist', '/watch'):
+            return f"https://www.youtube.com/playlist?list={list_id}"
+
+    if url_host(url) not in TRACKING_HOSTS:
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, parts.fragment))
+    kept = [(key, value) for key, value in query
+            if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')]
+    # Запрос пересобирается только если что-то убрали: иначе сохраняем исходное кодирование
+    query_text = urlencode(kept, doseq=True) if len(kept) != len(query) else parts.query
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query_text, ''))
+
+def url_host(url):
+    from urllib.parse import urlsplit
+
+    host = (urlsplit(url).hostname or '').lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+class DownloadArchive:
+    ARCHIVE_FILE = "yt-dlp-archive.txt"
+
+    def __init__(self, path=None):
+        self.path = path or self.ARCHIVE_FILE
+        self.keys = set()
+        self._offset = 0
+        self.refresh()
+
+    def __contains__(self, video_key):
+        return video_key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def refresh(self):
+        # yt-dlp сам дописывает архив, поэтому читаем только новые строки с прошлого смещения
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            self.keys.clear()
+            self._offset = 0
+            return 0
+        if size < self._offset:
+            self.keys.clear()
+            self._offset = 0
+        if size == self._offset:
+            return 0
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        complete = data.rfind(b'\n') + 1
+        added = 0
+        for line in data[:complete].decode('utf-8', errors='replace').splitlines():
+            parts = line.strip().split(None, 1)
+            if len(parts) == 2:
+                key = make_video_key(parts[0], parts[1])
+                if key not in self.keys:
+                    self.keys.add(key)
+                    added += 1
+        self._offset += complete
+        return added
+
+class HistoryRecord(namedtuple('HistoryRecord', [
+    'id', 'url', 'video_key', 'title', 'filepath', 'bytes', 'duration', 'speed',
+    'status', 'message', 'started_at', 'finished_at'
+])):
+    __slots__ = ()
+
+class HistoryStore:
+    HISTORY_FILE = "yt-dlp-gui-history.sqlite3"
+    COLUMNS = ", ".join(HistoryRecord._fields)
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            url TEXT NOT NULL,
+            video_key TEXT,
+            title TEXT,
+            filepath TEXT,
+            bytes INTEGER,
+            duration REAL,
+            speed REAL,
+            status TEXT NOT NULL,
+            message TEXT,
+            started_at REAL,
+            finished_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS history_video_key ON history (video_key);
+        CREATE INDEX IF NOT EXISTS history_url ON history (url);
+        CREATE INDEX IF NOT EXISTS history_finished_at ON history (finished_at);
+        CREATE INDEX IF NOT EXISTS history_status ON history (status, finished_at);
+    """
+
+    def __init__(self, path=None):
+        self.path = path or self.HISTORY_FILE
+        self._db = None
+
+    def db(self):
+        # База открывается при первом обращении, чтобы не замедлять запуск окна
+        if self._db is None:
+            import sqlite3
+            db = sqlite3.connect(self.path)
+            # WAL без синхронной записи на каждый commit: запись после загрузки не ждёт диск
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(self.SCHEMA)
+            self._db = db
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __contains__(self, video_key):
+        row = self.db().execute(
+            "SELECT 1 FROM history WHERE video_key = ? AND status = ? LIMIT 1",
+            (video_key, DownloadJob.DONE)).fetchone()
+        return row is not None
+
+    def key_for_url(self, url):
+        row = self.db().execute(
+            "SELECT video_key FROM history WHERE url = ? AND video_key IS NOT NULL ORDER BY id DESC LIMIT 1",
+            (url,)).fetchone()
+        return row[0] if row else None
+
+    def record_job(self, job):
+        size = None
+        if job.filepath:
+            try:
+                size = os.path.getsize(job.filepath)
+            except OSError:
+                pass
+        if size is None and job.progress:
+            size = job.progress.total_bytes or job.progress.downloaded_bytes
+        duration = job.finished_at - job.started_at if job.started_at else None
+        speed = size / duration if size and duration else None
+        values = (job.url, job.video_key, job.title, job.filepath, size and int(size), duration, speed,
+                  job.state, job.message, job.started_at, job.finished_at)
+        db = self.db()
+        with db:
+            cursor = db.execute(
+                f"INSERT INTO history ({self.COLUMNS}) VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+        return HistoryRecord(cursor.lastrowid, *values)
+
+    def _filter(self, search=None, status=None):
+        clauses, params = [], []
+        if search:
+            pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append("(title LIKE ? ESCAPE '\\' OR url LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        return clauses, params
+
+    def page(self, search=None, status=None, before_id=None, limit=200):
+        # Постраничная выборка по ключу: следующая страница начинается с id меньше
+        # последнего показанного, поэтому её стоимость не растёт с номером страницы
+        clauses, params = self._filter(search, status)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        rows = self.db().execute(
+            f"SELECT {self.COLUMNS} FROM history{where} ORDER BY id DESC LIMIT ?", params + [limit])
+        return [HistoryRecord(*row) for row in rows]
+
+    def count(self, search=None, status=None):
+        clauses, params = self._filter(search, status)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return self.db().execute(f"SELECT COUNT(*) FROM history{where}", params).fetchone()[0]
+
+    def stats(self, since=None):
+        where, params = ("WHERE finished_at >= ?", (since,)) if since else ("", ())
+        states = {}
+        total_bytes = total_duration = 0
+        for status, count, size, duration in self.db().execute(
+                f"SELECT status, COUNT(*), SUM(bytes), SUM(duration) FROM history {where} GROUP BY status", params):
+            states[status] = count
+            if status == DownloadJob.DONE:
+                total_bytes, total_duration = size or 0, duration or 0
+        return {
+            'total': sum(states.values()),
+            'states': states,
+            'bytes': total_bytes,
+            'avg_speed': total_bytes / total_duration if total_duration else None,
+        }
 
-            btn = QPushButton(action)
-            btn.clicked.connect(lambda _, v=var: self.insert_variable(v))
+class JobJournal:
+    JOURNAL_FILE = "yt-dlp-gui-jobs.jsonl"
+
+    def __init__(self, path=None):
+        self.path = path or self.JOURNAL_FILE
+        self.next_key = 1
+        self._last = {}
+        self._writes = SimpleQueue()
+        self._writer = None
+        self._queue = None
+        self._lock = None
+
+    @staticmethod
+    def is_unfinished(record):
+        return record.get('state') not in (DownloadJob.DONE, DownloadJob.FAILED, DownloadJob.CANCELLED)
+
+    @staticmethod
+    def snapshot(job):
+        return job.state, job.priority, job.expanded, job.skipped, job.video_key
+
+    def lock(self):
+        # Журнал ведёт только один процесс: сжатие заменяет файл, и записи другого
+        # процесса, который дописывает в прежний файл, были бы потеряны
+        if self._lock is None:
+            lock = QLockFile(self.path + ".lock")
+            lock.setStaleLockTime(0)
+            if not lock.tryLock(0):
+                return False
+            self._lock = lock
+        return True
+
+    def open(self):
+        if not self.lock():
+            ConfigManager.log_download(f"Журнал задач {self.path} используется другим процессом", False)
+            return None
+        # Журнал сжимается при запуске: остаются только задачи, которые ещё нужно докачать
+        records = self.load()
+        self.compact(records)
+        self._writer = threading.Thread(target=self._write_loop, name="job-journal", daemon=True)
+        self._writer.start()
+        return records
+
+    def load(self):
+        jobs = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # Последняя строка может быть оборвана при аварийном завершении
+                    try:
+                        record = json.loads(line)
+                        key = record.pop('key')
+                        op = record.pop('op')
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        continue
+                    if op == 'add':
+                        jobs[key] = dict(record, key=key)
+                    elif key in jobs:
+                        jobs[key].update(record)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            ConfigManager.log_download(f"Не удалось прочитать журнал задач: {str(e)}", False)
+        self.next_key = max(jobs, default=0) + 1
+        # Видео плейлиста хранятся, пока не завершён весь плейлист: по ним
+        # восстанавливаются счётчики и пропускаются уже скачанные при повторном разборе
+        return [record for record in jobs.values()
+                if self.is_unfinished(jobs.get(record.get('parent')) or record)]
+
+    def compact(self, records):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(dict(record, op='add'), ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            ConfigManager.log_download(f"Не удалось сжать журнал задач: {str(e)}", False)
+
+    def attach(self, queue):
+        self._queue = queue
+        queue.job_added.connect(self.on_job_added)
+        queue.job_changed.connect(self.on_job_changed)
+
+    def detach(self):
+        # После отключения остановка задач не попадает в журнал, и они продолжатся при следующем запуске
+        if self._queue is not None:
+            self._queue.job_added.disconnect(self.on_job_added)
+            self._queue.job_changed.disconnect(self.on_job_changed)
+            self._queue = None
+
+    def on_job_added(self, job):
+        if job.journal_key is None:
+            job.journal_key = self.next_key
+            self.next_key += 1
+            options = job.options._asdict()
+            options['extra_args'] = list(options['extra_args'] or ())
+            self.write({
+                'op': 'add', 'key': job.journal_key, 'url': job.url, 'options': options,
+                'video_key': job.video_key, 'priority': job.priority,
+                'parent': job.parent.journal_key if job.parent else None,
+                'playlist': job.is_playlist(), 'state': job.state, 'created_at': job.created_at,
+            })
+        self._last[job.journal_key] = self.snapshot(job)
+
+    def on_job_changed(self, job):
+        # job_changed приходит и на каждую строку прогресса, а в журнал пишутся только изменения состояния
+        key = job.journal_key
+        snapshot = self.snapshot(job)
+        if key is None or self._last.get(key) == snapshot:
+            return
+        record = {'op': 'update', 'key': key, 'state': job.state, 'priority': job.priority, 'message': job.message}
+        if job.video_key:
+            record['video_key'] = job.video_key
+        if job.is_playlist():
+            record.update(expanded=job.expanded, skipped=job.skipped)
+        if job.is_finished():
+            self._last.pop(key, None)
+        else:
+            self._last[key] = snapshot
+        self.write(record)
+
+    def write(self, record):
+        if self._writer is not None:
+            self._writes.put(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self, timeout=5):
+        if self._writer is not None:
+            self._writes.put(None)
+            self._writer.join(timeout)
+            self._writer = None
+        if self._lock is not None:
+            self._lock.unlock()
+            self._lock = None
+
+    def _write_loop(self):
+        try:
+            f = open(self.path, 'a', encoding='utf-8')
+        except OSError as e:
+            ConfigManager.log_download(f"Не удалось открыть журнал задач: {str(e)}", False)
+            f = None
+        while True:
+            # Всё, что накопилось за время предыдущего fsync, уходит на диск одной записью
+            lines = [self._writes.get()]
+            try:
+                while True:
+                    lines.append(self._writes.get_nowait())
+            except Empty:
+                pass
+            data = "".join(line for line in lines if line is not None)
+            if f is not None and data:
+                try:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                except OSError as e:
+                    ConfigManager.log_download(f"Не удалось записать журнал задач: {str(e)}", False)
+            if None in lines:
+                break
+        if f is not None:
+            f.close()
+
+class MetadataCache:
+    CACHE_DIR = "yt-dlp-gui-cache"
+    INDEX_FILE = "index.json"
+    TTL = 6 * 3600
+    MAX_SIZE = 100 * 1024 * 1024
+
+    def __init__(self, cache_dir=None, ttl=None, max_size=None):
+        self.cache_dir = cache_dir or self.CACHE_DIR
+        self.ttl = ttl if ttl is not None else self.TTL
+        self.max_size = max_size if max_size is not None else self.MAX_SIZE
+        self._lock = threading.Lock()
+        self._index = None
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, self.INDEX_FILE)
+
+    def _entry_path(self, key):
+        # ID чувствительны к регистру, а файловая система может быть нет, поэтому добавляем хэш
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]
+        name = re.sub(r'[^\w.-]', '_', key)
+        return os.path.join(self.cache_dir, f"{name}-{digest}.json.gz")
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self._index_path(), 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+            self._index.setdefault('urls', {})
+            self._index.setdefault('entries', {})
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._index_path() + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path())
+
+    def key_for_url(self, url):
+        with self._lock:
+            return self._load_index()['urls'].get(url)
+
+    def get(self, url=None, key=None):
+        with self._lock:
+            index = self._load_index()
+            key = key or index['urls'].get(url)
+            entry = index['entries'].get(key) if key else None
+            if not entry:
+                return None
+            path = self._entry_path(key)
+            if time.time() - entry['created'] > self.ttl:
+                self._remove(key)
+                self._save_index()
+                return None
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    info = json.load(f)
+                # Время доступа хранится в mtime файла, чтобы не переписывать индекс при каждом чтении
+                os.utime(path)
+                return info
+            except (OSError, ValueError):
+                self._remove(key)
+                self._save_index()
+                return None
+
+    def put(self, url, info):
+        extractor = info.get('extractor_key') or info.get('extractor') or info.get('ie_key')
+        if not extractor or not info.get('id'):
+            return None
+        key = make_video_key(extractor, info['id'])
+        with self._lock:
+            index = self._load_index()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._entry_path(key)
+            tmp_path = path + ".tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+                json.dump(info, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+
+            index['entries'][key] = {'created': time.time(), 'size': os.path.getsize(path)}
+            index['urls'][url] = key
+            for alias in (info.get('webpage_url'), info.get('original_url')):
+                if alias:
+                    index['urls'][alias] = key
+            self._evict()
+            self._save_index()
+        return key
+
+    def _remove(self, key):
+        index = self._load_index()
+        index['entries'].pop(key, None)
+        for url in [url for url, value in index['urls'].items() if value == key]:
+            del index['urls'][url]
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        index = self._load_index()
+        now = time.time()
+        for key in [key for key, entry in index['entries'].items() if now - entry['created'] > self.ttl]:
+            self._remove(key)
+
+        total = sum(entry['size'] for entry in index['entries'].values())
+        if total <= self.max_size:
+            return
+
+        def last_access(key):
+            try:
+                return os.path.getmtime(self._entry_path(key))
+            except OSError:
+                return 0
+
+        for key in sorted(index['entries'], key=last_access):
+            if total <= self.max_size:
+                break
+            total -= index['entries'][key]['size']
+            self._remove(key)
+
+class MetadataThread(QThread):
+    finished = pyqtSignal(bool, str, object)
+
+    def __init__(self, url, options, cache):
+        super().__init__()
+        self.url = url
+        self.options = options
+        self.cache = cache
+        self._is_running = True
+        self.process = None
+
+    def run(self):
+        info = self.cache.get(self.url)
+        if info is not None:
+            self.finished.emit(True, "Информация получена из кэша", info)
+            return
+
+        try:
+            cmd = self.options.to_command(self.url, ["--dump-single-json", "--flat-playlist", "--no-warnings"])
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                **process_group_args()
+            )
+            if not self._is_running:
+                terminate_process_tree(self.process)
+            stdout, stderr = self.process.communicate()
+            if not self._is_running:
+                self.finished.emit(False, "Запрос информации отменён", None)
+                return
+            if self.process.returncode != 0:
+                error = stderr.strip().splitlines()
+                self.finished.emit(False, error[-1] if error else f"Ошибка (код {self.process.returncode})", None)
+                return
+
+            info = json.loads(stdout)
+            self.cache.put(self.url, info)
+            self.finished.emit(True, "Информация получена", info)
+        except Exception as e:
+            self.finished.emit(False, f"Ошибка получения информации: {str(e)}", None)
+
+    def stop(self):
+        self._is_running = False
+        if self.process:
+            terminate_process_tree(self.process)
+
+class TemplateEditorDialog(QDialog):
+    TEMPLATE_FIELD_RE = re.compile(r'%\((\w+)\)s')
+
+    def __init__(self, current_template, parent=None, info=None):
+        super().__init__(parent)
+        self.setWindowTitle("Конструктор шаблонов")
+        self.setMinimumSize(500, 400)
+        self.current_template = current_template
+        self.info = info
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        self.template_edit = QLineEdit(self.current_template)
+        self.template_edit.setPlaceholderText("Введите шаблон или используйте конструктор ниже")
+        layout.addWidget(QLabel("Шаблон имени файла:"))
+        layout.addWidget(self.template_edit)
+
+        self.setup_variables_table()
+        layout.addWidget(QLabel("Доступные переменные:"))
+        layout.addWidget(self.variables_table)
+
+        self.preview_label = QLabel()
+        self.preview_label.setWordWrap(True)
+        self.update_preview()
+        layout.addWidget(QLabel("Пример:"))
+        layout.addWidget(self.preview_label)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+
+        self.setLayout(layout)
+        self.template_edit.textChanged.connect(self.update_preview)
+
+    def setup_variables_table(self):
+        self.variables_table = QTableWidget()
+        self.variables_table.setColumnCount(3)
+        self.variables_table.setHorizontalHeaderLabels(["Переменная", "Описание", "Действие"])
+        self.variables_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
+        self.variables_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.variables_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
+        self.variables_table.setRowCount(8)
+
+        variables = [
+            ("%(title)s", "Название видео", "Вставить"),
+            ("%(uploader)s", "Автор канала", "Вставить"),
+            ("%(upload_date)s", "Дата загрузки (YYYYMMDD)", "Вставить"),
+            ("%(id)s", "ID видео", "Вставить"),
+            ("%(ext)s", "Расширение файла", "Вставить"),
+            ("%(playlist_title)s", "Название плейлиста", "Вставить"),
+            ("%(playlist_index)s", "Номер в плейлиста", "Вставить"),
+            ("%(height)s", "Высота видео в пикселях", "Вставить")
+        ]
+
+        for row, (var, desc, action) in enumerate(variables):
+            self.variables_table.setItem(row, 0, QTableWidgetItem(var))
+            self.variables_table.setItem(row, 1, QTableWidgetItem(desc))
+
+            btn = QPushButton(action)
+            btn.clicked.connect(lambda _, v=var: self.insert_variable(v))
             self.variables_table.setCellWidget(row, 2, btn)
 
     def insert_variable(self, variable):
@@ -323,6 +1970,12 @@ class TemplateEditorDialog(QDialog):
 
     def update_preview(self):
         template = self.template_edit.text()
+        if self.info:
+            # Предпросмотр по метаданным текущего видео из кэша
+            example = self.TEMPLATE_FIELD_RE.sub(lambda m: str(self.info.get(m.group(1), "NA")), template)
+            self.preview_label.setText(f"<b>{example}</b>")
+            return
+
         example = template
         example = example.replace("%(title)s", "Пример видео")
         example = example.replace("%(uploader)s", "Автор")
@@ -394,7 +2047,7 @@ class OutputSettingsDialog(QDialog):
                 QMessageBox.warning(self, "Ошибка", "Нет прав на запись в выбранную папку")
 
     def edit_template(self):
-        dialog = TemplateEditorDialog(self.template_input.text(), self)
+        dialog = TemplateEditorDialog(self.template_input.text(), self, self.parent.current_video_info())
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.template_input.setText(dialog.get_template())
 
@@ -588,79 +2241,2483 @@ class CookiesSettingsDialog(QDialog):
         self.parent.set_cookies_enabled(self.get_current_mode() != 'none', self.get_current_mode())
 
     def on_accept(self):
-        self.save()
+        self.save()
+        self.accept()
+
+class BandwidthSettingsDialog(QDialog):
+    DAY_PRESETS = [("Каждый день", "all"), ("Будни", "mon-fri"), ("Выходные", "sat-sun")]
+    HEADERS = ["Дни", "С", "До", "Лимит"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Ограничение скорости")
+        self.setMinimumSize(520, 360)
+        self.parent = parent
+        self.limit = None
+        self.rules = []
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        limit_form = QFormLayout()
+        limit = ConfigManager.get_setting('bandwidth_limit')
+        self.limit_input = QLineEdit("" if limit is None else str(limit))
+        self.limit_input.setPlaceholderText("например, 50Mbit или 5M; пусто - без ограничения")
+        self.limit_input.setToolTip("Общая скорость всех загрузок, делится между активными задачами")
+        limit_form.addRow("Общий лимит:", self.limit_input)
+        layout.addLayout(limit_form)
+
+        hint = QLabel("Расписание: первое подходящее правило заменяет общий лимит. "
+                      "Пустой лимит в правиле - без ограничения в это время.")
+        hint.setWordWrap(True)
+        layout.addWidget(hint)
+
+        self.schedule_table = QTableWidget(0, len(self.HEADERS))
+        self.schedule_table.setHorizontalHeaderLabels(self.HEADERS)
+        self.schedule_table.verticalHeader().setVisible(False)
+        self.schedule_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        for rule in ConfigManager.get_setting('bandwidth_schedule') or ():
+            self.add_rule(rule)
+        layout.addWidget(self.schedule_table)
+
+        rules_layout = QHBoxLayout()
+        add_button = QPushButton("Добавить правило")
+        add_button.clicked.connect(lambda: self.add_rule({'days': "mon-fri", 'from': "09:00", 'to': "18:00", 'limit': "20Mbit"}))
+        rules_layout.addWidget(add_button)
+        remove_button = QPushButton("Удалить правило")
+        remove_button.clicked.connect(self.remove_rule)
+        rules_layout.addWidget(remove_button)
+        rules_layout.addStretch()
+        layout.addLayout(rules_layout)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        button_box.accepted.connect(self.on_accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+
+        self.setLayout(layout)
+
+    def add_rule(self, rule):
+        row = self.schedule_table.rowCount()
+        self.schedule_table.insertRow(row)
+        days_combo = QComboBox()
+        for label, days in self.DAY_PRESETS:
+            days_combo.addItem(label, days)
+        days = rule.get('days') or "all"
+        index = days_combo.findData(days)
+        if index < 0:
+            days_combo.addItem(days, days)
+            index = days_combo.count() - 1
+        days_combo.setCurrentIndex(index)
+        self.schedule_table.setCellWidget(row, 0, days_combo)
+        limit = rule.get('limit')
+        for column, value in ((1, rule.get('from', "00:00")), (2, rule.get('to', "24:00")),
+                              (3, "" if limit is None else str(limit))):
+            self.schedule_table.setItem(row, column, QTableWidgetItem(str(value)))
+
+    def remove_rule(self):
+        row = self.schedule_table.currentRow()
+        if row >= 0:
+            self.schedule_table.removeRow(row)
+
+    def collect_rules(self):
+        rules = []
+        for row in range(self.schedule_table.rowCount()):
+            def text(column):
+                item = self.schedule_table.item(row, column)
+                return item.text().strip() if item else ""
+            rules.append({
+                'days': self.schedule_table.cellWidget(row, 0).currentData(),
+                'from': text(1),
+                'to': text(2),
+                'limit': text(3) or None,
+            })
+        return rules
+
+    def on_accept(self):
+        limit = self.limit_input.text().strip() or None
+        rules = self.collect_rules()
+        try:
+            BandwidthSchedule(limit, rules)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", f"{str(e)}\n\nСкорость: 500K, 5M, 20Mbit; время: 09:00")
+            return
+        self.limit = limit
+        self.rules = rules
+        self.accept()
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+class DownloadJob:
+    QUEUED = 'queued'
+    EXPANDING = 'expanding'
+    RUNNING = 'running'
+    MERGING = 'merging'
+    PAUSED = 'paused'
+    RETRYING = 'retrying'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    STATE_LABELS = {
+        QUEUED: "В очереди",
+        EXPANDING: "Разбор плейлиста",
+        RUNNING: "Загрузка",
+        MERGING: "Обработка",
+        PAUSED: "Пауза",
+        RETRYING: "Ожидает повтора",
+        DONE: "Готово",
+        FAILED: "Ошибка",
+        CANCELLED: "Отменено",
+    }
+
+    PRIORITY_HIGH = 1
+    PRIORITY_NORMAL = 0
+    PRIORITY_LOW = -1
+    # В порядке выбора из очереди
+    PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+    PRIORITY_LABELS = {
+        PRIORITY_HIGH: "Высокий",
+        PRIORITY_NORMAL: "Обычный",
+        PRIORITY_LOW: "Низкий",
+    }
+    PRIORITY_NAMES = {'high': PRIORITY_HIGH, 'normal': PRIORITY_NORMAL, 'low': PRIORITY_LOW}
+
+    _ids = itertools.count(1)
+
+    def __init__(self, url, options):
+        self.id = next(self._ids)
+        self.journal_key = None
+        self.url = url
+        self.host = url_host(url)
+        self.options = options
+        self.video_key = None
+        self.title = None
+        self.filepath = None
+        self.timings = None
+        self.rate_limit = None
+        self.restart_requested = False
+        self.rate_restarts = 0
+        self.launched_at = None
+        self.launches = 0
+        self.priority = self.PRIORITY_NORMAL
+        # Число повторов по классам ошибок и момент следующей попытки (time.monotonic)
+        self.retries = {}
+        self.retry_at = None
+        self.error_class = None
+        self.pause_requested = False
+        self.preempted = False
+        self.parent = None
+        self.children = []
+        self.skipped = 0
+        self.expanded = False
+        self.state = self.QUEUED
+        self.message = ""
+        self.thread = None
+        self.progress = None
+        self.cancel_requested = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def state_label(self):
+        return self.STATE_LABELS.get(self.state, self.state)
+
+    def is_active(self):
+        return self.state in (self.RUNNING, self.MERGING)
+
+    def is_finished(self):
+        return self.state in (self.DONE, self.FAILED, self.CANCELLED)
+
+    def is_stopping(self):
+        return self.cancel_requested or self.pause_requested or self.preempted or self.restart_requested
+
+    def is_playlist(self):
+        return self.expanded or self.state == self.EXPANDING
+
+    def playlist_counts(self):
+        finished = sum(1 for child in self.children if child.is_finished())
+        failed = sum(1 for child in self.children if child.state == self.FAILED)
+        return finished, failed, len(self.children)
+
+PLAYLIST_URL_RE = re.compile(
+    r'[?&]list=|/playlist\b|/channel/|/c/|/user/|/@[^/?#]+/?(?:videos|shorts|streams)?/?(?:[?#]|$)'
+)
+
+def looks_like_playlist(url):
+    return bool(PLAYLIST_URL_RE.search(url))
+
+# Поля шаблона, которые при загрузке отдельного видео плейлиста были бы пустыми
+PLAYLIST_TEMPLATE_FIELDS = ('playlist', 'playlist_title', 'playlist_id', 'playlist_index', 'playlist_count')
+
+def playlist_entry_options(options, entry):
+    def substitute(match):
+        value = entry.get(match.group(1))
+        if value is None:
+            return match.group(0)
+        if match.group(1) == 'playlist_index' and match.group(2):
+            value = format(int(value), match.group(2))
+        return str(value).replace('%', '%%')
+
+    pattern = r'%\((' + '|'.join(PLAYLIST_TEMPLATE_FIELDS) + r')\)(0\d+)?[sd]'
+    return options._replace(output=re.sub(pattern, substitute, options.output))
+
+class PlaylistExpanderThread(QThread):
+    entry_found = pyqtSignal(object)
+    finished = pyqtSignal(bool, str)
+
+    EXPAND_ARGS = ["--flat-playlist", "--dump-json", "--no-warnings"]
+
+    def __init__(self, url, options, output, job_id=None):
+        super().__init__()
+        self.url = url
+        self.options = options
+        self.output = output
+        self.job_id = job_id
+        self._is_running = True
+        self.process = None
+
+    def run(self):
+        try:
+            cmd = self.options.to_command(self.url, self.EXPAND_ARGS)
+            ConfigManager.log_download(f"Разбор плейлиста: {format_command(cmd)}", job=self.job_id)
+
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                encoding='utf-8',
+                errors='replace',
+                bufsize=1,
+                **process_group_args()
+            )
+            if not self._is_running:
+                terminate_process_tree(self.process)
+
+            count = 0
+            # Каждая запись отдаётся в очередь сразу, не дожидаясь конца разбора плейлиста
+            for line in self.process.stdout:
+                if not self._is_running:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith('{'):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        self.output.put((self.job_id, line))
+                        continue
+                    count += 1
+                    self.entry_found.emit(entry)
+                else:
+                    self.output.put((self.job_id, line))
+
+            return_code = self.process.wait()
+            if return_code == 0 or count:
+                self.finished.emit(True, f"Найдено видео: {count}")
+            else:
+                self.finished.emit(False, f"Ошибка разбора плейлиста (код {return_code})")
+        except Exception as e:
+            self.output.put((self.job_id, f"Исключение: {str(e)}"))
+            self.finished.emit(False, f"Исключение: {str(e)}")
+
+    def stop(self):
+        self._is_running = False
+        if self.process:
+            terminate_process_tree(self.process)
+
+class DownloadProgress(namedtuple('DownloadProgress', [
+    'status', 'downloaded_bytes', 'total_bytes', 'speed', 'eta', 'fragment_index', 'fragment_count'
+])):
+    __slots__ = ()
+
+    PREFIX = "[gfyt-progress]"
+    TEMPLATE = (
+        "download:" + PREFIX + " %(progress.status)s %(progress.downloaded_bytes)s"
+        " %(progress.total_bytes)s %(progress.total_bytes_estimate)s %(progress.speed)s"
+        " %(progress.eta)s %(progress.fragment_index)s %(progress.fragment_count)s"
+    )
+    LINE_RE = re.compile(
+        r'^\[gfyt-progress\] (\S+) (\S+) (\S+) (\S+) (\S+) (\S+) (\S+) (\S+)$'
+    )
+
+    @staticmethod
+    def _number(value):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    @classmethod
+    def parse(cls, line):
+        match = cls.LINE_RE.match(line)
+        if not match:
+            return None
+        status, downloaded, total, estimate, speed, eta, fragment, fragments = match.groups()
+        number = cls._number
+        fragment_index = number(fragment)
+        fragment_count = number(fragments)
+        return cls(
+            status=status,
+            downloaded_bytes=number(downloaded),
+            total_bytes=number(total) or number(estimate),
+            speed=number(speed),
+            eta=number(eta),
+            fragment_index=int(fragment_index) if fragment_index is not None else None,
+            fragment_count=int(fragment_count) if fragment_count is not None else None
+        )
+
+    @property
+    def percent(self):
+        if self.status == 'finished':
+            return 100.0
+        if self.downloaded_bytes is not None and self.total_bytes:
+            return min(100.0, self.downloaded_bytes * 100.0 / self.total_bytes)
+        if self.fragment_index is not None and self.fragment_count:
+            return min(100.0, self.fragment_index * 100.0 / self.fragment_count)
+        return None
+
+class JobTimings(namedtuple('JobTimings', [
+    'extraction', 'ttfb', 'download', 'postprocess', 'total', 'bytes'
+])):
+    # Фазы одной загрузки в секундах: extraction - от запуска yt-dlp до первой строки
+    # прогресса, ttfb - до первого полученного байта, download - от начала загрузки до
+    # постобработки (или выхода), postprocess - слияние, конвертация и перемещение
+    __slots__ = ()
+
+    PHASES = ('extraction', 'ttfb', 'download', 'postprocess')
+
+    @property
+    def speed(self):
+        if self.bytes and self.download:
+            return self.bytes / self.download
+        return None
+
+class DownloadThread(QThread):
+    state_changed = pyqtSignal(str)
+    progress_changed = pyqtSignal(object)
+    finished = pyqtSignal(bool, str)
+
+    PROGRESS_ARGS = ["--newline", "--progress-template", DownloadProgress.TEMPLATE]
+    PROGRESS_INTERVAL = 0.25
+    # После перемещения в итоговую папку yt-dlp дописывает во временный файл
+    # сведения о видео для истории загрузок; каждое поле закодировано в JSON
+    INFO_FIELDS = ('extractor_key', 'id', 'title', 'filepath')
+    INFO_TEMPLATE = "after_move:" + "\t".join(f"%({field})j" for field in INFO_FIELDS)
+
+    ERROR_LINES = 20
+
+    POSTPROCESS_RE = re.compile(
+        r'^\[(Merger|ExtractAudio|VideoConvertor|VideoRemuxer|EmbedThumbnail|Metadata|'
+        r'FixupM\w+|SponsorBlock|ModifyChapters|ThumbnailsConvertor|MoveFiles)\]'
+    )
+
+    def __init__(self, url, options, output, job_id=None):
+        super().__init__()
+        self.url = url
+        self.options = options
+        # Строки вывода передаются в потокобезопасную очередь, которую GUI
+        # разбирает пачками по таймеру, без сигнала на каждую строку
+        self.output = output
+        self.job_id = job_id
+        self._is_running = True
+        self._postprocessing = False
+        self._last_progress_emit = 0.0
+        self.process = None
+        self.info = {}
+        self.timings = None
+        self.rate_limit = None
+        self.continue_partial = False
+        self._started = None
+        self._first_progress = None
+        self._first_byte = None
+        self._postprocess_started = None
+        self._bytes_done = 0
+        self._file_bytes = 0
+        self.error_lines = deque(maxlen=self.ERROR_LINES)
+        self.error_class = None
+        self.info_path = os.path.join(
+            tempfile.gettempdir(), f"yt-dlp-gui-{os.getpid()}-{job_id if job_id is not None else id(self)}.info")
+        self.metadata_cache = None
+        self.info_json_path = None
+
+    def prepare_info_json(self):
+        # Видео уже разобрано (например, через "Информация о видео"): yt-dlp получает
+        # сохранённые форматы и не повторяет извлечение. Срок жизни кэша (6 ч)
+        # короче срока действия ссылок на форматы
+        if self.metadata_cache is None:
+            return
+        info = self.metadata_cache.get(self.url)
+        if not info or info.get('_type', 'video') != 'video' or not info.get('formats'):
+            return
+        path = self.info_path + ".json"
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(info, f, ensure_ascii=False)
+        except OSError:
+            return
+        self.info_json_path = path
+
+    def remove_info_json(self):
+        if self.info_json_path:
+            try:
+                os.remove(self.info_json_path)
+            except OSError:
+                pass
+
+    def build_command(self):
+        extra = self.PROGRESS_ARGS + ["--print-to-file", self.INFO_TEMPLATE, self.info_path]
+        if self.rate_limit:
+            # Идёт после опций из yt-dlp.conf, поэтому заменяет их --limit-rate
+            extra += ["--limit-rate", str(int(self.rate_limit))]
+        if self.continue_partial:
+            # Повторный запуск после паузы: докачиваем .part и уже скачанные фрагменты
+            extra.append("--continue")
+        if self.info_json_path:
+            return self.options.to_command(None, extra + ["--load-info-json", self.info_json_path])
+        return self.options.to_command(self.url, extra)
+
+    def read_info(self):
+        try:
+            with open(self.info_path, 'r', encoding='utf-8') as f:
+                lines = [line for line in f.read().splitlines() if line.strip()]
+            os.remove(self.info_path)
+        except OSError:
+            return {}
+        if not lines:
+            return {}
+        info = {}
+        for field, value in zip(self.INFO_FIELDS, lines[-1].split("\t")):
+            try:
+                info[field] = json.loads(value)
+            except ValueError:
+                # Отсутствующее поле yt-dlp выводит как NA
+                info[field] = None
+        return info
+
+    def build_timings(self):
+        if self._started is None:
+            return None
+        now = time.monotonic()
+
+        def since(start, end):
+            return end - start if start is not None and end is not None else None
+
+        download_end = self._postprocess_started or now
+        return JobTimings(
+            extraction=since(self._started, self._first_progress),
+            ttfb=since(self._started, self._first_byte),
+            download=since(self._first_progress, download_end),
+            postprocess=since(self._postprocess_started, now),
+            total=now - self._started,
+            bytes=int(self._bytes_done + self._file_bytes)
+        )
+
+    def run(self):
+        started = self._started = time.monotonic()
+        try:
+            self.prepare_info_json()
+            cmd = self.build_command()
+            ConfigManager.log_download(f"Запуск команды: {format_command(cmd)}", job=self.job_id)
+
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                bufsize=1,
+                **process_group_args()
+            )
+            if not self._is_running:
+                terminate_process_tree(self.process)
+
+            while self._is_running:
+                output = self.process.stdout.readline()
+                if output == '' and self.process.poll() is not None:
+                    break
+                if output:
+                    line = output.strip()
+                    if line.startswith(DownloadProgress.PREFIX):
+                        self.handle_progress(line)
+                        continue
+                    if not self._postprocessing and self.POSTPROCESS_RE.match(line):
+                        self._postprocessing = True
+                        self._postprocess_started = time.monotonic()
+                        self.state_changed.emit(DownloadJob.MERGING)
+                    if line.startswith(("ERROR:", "WARNING:")):
+                        self.error_lines.append(line)
+                    self.add_to_buffer(line)
+
+            return_code = self.process.wait()
+            success = return_code == 0
+            if success:
+                msg = "Загрузка завершена успешно!"
+            else:
+                self.error_class, detail = ErrorClassifier.classify(self.error_lines)
+                msg = f"Ошибка (код {return_code}): {detail}" if detail else f"Ошибка (код {return_code})"
+            self.info = self.read_info()
+            self.timings = self.build_timings()
+            self.finished.emit(success, msg)
+            ConfigManager.log_download(self.url, success, job=self.job_id, code=return_code,
+                                       duration=round(time.monotonic() - started, 3))
+
+        except Exception as e:
+            self.add_to_buffer(f"Исключение: {str(e)}")
+            # Не удалось даже запустить yt-dlp: повтор ничего не изменит
+            self.error_class = ErrorClassifier.LOCAL
+            self.timings = self.build_timings()
+            self.finished.emit(False, f"Исключение: {str(e)}")
+            ConfigManager.log_download(f"{self.url}: {e}", False, job=self.job_id,
+                                       duration=round(time.monotonic() - started, 3))
+        finally:
+            self.remove_info_json()
+
+    def handle_progress(self, line):
+        progress = DownloadProgress.parse(line)
+        if progress is None:
+            return
+        now = time.monotonic()
+        if self._first_progress is None:
+            self._first_progress = now
+        downloaded = progress.downloaded_bytes or 0
+        if downloaded:
+            if self._first_byte is None:
+                self._first_byte = now
+            # Видео и аудио скачиваются отдельными файлами, счётчик yt-dlp начинается заново
+            if downloaded < self._file_bytes:
+                self._bytes_done += self._file_bytes
+            self._file_bytes = downloaded
+        if progress.status == 'downloading' and now - self._last_progress_emit < self.PROGRESS_INTERVAL:
+            return
+        self._last_progress_emit = now
+        self.progress_changed.emit(progress)
+
+    def add_to_buffer(self, message):
+        self.output.put((self.job_id, message))
+
+    def stop(self):
+        self._is_running = False
+        if self.process:
+            terminate_process_tree(self.process)
+
+def prometheus_labels(labels):
+    if not labels:
+        return ""
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+class DownloadMetrics:
+    # Счётчики для графиков: скользящая скорость по всем задачам и суммы фаз по
+    # экстракторам. Всё считается в потоке GUI по сигналам очереди
+    WINDOWS = (10, 60)
+    RECENT_JOBS = 50
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.downloaded_bytes = 0
+        self._samples = deque()
+        self.jobs = {}
+        self.phases = {}
+        self.job_bytes = {}
+        self.recent = deque(maxlen=self.RECENT_JOBS)
+        # Задача -> (байт учтено всего, байт текущего файла на момент последнего учёта)
+        self._counted = {}
+        self.retries = {}
+
+    def job_progress(self, job_id, downloaded):
+        counted, file_bytes = self._counted.get(job_id, (0, 0))
+        delta = downloaded - file_bytes if downloaded >= file_bytes else downloaded
+        self._counted[job_id] = (counted + delta, downloaded)
+        self.add_bytes(delta)
+
+    def add_bytes(self, count):
+        if count <= 0:
+            return
+        now = time.monotonic()
+        self.downloaded_bytes += count
+        self._samples.append((now, count))
+        cutoff = now - max(self.WINDOWS)
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def throughput(self, window):
+        now = time.monotonic()
+        cutoff = now - window
+        received = sum(count for moment, count in self._samples if moment >= cutoff)
+        # В первые секунды после запуска окно короче номинального
+        return received / max(1.0, min(window, now - self.started_at))
+
+    def record_retry(self, error_class):
+        self.retries[error_class] = self.retries.get(error_class, 0) + 1
+
+    @staticmethod
+    def extractor_of(job):
+        return job.video_key.split(" ", 1)[0] if job.video_key else "unknown"
+
+    def record_job(self, job):
+        extractor = self.extractor_of(job)
+        key = (extractor, job.state)
+        self.jobs[key] = self.jobs.get(key, 0) + 1
+        counted, _ = self._counted.pop(job.id, (0, 0))
+        timings = job.timings
+        if timings is None:
+            return
+        # Прогресс приходит с прореживанием, поэтому хвост загрузки досчитываем по итогу потока
+        self.add_bytes(timings.bytes - counted)
+        for phase in JobTimings.PHASES:
+            value = getattr(timings, phase)
+            if value is not None:
+                total, count = self.phases.get((extractor, phase), (0.0, 0))
+                self.phases[(extractor, phase)] = (total + value, count + 1)
+        if timings.bytes:
+            self.job_bytes[extractor] = self.job_bytes.get(extractor, 0) + timings.bytes
+        self.recent.appendleft((job.id, extractor, job.state, timings))
+
+    def extractor_averages(self):
+        averages = {}
+        for (extractor, phase), (total, count) in self.phases.items():
+            averages.setdefault(extractor, {})[phase] = total / count
+        return averages
+
+    def to_prometheus(self, active=0, pending=0, bandwidth_limit=None):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{prometheus_labels(labels)} {value}")
+
+        metric("gfyt_downloaded_bytes_total", "counter", "Bytes received by all download jobs.",
+               [({}, self.downloaded_bytes)])
+        metric("gfyt_throughput_bytes_per_second", "gauge", "Rolling aggregate download throughput.",
+               [({'window': f"{window}s"}, float(self.throughput(window))) for window in self.WINDOWS])
+        metric("gfyt_bandwidth_limit_bytes_per_second", "gauge", "Current total rate limit, 0 when unlimited.",
+               [({}, float(bandwidth_limit or 0))])
+        metric("gfyt_jobs_active", "gauge", "Jobs currently downloading or post-processing.", [({}, active)])
+        metric("gfyt_jobs_pending", "gauge", "Jobs waiting in the queue.", [({}, pending)])
+        metric("gfyt_jobs_finished_total", "counter", "Finished jobs by extractor and final state.",
+               [({'extractor': extractor, 'state': state}, count)
+                for (extractor, state), count in sorted(self.jobs.items())])
+        phases = sorted(self.phases.items())
+        metric("gfyt_job_phase_seconds_sum", "counter", "Total time spent in each job phase.",
+               [({'extractor': extractor, 'phase': phase}, float(total)) for (extractor, phase), (total, _) in phases])
+        metric("gfyt_job_phase_seconds_count", "counter", "Number of jobs that reached each phase.",
+               [({'extractor': extractor, 'phase': phase}, count) for (extractor, phase), (_, count) in phases])
+        metric("gfyt_job_bytes_total", "counter", "Bytes downloaded by finished jobs.",
+               [({'extractor': extractor}, count) for extractor, count in sorted(self.job_bytes.items())])
+        metric("gfyt_job_retries_total", "counter", "Scheduled retries by error class.",
+               [({'error_class': error_class}, count) for error_class, count in sorted(self.retries.items())])
+        return "\n".join(lines) + "\n"
+
+class BandwidthSchedule:
+    # Общий лимит скорости с расписанием. Правила из yt-dlp-gui.json проверяются по
+    # порядку, действует первое подходящее, вне правил - bandwidth_limit:
+    # [{"days": "mon-fri", "from": "09:00", "to": "18:00", "limit": "20Mbit"}]
+    DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+    def __init__(self, default_limit=None, rules=()):
+        self.default_limit = parse_rate(default_limit)
+        self.rules = [
+            (self.parse_days(rule.get('days')), self.parse_time(rule.get('from', "00:00")),
+             self.parse_time(rule.get('to', "24:00")), parse_rate(rule.get('limit')))
+            for rule in rules
+        ]
+
+    @classmethod
+    def from_settings(cls):
+        return cls(ConfigManager.get_setting('bandwidth_limit'), ConfigManager.get_setting('bandwidth_schedule') or ())
+
+    @classmethod
+    def parse_days(cls, text):
+        if not text or text == "all":
+            return set(range(7))
+        days = set()
+        for part in str(text).lower().replace(" ", "").split(","):
+            first, _, last = part.partition("-")
+            if first not in cls.DAYS or (last and last not in cls.DAYS):
+                raise ValueError(f"Неверные дни недели: {text}")
+            start, end = cls.DAYS.index(first), cls.DAYS.index(last or first)
+            days.update(day % 7 for day in range(start, end + 1 if end >= start else end + 8))
+        return days
+
+    @staticmethod
+    def parse_time(text):
+        try:
+            hours, minutes = (int(part) for part in str(text).split(":"))
+        except ValueError:
+            raise ValueError(f"Неверное время: {text}")
+        if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 24 * 60:
+            raise ValueError(f"Неверное время: {text}")
+        return hours * 60 + minutes
+
+    def limit_at(self, moment=None):
+        moment = moment or datetime.now()
+        minute = moment.hour * 60 + moment.minute
+        weekday = moment.weekday()
+        for days, start, end, limit in self.rules:
+            if start <= end:
+                inside = weekday in days and start <= minute < end
+            else:
+                # Интервал через полночь: хвост после 00:00 относится к предыдущему дню
+                inside = (weekday in days and minute >= start) or ((weekday - 1) % 7 in days and minute < end)
+            if inside:
+                return limit
+        return self.default_limit
+
+class BandwidthManager(QObject):
+    # yt-dlp не умеет менять скорость на ходу, поэтому новая доля задачи применяется
+    # перезапуском с --limit-rate (загрузка продолжается с .part файла), а каждый
+    # перезапуск заново проходит извлечение. Поэтому доли пересчитываются только по
+    # таймеру, меняются при отличии больше HYSTERESIS, не чаще RESTART_COOLDOWN и не
+    # больше MAX_RESTARTS раз для одной задачи
+    limit_changed = pyqtSignal(object)
+
+    INTERVAL_MS = 5000
+    RESTART_COOLDOWN = 20.0
+    MAX_RESTARTS = 3
+    HYSTERESIS = 0.25
+    OBSERVE = 10.0
+    STALL_RATIO = 0.5
+    HEADROOM = 1.25
+    MIN_SHARE = 64 * 1024
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.queue = queue
+        self.limit = None
+        self.schedule = BandwidthSchedule()
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.INTERVAL_MS)
+        self.timer.timeout.connect(self.rebalance)
+        self.reload()
+
+    def reload(self):
+        try:
+            self.schedule = BandwidthSchedule.from_settings()
+        except ValueError as e:
+            ConfigManager.log_download(f"Ошибка расписания скорости: {str(e)}", False)
+            self.schedule = BandwidthSchedule()
+        self.update_limit()
+
+    def update_limit(self):
+        limit = self.schedule.limit_at()
+        if limit != self.limit:
+            self.limit = limit
+            self.limit_changed.emit(limit)
+        return limit
+
+    def start(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def demand(self, job, now):
+        # Задача, которая стабильно не выбирает свою долю (медленный сервер, зависание),
+        # получает чуть больше своей фактической скорости, остальное делится между другими
+        demand = job.options.extra_rate_limit() or float('inf')
+        progress = job.progress
+        if job.rate_limit and progress and progress.status == 'downloading' and now - job.launched_at >= self.OBSERVE:
+            speed = progress.speed or 0
+            if speed < self.STALL_RATIO * job.rate_limit:
+                demand = min(demand, max(self.MIN_SHARE, speed * self.HEADROOM))
+        return demand
+
+    def allocate(self, jobs, budget):
+        if budget is None:
+            return {job.id: job.options.extra_rate_limit() for job in jobs}
+        now = time.monotonic()
+        shares = {}
+        remaining = budget
+        ordered = sorted(jobs, key=lambda job: self.demand(job, now))
+        for index, job in enumerate(ordered):
+            share = min(self.demand(job, now), remaining / (len(ordered) - index))
+            remaining -= share
+            shares[job.id] = max(self.MIN_SHARE, share)
+        return shares
+
+    def bandwidth_jobs(self):
+        return [job for job in self.queue.running_jobs()
+                if job.state == DownloadJob.RUNNING and job.thread and not job.is_stopping()]
+
+    def share_for(self, job):
+        jobs = self.bandwidth_jobs()
+        if job not in jobs:
+            jobs.append(job)
+        return self.allocate(jobs, self.update_limit()).get(job.id)
+
+    def should_restart(self, job, target, now, force):
+        current = job.rate_limit
+        if current == target or job.rate_restarts >= self.MAX_RESTARTS:
+            return False
+        if current is not None and target is not None and abs(target - current) <= self.HYSTERESIS * current:
+            return False
+        progress = job.progress
+        # Почти скачанную задачу перезапускать дольше, чем дождаться
+        if progress and progress.eta is not None and progress.eta < self.RESTART_COOLDOWN:
+            return False
+        return force or now - job.launched_at >= self.RESTART_COOLDOWN
+
+    def rebalance(self, force=False):
+        budget = self.update_limit()
+        jobs = self.bandwidth_jobs()
+        shares = self.allocate(jobs, budget)
+        now = time.monotonic()
+        for job in jobs:
+            if self.should_restart(job, shares[job.id], now, force):
+                self.queue.restart(job, shares[job.id])
+
+class ErrorClassifier:
+    RATE_LIMITED = 'rate_limited'
+    FORBIDDEN = 'forbidden'
+    NETWORK = 'network'
+    AUTH = 'auth'
+    UNAVAILABLE = 'unavailable'
+    EXTRACTOR = 'extractor'
+    POSTPROCESS = 'postprocess'
+    LOCAL = 'local'
+    UNKNOWN = 'unknown'
+
+    LABELS = {
+        RATE_LIMITED: "HTTP 429, слишком много запросов",
+        FORBIDDEN: "HTTP 403, доступ запрещён",
+        NETWORK: "сетевая ошибка",
+        AUTH: "нужен вход в аккаунт",
+        UNAVAILABLE: "видео недоступно",
+        EXTRACTOR: "ошибка извлечения",
+        POSTPROCESS: "ошибка ffmpeg",
+        LOCAL: "ошибка на диске",
+        UNKNOWN: "неизвестная ошибка",
+    }
+
+    # Шаблоны привязаны к сообщениям yt-dlp. Порядок важен: "Unable to download
+    # webpage: HTTP Error 429" - это ограничение запросов, а не ошибка извлечения,
+    # а "ffmpeg is not installed" - не сбой ffmpeg, который стоит повторять
+    PATTERNS = [
+        (AUTH, re.compile(r'Sign in to confirm (?:your age|you.re not a bot)|Private video|This video is private|'
+                          r'members-only content|Join this channel to get access|'
+                          r'Use --cookies-from-browser or --cookies for the authentication')),
+        (UNAVAILABLE, re.compile(r'Video unavailable|This video is not available|This video has been removed|'
+                                 r'HTTP Error 404|HTTP Error 410|Unsupported URL')),
+        (RATE_LIMITED, re.compile(r'HTTP Error 429|Too Many Requests')),
+        (FORBIDDEN, re.compile(r'HTTP Error 403')),
+        (LOCAL, re.compile(r'No space left on device|Permission denied|Read-only file system|File name too long|'
+                           r'ffmpeg is not installed|ffmpeg not found|ffprobe not found')),
+        (POSTPROCESS, re.compile(r'ffmpeg exited with code|Conversion failed')),
+        (NETWORK, re.compile(r'timed out|TimeoutError|Connection (?:reset|refused|aborted)|Remote end closed|'
+                             r'IncompleteRead|Temporary failure in name resolution|Name or service not known|'
+                             r'Network is unreachable|HTTP Error 5\d\d|giving up after \d+ retries|'
+                             r'Unable to download (?:fragment|video data)|SSLError|EOF occurred in violation')),
+        (EXTRACTOR, re.compile(r'Unable to extract|please report this issue|Failed to parse JSON|'
+                               r'Unable to download (?:JSON metadata|webpage|API page)')),
+    ]
+    # По предупреждениям определяются только временные сбои: yt-dlp мог сам
+    # справиться с ними, и они не должны навсегда завершать задачу
+    WARNING_CLASSES = (RATE_LIMITED, NETWORK)
+
+    @classmethod
+    def classify(cls, lines):
+        # Решает строка ERROR (от последней к первой); предупреждения, например
+        # таймауты фрагментов перед итоговым "giving up", - только если она не распознана
+        errors = [line for line in lines if line.startswith("ERROR:")]
+        warnings = [line for line in lines if not line.startswith("ERROR:")]
+        detail = errors[-1][len("ERROR:"):].strip() if errors else None
+        for line in reversed(errors):
+            for error_class, pattern in cls.PATTERNS:
+                if pattern.search(line):
+                    return error_class, detail
+        for line in reversed(warnings):
+            for error_class, pattern in cls.PATTERNS:
+                if error_class in cls.WARNING_CLASSES and pattern.search(line):
+                    return error_class, detail
+        return cls.UNKNOWN, detail
+
+class RetryPolicy(namedtuple('RetryPolicy', ['retries', 'base_delay', 'max_delay', 'host_cooldown'])):
+    __slots__ = ()
+
+    def delay(self, attempt):
+        # Экспоненциальная задержка с джиттером: половина фиксирована, половина случайна,
+        # чтобы задачи, упавшие одновременно, не повторялись одной волной
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+class RetryManager:
+    # Повтор упавших загрузок по классу ошибки. Постоянные ошибки (вход, недоступное
+    # видео, диск) не повторяются, ограничение запросов приостанавливает весь хост
+    POLICIES = {
+        ErrorClassifier.RATE_LIMITED: RetryPolicy(5, 60, 1800, True),
+        ErrorClassifier.FORBIDDEN: RetryPolicy(2, 30, 300, False),
+        ErrorClassifier.NETWORK: RetryPolicy(6, 10, 600, False),
+        ErrorClassifier.EXTRACTOR: RetryPolicy(1, 120, 120, False),
+        ErrorClassifier.POSTPROCESS: RetryPolicy(1, 5, 5, False),
+        ErrorClassifier.UNKNOWN: RetryPolicy(2, 30, 300, False),
+        ErrorClassifier.AUTH: RetryPolicy(0, 0, 0, False),
+        ErrorClassifier.UNAVAILABLE: RetryPolicy(0, 0, 0, False),
+        ErrorClassifier.LOCAL: RetryPolicy(0, 0, 0, False),
+    }
+    MAX_PER_JOB = 8
+    HOST_BUDGET = 30
+    HOST_WINDOW = 600
+
+    def __init__(self):
+        self._host_retries = {}
+        self._host_blocked = {}
+        self.reload()
+
+    def reload(self):
+        # Ключи yt-dlp-gui.json: retry_policies ({"network": {"retries": 3}}), retry_max_per_job,
+        # retry_host_budget (повторов на хост за 10 минут) и max_per_host (одновременных загрузок)
+        self.policies = dict(self.POLICIES)
+        overrides = ConfigManager.get_setting('retry_policies') or {}
+        for error_class, values in overrides.items():
+            if error_class in self.policies and isinstance(values, dict):
+                self.policies[error_class] = self.policies[error_class]._replace(
+                    **{field: values[field] for field in RetryPolicy._fields if field in values})
+        self.max_per_job = ConfigManager.get_setting('retry_max_per_job', self.MAX_PER_JOB)
+        self.host_budget = ConfigManager.get_setting('retry_host_budget', self.HOST_BUDGET)
+        self.max_per_host = ConfigManager.get_setting('max_per_host')
+
+    def policy(self, error_class):
+        return self.policies.get(error_class) or self.policies[ErrorClassifier.UNKNOWN]
+
+    def next_delay(self, job, error_class, now):
+        policy = self.policy(error_class)
+        attempt = job.retries.get(error_class, 0)
+        if attempt >= policy.retries or sum(job.retries.values()) >= self.max_per_job:
+            return None
+        # Общий бюджет повторов на хост: если он массово отвечает ошибками, повторы не тратятся
+        recent = self._host_retries.setdefault(job.host, deque())
+        while recent and recent[0] < now - self.HOST_WINDOW:
+            recent.popleft()
+        if self.host_budget and len(recent) >= self.host_budget:
+            return None
+        recent.append(now)
+        job.retries[error_class] = attempt + 1
+        delay = policy.delay(attempt)
+        if policy.host_cooldown:
+            self._host_blocked[job.host] = max(self._host_blocked.get(job.host, 0), now + delay)
+        return delay
+
+    def host_blocked_until(self, host, now):
+        until = self._host_blocked.get(host)
+        if until is not None and until <= now:
+            del self._host_blocked[host]
+            return None
+        return until
+
+    def can_start(self, job, running, now):
+        if not self._host_blocked and not self.max_per_host:
+            return True
+        if self.host_blocked_until(job.host, now):
+            return False
+        if self.max_per_host:
+            return sum(1 for other in running if other.host == job.host) < self.max_per_host
+        return True
+
+    def next_release(self, now):
+        for host in [host for host, until in self._host_blocked.items() if until <= now]:
+            del self._host_blocked[host]
+        return min(self._host_blocked.values(), default=None)
+
+class DownloadQueue(QObject):
+    job_added = pyqtSignal(object)
+    job_changed = pyqtSignal(object)
+    job_finished = pyqtSignal(object)
+    history_added = pyqtSignal(object)
+
+    thread_class = DownloadThread
+    METRICS_WRITE_INTERVAL = 10.0
+
+    def __init__(self, max_workers=None, parent=None):
+        super().__init__(parent)
+        self.max_workers = max(1, int(max_workers or default_worker_count()))
+        self.output = SimpleQueue()
+        self.jobs = []
+        # Отдельная очередь на каждый приоритет: следующей запускается самая срочная задача
+        self._pending = {priority: deque() for priority in DownloadJob.PRIORITIES}
+        self._running = {}
+        self._expanding = {}
+        # Задачи, ждущие повтора после ошибки
+        self._waiting = {}
+        # video_key -> задача, которая его скачивает или скачала: проверка дубликатов
+        # при разборе плейлиста и массовом добавлении не перебирает всю очередь
+        self._by_key = {}
+        self._closed = False
+        self.archive = None
+        self.history = None
+        self.metadata_cache = None
+        self.metrics = DownloadMetrics()
+        self._metrics_written = 0.0
+        self.bandwidth = BandwidthManager(self)
+        self.retry = RetryManager()
+        self.retry_timer = QTimer(self)
+        self.retry_timer.setSingleShot(True)
+        self.retry_timer.timeout.connect(self._retry_due)
+
+    def enqueue(self, url, options, video_key=None, parent=None, priority=None):
+        job = DownloadJob(url, options)
+        job.video_key = video_key
+        job.parent = parent
+        if priority is None:
+            priority = parent.priority if parent else DownloadJob.PRIORITY_NORMAL
+        job.priority = priority
+        if parent:
+            parent.children.append(job)
+        self.jobs.append(job)
+        self._index_key(job)
+        self._queue_pending(job)
+        self.job_added.emit(job)
+        self._schedule()
+        return job
+
+    def enqueue_playlist(self, url, options, priority=DownloadJob.PRIORITY_NORMAL):
+        job = DownloadJob(url, options)
+        job.priority = priority
+        job.state = DownloadJob.EXPANDING
+        job.started_at = time.time()
+        self.jobs.append(job)
+        self.job_added.emit(job)
+        self._expand(job)
+        return job
+
+    def _expand(self, job):
+        self._expanding[job.id] = job
+        thread = PlaylistExpanderThread(job.url, job.options, self.output, job.id)
+        job.thread = thread
+        thread.entry_found.connect(lambda entry, job=job: self._on_playlist_entry(job, entry))
+        thread.finished.connect(lambda success, message, job=job: self._on_playlist_expanded(job, success, message))
+        thread.start()
+
+    def restore(self, records):
+        # Задачи из журнала прошлого запуска: недокачанные снова встают в очередь
+        # и продолжают .part файлы, завершённые видео плейлистов остаются для счётчиков
+        restored = {}
+        expand = []
+        for record in records:
+            options = DownloadOptions.from_params(record.get('options') or {})
+            job = DownloadJob(record['url'], options._replace(extra_args=tuple(options.extra_args or ())))
+            job.journal_key = record['key']
+            job.video_key = record.get('video_key')
+            job.priority = record.get('priority', DownloadJob.PRIORITY_NORMAL)
+            job.message = record.get('message') or ""
+            job.skipped = record.get('skipped', 0)
+            job.parent = restored.get(record.get('parent'))
+            if job.parent:
+                job.parent.children.append(job)
+            state = record.get('state', DownloadJob.QUEUED)
+            if record.get('playlist'):
+                job.expanded = bool(record.get('expanded'))
+                job.state = DownloadJob.RUNNING if job.expanded else DownloadJob.EXPANDING
+                job.started_at = time.time()
+                if not job.expanded:
+                    expand.append(job)
+            elif state in (DownloadJob.DONE, DownloadJob.FAILED, DownloadJob.CANCELLED, DownloadJob.PAUSED):
+                job.state = state
+            else:
+                job.state = DownloadJob.QUEUED
+                job.launches = 1
+                self._queue_pending(job)
+            restored[job.journal_key] = job
+            self.jobs.append(job)
+            self._index_key(job)
+            self.job_added.emit(job)
+        for job in expand:
+            self._expand(job)
+        for job in restored.values():
+            if job.expanded:
+                self._update_playlist(job)
+        self._schedule()
+        return list(restored.values())
+
+    def _on_playlist_entry(self, parent, entry):
+        if parent.cancel_requested or self._closed:
+            return
+        if entry.get('_type', 'video') == 'url':
+            url = entry.get('url') or entry.get('webpage_url')
+        else:
+            url = entry.get('webpage_url') or entry.get('original_url') or parent.url
+        if not url:
+            return
+
+        video_key = None
+        extractor = entry.get('ie_key') or entry.get('extractor_key')
+        if extractor and entry.get('id'):
+            video_key = make_video_key(extractor, entry['id'])
+            duplicate = self.find_duplicate(video_key)
+            if duplicate and duplicate.parent is parent:
+                # Видео уже восстановлено из журнала при повторном разборе плейлиста
+                return
+            if self.is_downloaded(video_key, parent.options) or duplicate:
+                parent.skipped += 1
+                self.job_changed.emit(parent)
+                return
+
+        self.enqueue(url, playlist_entry_options(parent.options, entry), video_key, parent)
+        self.job_changed.emit(parent)
+
+    def _on_playlist_expanded(self, job, success, message):
+        job.thread.wait()
+        if self._closed:
+            return
+        job.thread = None
+        self._expanding.pop(job.id, None)
+        job.expanded = True
+        self.output.put((job.id, message))
+        if job.cancel_requested:
+            self._finish_playlist(job, DownloadJob.CANCELLED, "Загрузка отменена пользователем")
+        elif not success and not job.children:
+            self._finish_playlist(job, DownloadJob.FAILED, message)
+        else:
+            job.state = DownloadJob.RUNNING
+            self._update_playlist(job)
+
+    def _update_playlist(self, job):
+        if not job.expanded or job.is_finished():
+            self.job_changed.emit(job)
+            return
+        finished, failed, total = job.playlist_counts()
+        if finished < total:
+            self.job_changed.emit(job)
+            return
+        skipped = f", пропущено (уже скачаны или в очереди): {job.skipped}" if job.skipped else ""
+        if job.cancel_requested:
+            self._finish_playlist(job, DownloadJob.CANCELLED, "Загрузка отменена пользователем")
+        elif failed:
+            self._finish_playlist(job, DownloadJob.FAILED, f"Загружено {total - failed} из {total}, ошибок: {failed}{skipped}")
+        else:
+            self._finish_playlist(job, DownloadJob.DONE, f"Плейлист загружен: {total} видео{skipped}")
+
+    def _finish_playlist(self, job, state, message):
+        job.state = state
+        job.message = message
+        job.finished_at = time.time()
+        self.output.put((job.id, message))
+        self.job_changed.emit(job)
+        self.job_finished.emit(job)
+
+    def set_max_workers(self, count):
+        self.max_workers = max(1, int(count))
+        self._schedule()
+
+    def drain_output(self, budget, max_lines):
+        lines = []
+        deadline = time.monotonic() + budget
+        try:
+            while len(lines) < max_lines:
+                lines.append(self.output.get_nowait())
+                if len(lines) % 256 == 0 and time.monotonic() > deadline:
+                    break
+        except Empty:
+            pass
+        return lines
+
+    def is_downloaded(self, video_key, options):
+        # Скачанным видео считается, если оно успешно завершено по истории загрузок
+        # или, при включённом архиве, есть в архиве yt-dlp
+        if not video_key:
+            return False
+        if options.download_archive and self.archive is not None and video_key in self.archive:
+            return True
+        return self.history is not None and video_key in self.history
+
+    def find_duplicate(self, video_key):
+        job = self._by_key.get(video_key)
+        if job is None or job.state in (DownloadJob.FAILED, DownloadJob.CANCELLED):
+            return None
+        return job
+
+    def _index_key(self, job):
+        if job.video_key and job.state not in (DownloadJob.FAILED, DownloadJob.CANCELLED) \
+                and self.find_duplicate(job.video_key) is None:
+            self._by_key[job.video_key] = job
+
+    def _release_key(self, job):
+        if job.video_key and self._by_key.get(job.video_key) is job:
+            del self._by_key[job.video_key]
+
+    def running_count(self):
+        return len(self._running)
+
+    def running_jobs(self):
+        return list(self._running.values())
+
+    def pending_count(self):
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    def pending_jobs(self):
+        for priority in DownloadJob.PRIORITIES:
+            yield from self._pending[priority]
+
+    def _queue_pending(self, job, front=False):
+        if front:
+            self._pending[job.priority].appendleft(job)
+        else:
+            self._pending[job.priority].append(job)
+
+    def waiting_count(self):
+        return len(self._waiting)
+
+    def _pop_pending(self):
+        # Задачи хоста на паузе после HTTP 429 или упёршегося в max_per_host пропускаются
+        now = time.monotonic()
+        running = self._running.values()
+        for priority in DownloadJob.PRIORITIES:
+            pending = self._pending[priority]
+            for index, job in enumerate(pending):
+                if self.retry.can_start(job, running, now):
+                    del pending[index]
+                    return job
+        return None
+
+    def has_active(self):
+        return bool(self._running or self.pending_count() or self._expanding or self._waiting)
+
+    def set_priority(self, job, priority):
+        if job.is_playlist():
+            job.priority = priority
+            for child in job.children:
+                if not child.is_finished():
+                    self.set_priority(child, priority)
+            self.job_changed.emit(job)
+            return
+        if job.priority == priority or job.is_finished():
+            return
+        if job.state == DownloadJob.QUEUED:
+            self._pending[job.priority].remove(job)
+            job.priority = priority
+            self._queue_pending(job)
+        else:
+            job.priority = priority
+        self.job_changed.emit(job)
+        self._schedule()
+
+    def pause(self, job):
+        if job.is_playlist():
+            for child in job.children:
+                self.pause(child)
+            return
+        if job.state in (DownloadJob.QUEUED, DownloadJob.RETRYING):
+            self._unqueue(job)
+            job.state = DownloadJob.PAUSED
+            job.message = "Приостановлено"
+            self.job_changed.emit(job)
+        elif job.state == DownloadJob.RUNNING and job.thread and not job.cancel_requested:
+            # Процесс останавливается, а при продолжении yt-dlp докачивает файл с места остановки
+            job.pause_requested = True
+            job.thread.stop()
+
+    def resume(self, job):
+        if job.is_playlist():
+            for child in job.children:
+                self.resume(child)
+            return
+        if job.state == DownloadJob.PAUSED:
+            job.state = DownloadJob.QUEUED
+            job.message = ""
+            self._queue_pending(job, front=True)
+            self.job_changed.emit(job)
+            self._schedule()
+        elif job.pause_requested:
+            # Процесс уже останавливается: вместо паузы сразу запускаем его заново
+            job.pause_requested = False
+            job.restart_requested = True
+
+    def cancel(self, job):
+        if job.is_playlist():
+            job.cancel_requested = True
+            if job.thread:
+                job.thread.stop()
+            for child in job.children:
+                self.cancel(child)
+            return
+        if job.state in (DownloadJob.QUEUED, DownloadJob.RETRYING, DownloadJob.PAUSED):
+            self._unqueue(job)
+            job.state = DownloadJob.CANCELLED
+            job.message = "Загрузка отменена пользователем"
+            job.finished_at = time.time()
+            self._release_key(job)
+            self.output.put((job.id, job.message))
+            self.job_changed.emit(job)
+            self.job_finished.emit(job)
+            if job.parent:
+                self._update_playlist(job.parent)
+        elif job.is_active() and job.thread:
+            job.cancel_requested = True
+            job.thread.stop()
+
+    def cancel_all(self):
+        paused = [job for job in self.jobs if job.state == DownloadJob.PAUSED]
+        for job in list(self._expanding.values()) + list(self.pending_jobs()) + list(self._waiting.values()) + \
+                list(self._running.values()) + paused:
+            self.cancel(job)
+
+    def _unqueue(self, job):
+        if job.state == DownloadJob.QUEUED:
+            self._pending[job.priority].remove(job)
+        elif job.state == DownloadJob.RETRYING:
+            self._waiting.pop(job.id, None)
+
+    def _schedule(self):
+        if self._closed:
+            return
+        while len(self._running) < self.max_workers:
+            job = self._pop_pending()
+            if job is None:
+                break
+            self._start(job)
+        if self.pending_count() and not self.retry_timer.isActive():
+            # Задачи ждут конца паузы хоста после HTTP 429
+            self._arm_retry_timer()
+        self._preempt()
+
+    def _preempt(self):
+        # Если срочной задаче не хватает места, менее приоритетная загрузка
+        # приостанавливается и возвращается в начало своей очереди
+        victims = sorted(
+            (job for job in self._running.values()
+             if job.state == DownloadJob.RUNNING and job.thread and not job.is_stopping()),
+            key=lambda job: (job.priority, -job.launched_at))
+        yielding = sum(1 for job in self._running.values() if job.preempted)
+        now = time.monotonic()
+        running = self._running.values()
+        startable = (job for job in self.pending_jobs() if self.retry.can_start(job, running, now))
+        for index, job in enumerate(startable):
+            if index < yielding:
+                continue
+            if not victims or victims[0].priority >= job.priority:
+                break
+            victim = victims.pop(0)
+            victim.preempted = True
+            self.output.put((victim.id, f"Приостановлено ради более срочной загрузки #{job.id}"))
+            victim.thread.stop()
+
+    def _start(self, job):
+        job.state = DownloadJob.RUNNING
+        job.started_at = time.time()
+        job.rate_limit = self.bandwidth.share_for(job)
+        self._running[job.id] = job
+        self._launch(job)
+        self.job_changed.emit(job)
+        # Новая задача сразу получает свою долю, а доли уже идущих загрузок пересчитывает
+        # только таймер: иначе разбор большого плейлиста перезапускал бы их на каждом старте
+        self.bandwidth.start()
+
+    def _launch(self, job):
+        thread = self.thread_class(job.url, job.options, self.output, job.id)
+        thread.rate_limit = job.rate_limit
+        thread.continue_partial = job.launches > 0
+        # После ошибки сведения из кэша могли устареть: повтор извлекает видео заново
+        thread.metadata_cache = self.metadata_cache if not job.retries else None
+        job.thread = thread
+        job.launched_at = time.monotonic()
+        job.launches += 1
+
+        thread.state_changed.connect(lambda state, job=job: self._on_state_changed(job, state))
+        thread.progress_changed.connect(lambda progress, job=job: self._on_progress(job, progress))
+        thread.finished.connect(lambda success, message, job=job: self._on_finished(job, success, message))
+        thread.start()
+
+    def restart(self, job, rate_limit):
+        if not job.is_active() or not job.thread:
+            return
+        job.rate_limit = rate_limit
+        job.restart_requested = True
+        job.rate_restarts += 1
+        self.output.put((job.id, f"Ограничение скорости: {format_rate(rate_limit)}, перезапуск загрузки"))
+        job.thread.stop()
+
+    def shutdown(self, timeout=5000):
+        # Остановка при выходе: процессы завершаются, но задачи не отменяются,
+        # чтобы по журналу продолжить их при следующем запуске
+        self._closed = True
+        self.bandwidth.stop()
+        self.retry_timer.stop()
+        threads = [job.thread for job in list(self._running.values()) + list(self._expanding.values()) if job.thread]
+        for thread in threads:
+            thread.stop()
+        for thread in threads:
+            thread.wait(timeout)
+
+    def _on_state_changed(self, job, state):
+        if job.is_active():
+            job.state = state
+            self.job_changed.emit(job)
+
+    def _on_progress(self, job, progress):
+        self.metrics.job_progress(job.id, int(progress.downloaded_bytes or 0))
+        job.progress = progress
+        self.job_changed.emit(job)
+
+    def record_history(self, job):
+        if self.history is None:
+            return
+        try:
+            self.history_added.emit(self.history.record_job(job))
+        except Exception as e:
+            ConfigManager.log_download(f"Не удалось записать историю: {str(e)}", False, job=job.id)
+
+    def total_speed(self):
+        return sum(
+            job.progress.speed or 0 for job in self._running.values()
+            if job.progress and job.progress.status == 'downloading'
+        )
+
+    def _on_finished(self, job, success, message):
+        # Сигнал приходит из run(), поэтому дожидаемся фактического завершения потока
+        job.thread.wait()
+        if self._closed:
+            return
+        stopped = not success and not job.cancel_requested
+        restart = job.restart_requested
+        job.restart_requested = False
+        if stopped and (job.pause_requested or job.preempted):
+            self._park(job)
+            return
+        job.pause_requested = job.preempted = False
+        if stopped and restart:
+            self._launch(job)
+            return
+        if stopped and self._retry_later(job, message):
+            return
+        self._running.pop(job.id, None)
+        job.finished_at = time.time()
+        if job.cancel_requested:
+            job.state = DownloadJob.CANCELLED
+            job.message = "Загрузка отменена пользователем"
+        else:
+            job.state = DownloadJob.DONE if success else DownloadJob.FAILED
+            job.message = message
+            retries = sum(job.retries.values())
+            if not success and retries:
+                job.message += f" (после повторов: {retries})"
+        info = job.thread.info
+        job.timings = job.thread.timings
+        job.title = info.get('title') or job.title
+        job.filepath = info.get('filepath') or job.filepath
+        if not job.video_key and info.get('extractor_key') and info.get('id'):
+            job.video_key = make_video_key(info['extractor_key'], info['id'])
+        if job.state == DownloadJob.DONE:
+            self._index_key(job)
+        else:
+            self._release_key(job)
+        self.record_history(job)
+        self.metrics.record_job(job)
+        # Итоговое сообщение идёт через ту же очередь, что и вывод потока,
+        # чтобы оказаться в консоли после всех его строк
+        self.output.put((job.id, job.message))
+        self.job_changed.emit(job)
+        self.job_finished.emit(job)
+        job.thread = None
+        if job.state == DownloadJob.DONE and self.archive is not None and job.options.download_archive:
+            self.archive.refresh()
+        if job.parent:
+            self._update_playlist(job.parent)
+        self._slot_freed()
+        self.export_metrics(force=not self.has_active())
+
+    def _retry_later(self, job, message):
+        job.error_class = job.thread.error_class
+        delay = self.retry.next_delay(job, job.error_class, time.monotonic())
+        if delay is None:
+            return False
+        self._running.pop(job.id, None)
+        job.thread = None
+        job.state = DownloadJob.RETRYING
+        job.retry_at = time.monotonic() + delay
+        label = ErrorClassifier.LABELS.get(job.error_class, job.error_class)
+        attempt = job.retries[job.error_class]
+        job.message = (f"{message}. Повтор через {format_seconds(delay)} "
+                       f"({label}, попытка {attempt} из {self.retry.policy(job.error_class).retries})")
+        self._waiting[job.id] = job
+        self.metrics.record_retry(job.error_class)
+        self.output.put((job.id, job.message))
+        ConfigManager.log_download(f"{job.url}: {job.message}", False, job=job.id, error=job.error_class)
+        self.job_changed.emit(job)
+        self._slot_freed()
+        self._arm_retry_timer()
+        return True
+
+    def _arm_retry_timer(self):
+        # Один таймер на все ожидающие задачи: до ближайшего повтора или до конца паузы хоста
+        deadlines = [job.retry_at for job in self._waiting.values()]
+        release = self.retry.next_release(time.monotonic())
+        if release is not None and self.pending_count():
+            deadlines.append(release)
+        if not deadlines or self._closed:
+            self.retry_timer.stop()
+            return
+        self.retry_timer.start(max(0, int((min(deadlines) - time.monotonic()) * 1000)) + 50)
+
+    def _retry_due(self):
+        now = time.monotonic()
+        for job in [job for job in self._waiting.values() if job.retry_at <= now]:
+            del self._waiting[job.id]
+            job.state = DownloadJob.QUEUED
+            job.retry_at = None
+            self._queue_pending(job, front=True)
+            self.job_changed.emit(job)
+        self._schedule()
+        self._arm_retry_timer()
+
+    def _park(self, job):
+        self._running.pop(job.id, None)
+        job.thread = None
+        if job.pause_requested:
+            job.state = DownloadJob.PAUSED
+            job.message = "Приостановлено"
+        else:
+            job.state = DownloadJob.QUEUED
+            job.message = "Ожидает: уступила место более срочной загрузке"
+            self._queue_pending(job, front=True)
+        job.pause_requested = job.preempted = False
+        self.output.put((job.id, job.message))
+        self.job_changed.emit(job)
+        self._slot_freed()
+
+    def _slot_freed(self):
+        self._schedule()
+        # Освободившуюся долю остальным задачам раздаст таймер ограничения скорости
+        if not self._running:
+            self.bandwidth.stop()
+
+    def metrics_text(self):
+        return self.metrics.to_prometheus(self.running_count(), self.pending_count(), self.bandwidth.limit)
+
+    def export_metrics(self, force=False):
+        # Файл для textfile-коллектора node_exporter; путь задаётся ключом metrics_file
+        path = ConfigManager.get_setting('metrics_file')
+        now = time.monotonic()
+        if not path or (not force and now - self._metrics_written < self.METRICS_WRITE_INTERVAL):
+            return
+        self._metrics_written = now
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.metrics_text())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            ConfigManager.log_download(f"Не удалось записать метрики в {path}: {str(e)}", False)
+
+class JobTableModel(QAbstractTableModel):
+    HEADERS = ["#", "URL", "Состояние", "Прогресс", "Скорость", "Осталось", "Приоритет"]
+    PROGRESS_COLUMN = 3
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.jobs = []
+        self._rows = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.jobs)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        job = self.jobs[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return job.id
+            if column == 1:
+                return f"  ↳ {job.url}" if job.parent else job.url
+            if column == 2:
+                if job.is_playlist() and not job.is_finished():
+                    finished, _, total = job.playlist_counts()
+                    skipped = f", пропущено {job.skipped}" if job.skipped else ""
+                    return f"{job.state_label} ({finished}/{total}{skipped})"
+                return job.state_label
+            progress = job.progress
+            if column == 3:
+                if job.state == DownloadJob.DONE:
+                    return 100.0
+                if job.is_playlist():
+                    finished, _, total = job.playlist_counts()
+                    return finished * 100.0 / total if total else None
+                return progress.percent if progress else None
+            if column == 4 and job.state == DownloadJob.RUNNING and progress and progress.speed:
+                return f"{format_bytes(progress.speed)}/s"
+            if column == 5 and job.state == DownloadJob.RUNNING and progress:
+                return format_eta(progress.eta)
+            if column == 6 and job.priority != DownloadJob.PRIORITY_NORMAL:
+                return DownloadJob.PRIORITY_LABELS[job.priority]
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            if column == 2 and job.message:
+                return job.message
+            if column == 1:
+                return job.url
+            if column == 3 and job.progress:
+                progress = job.progress
+                text = f"{format_bytes(progress.downloaded_bytes)} / {format_bytes(progress.total_bytes)}"
+                if progress.fragment_count:
+                    text += f", фрагмент {progress.fragment_index}/{progress.fragment_count}"
+                return text
+        return None
+
+    def add_job(self, job):
+        row = len(self.jobs)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.jobs.append(job)
+        self._rows[job.id] = row
+        self.endInsertRows()
+
+    def update_job(self, job):
+        row = self._rows.get(job.id)
+        if row is not None:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def job_at(self, row):
+        return self.jobs[row]
+
+class AboutDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("О программе")
+        layout = QVBoxLayout()
+        label = QLabel(f"yt-dlp GUI\nВерсия {get_version()}\nГрафический интерфейс для yt-dlp")
+        layout.addWidget(label)
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok)
+        button_box.accepted.connect(self.accept)
+        layout.addWidget(button_box)
+        self.setLayout(layout)
+
+class ProgressBarDelegate(QStyledItemDelegate):
+    def paint(self, painter, option, index):
+        value = index.data(Qt.ItemDataRole.DisplayRole)
+        if value is None:
+            super().paint(painter, option, index)
+            return
+        bar = QStyleOptionProgressBar()
+        bar.rect = option.rect.adjusted(2, 2, -2, -2)
+        bar.minimum = 0
+        bar.maximum = 1000
+        bar.progress = int(value * 10)
+        bar.text = f"{value:.1f}%"
+        bar.textVisible = True
+        bar.state = option.state
+        QApplication.style().drawControl(QStyle.ControlElement.CE_ProgressBar, bar, painter)
+
+class ConsoleWidget(QPlainTextEdit):
+    MAX_LINES = 5000
+    # Строки, которые обновляют одно и то же состояние и должны перезаписывать друг друга.
+    # Прогресс самого yt-dlp идёт через --progress-template в таблицу задач и в консоль
+    # не попадает; сюда доходит только вывод внешних загрузчиков: статистика ffmpeg
+    # (frame=/size=, обновляется через \r) и сводки aria2c ([#gid ...])
+    PROGRESS_RE = re.compile(r'^(frame=\s*\d+|size=\s*\d+|\[#[0-9a-f]+ )')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setUndoRedoEnabled(False)
+        # Кольцевой буфер последних строк, из которого пересобирается документ
+        self.lines = deque(maxlen=self.MAX_LINES)
+        self._progress_job = None
+
+    def clear(self):
+        super().clear()
+        self.lines.clear()
+        self._progress_job = None
+
+    def append_output(self, lines):
+        # Внутри пачки от каждого прогресса задачи остаётся только последняя строка
+        entries = []
+        last_progress = {}
+        for job_id, line in lines:
+            is_progress = bool(self.PROGRESS_RE.match(line))
+            if is_progress:
+                previous = last_progress.get(job_id)
+                if previous is not None:
+                    entries[previous] = None
+                last_progress[job_id] = len(entries)
+            else:
+                last_progress.pop(job_id, None)
+            text = f"[#{job_id}] {line}" if job_id is not None else line
+            entries.append((job_id, text, is_progress))
+        entries = [entry for entry in entries if entry is not None][-self.MAX_LINES:]
+        if not entries:
+            return
+
+        last_job_id, _, last_is_progress = entries[-1]
+        first_job_id, first_text, first_is_progress = entries[0]
+        if first_is_progress and self._progress_job == first_job_id and self.lines:
+            # Последняя строка консоли — прогресс той же задачи: перезаписываем её
+            self.lines[-1] = first_text
+            cursor = QTextCursor(self.document())
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.movePosition(QTextCursor.MoveOperation.StartOfBlock, QTextCursor.MoveMode.KeepAnchor)
+            cursor.insertText(first_text)
+            entries = entries[1:]
+        self._progress_job = last_job_id if last_is_progress else None
+        if not entries:
+            return
+
+        texts = [text for _, text, _ in entries]
+        self.lines.extend(texts)
+        scroll_bar = self.verticalScrollBar()
+        following = scroll_bar.value() >= scroll_bar.maximum()
+        # Документ растёт до двух буферов и затем пересобирается из кольца одним
+        # setPlainText. По benchmark_console.py это в 4 раза быстрее setMaximumBlockCount,
+        # который обрезает документ на каждой вставке, а удаление старых блоков курсором
+        # ещё медленнее. Пересборка сбрасывает выделение и прокрутку, поэтому, пока
+        # пользователь выделяет текст или читает историю выше, она откладывается
+        # (документ при этом ограничен четырьмя буферами)
+        blocks = self.document().blockCount() + len(texts)
+        busy = self.textCursor().hasSelection() or not following
+        if blocks > 2 * self.MAX_LINES and (not busy or blocks > 4 * self.MAX_LINES):
+            self.setPlainText('\n'.join(self.lines))
+        else:
+            self.appendPlainText('\n'.join(texts))
+        if following:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+def read_dropped_text(mime_data):
+    # Из перетаскивания берём текст, ссылки и содержимое локальных .txt файлов
+    chunks = []
+    for url in mime_data.urls():
+        if url.isLocalFile():
+            path = url.toLocalFile()
+            if path.lower().endswith('.txt'):
+                try:
+                    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                        chunks.append(f.read())
+                except OSError:
+                    pass
+        else:
+            chunks.append(url.toString())
+    if not chunks and mime_data.hasText():
+        chunks.append(mime_data.text())
+    return "\n".join(chunks)
+
+class BulkAddDialog(QDialog):
+    def __init__(self, parent=None, text=""):
+        super().__init__(parent)
+        self.setWindowTitle("Добавить список URL")
+        self.setMinimumSize(600, 400)
+        self.parent = parent
+        self.urls = []
+        self.setAcceptDrops(True)
+        self.setup_ui()
+        if text:
+            self.text_input.setPlainText(text)
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        hint = QLabel("Вставьте текст со ссылками или перетащите сюда .txt файл. "
+                      "Ссылки будут найдены в тексте, приведены к единому виду и проверены на дубликаты.")
+        hint.setWordWrap(True)
+        layout.addWidget(hint)
+
+        self.text_input = QPlainTextEdit()
+        self.text_input.setAcceptDrops(False)
+        self.text_input.textChanged.connect(self.update_count)
+        layout.addWidget(self.text_input)
+
+        bottom_layout = QHBoxLayout()
+        self.count_label = QLabel("Найдено ссылок: 0")
+        bottom_layout.addWidget(self.count_label)
+        bottom_layout.addStretch()
+        open_button = QPushButton("Открыть файл...")
+        open_button.clicked.connect(self.open_file)
+        bottom_layout.addWidget(open_button)
+        layout.addLayout(bottom_layout)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        button_box.button(QDialogButtonBox.StandardButton.Ok).setText("Добавить в очередь")
+        button_box.accepted.connect(self.on_accept)
+        button_box.rejected.connect(self.reject)
+        layout.addWidget(button_box)
+
+        self.setLayout(layout)
+
+    def collect_urls(self):
+        urls = []
+        seen = set()
+        for url in extract_urls(self.text_input.toPlainText()):
+            url = normalize_url(url)
+            if url not in seen:
+                seen.add(url)
+                urls.append(url)
+        return urls
+
+    def update_count(self):
+        found = len(extract_urls(self.text_input.toPlainText()))
+        unique = len(self.collect_urls())
+        self.count_label.setText(f"Найдено ссылок: {found}, уникальных: {unique}")
+
+    def append_text(self, text):
+        current = self.text_input.toPlainText()
+        self.text_input.setPlainText(f"{current}\n{text}" if current.strip() else text)
+
+    def open_file(self):
+        file, _ = QFileDialog.getOpenFileName(self, "Открыть список URL", "", "Текстовые файлы (*.txt);;Все файлы (*)")
+        if file:
+            try:
+                with open(file, 'r', encoding='utf-8', errors='replace') as f:
+                    self.append_text(f.read())
+            except OSError as e:
+                QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать файл: {str(e)}")
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls() or event.mimeData().hasText():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        text = read_dropped_text(event.mimeData())
+        if text:
+            event.acceptProposedAction()
+            self.append_text(text)
+
+    def on_accept(self):
+        self.urls = self.collect_urls()
+        if not self.urls:
+            QMessageBox.warning(self, "Ошибка", "В тексте не найдено ни одной ссылки (http:// или https://)")
+            return
         self.accept()
 
-class DownloadThread(QThread):
-    output_received = pyqtSignal(str)
-    finished = pyqtSignal(bool, str)
+class HistoryTableModel(QAbstractTableModel):
+    HEADERS = ["Дата", "Название", "URL", "Состояние", "Размер", "Время", "Скорость"]
+    PAGE_SIZE = 200
 
-    def __init__(self, url):
-        super().__init__()
-        self.url = url
-        self._is_running = True
-        self.process = None
-        self.log_buffer = []
-        self.buffer_lock = False
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.records = []
+        self.search = ""
+        self.status = None
+        self._exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    # Записи подгружаются страницами, когда представление докручено до конца,
+    # поэтому открытие истории не зависит от её размера
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        before_id = self.records[-1].id if self.records else None
+        page = self.store.page(self.search, self.status, before_id, self.PAGE_SIZE)
+        if len(page) < self.PAGE_SIZE:
+            self._exhausted = True
+        if page:
+            row = len(self.records)
+            self.beginInsertRows(QModelIndex(), row, row + len(page) - 1)
+            self.records.extend(page)
+            self.endInsertRows()
+
+    def set_filter(self, search, status):
+        self.beginResetModel()
+        self.search = search
+        self.status = status
+        self.records = []
+        self._exhausted = False
+        self.endResetModel()
+
+    def matches(self, record):
+        if self.status and record.status != self.status:
+            return False
+        search = self.search.lower()
+        return not search or search in (record.title or "").lower() or search in record.url.lower()
 
-    def run(self):
-        try:
-            cmd = [ConfigManager.get_ytdlp_path(), "--config-location", ConfigManager.CONFIG_FILE, self.url]
-            ConfigManager.log_download(f"Запуск команды: {' '.join(cmd)}")
+    def add_record(self, record):
+        if not self.matches(record):
+            return False
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.records.insert(0, record)
+        self.endInsertRows()
+        return True
 
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1,
-                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-            )
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return datetime.fromtimestamp(record.finished_at).strftime("%Y-%m-%d %H:%M")
+            if column == 1:
+                return record.title or (os.path.basename(record.filepath) if record.filepath else "")
+            if column == 2:
+                return record.url
+            if column == 3:
+                return DownloadJob.STATE_LABELS.get(record.status, record.status)
+            if column == 4:
+                return format_bytes(record.bytes)
+            if column == 5:
+                return format_eta(record.duration)
+            if column == 6 and record.speed:
+                return f"{format_bytes(record.speed)}/s"
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            if column == 1 and record.filepath:
+                return record.filepath
+            if column == 2:
+                return record.url
+            if column == 3 and record.message:
+                return record.message
+        return None
+
+    def record_at(self, row):
+        return self.records[row]
+
+class HistoryDialog(QDialog):
+    SEARCH_DELAY_MS = 250
+    STATUS_FILTERS = [
+        ("Все", None),
+        (DownloadJob.STATE_LABELS[DownloadJob.DONE], DownloadJob.DONE),
+        (DownloadJob.STATE_LABELS[DownloadJob.FAILED], DownloadJob.FAILED),
+        (DownloadJob.STATE_LABELS[DownloadJob.CANCELLED], DownloadJob.CANCELLED),
+    ]
+
+    def __init__(self, parent, store):
+        super().__init__(parent)
+        self.setWindowTitle("История загрузок")
+        self.setMinimumSize(900, 500)
+        self.parent = parent
+        self.store = store
+        self.total = 0
+        self.model = HistoryTableModel(store, self)
+        # Поиск запускается после паузы в наборе, а не на каждую букву
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.apply_filter)
+        self.setup_ui()
+        self.apply_filter()
 
-            while self._is_running:
-                output = self.process.stdout.readline()
-                if output == '' and self.process.poll() is not None:
-                    break
-                if output:
-                    self.add_to_buffer(output.strip())
+    def setup_ui(self):
+        layout = QVBoxLayout()
 
-            return_code = self.process.wait()
-            success = return_code == 0
-            msg = "Загрузка завершена успешно!" if success else f"Ошибка (код {return_code})"
-            self.finished.emit(success, msg)
-            ConfigManager.log_download(self.url, success)
+        filter_layout = QHBoxLayout()
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Поиск по названию или URL")
+        self.search_input.textChanged.connect(self.search_timer.start)
+        filter_layout.addWidget(self.search_input, stretch=1)
+        self.status_combo = QComboBox()
+        for label, status in self.STATUS_FILTERS:
+            self.status_combo.addItem(label, status)
+        self.status_combo.currentIndexChanged.connect(self.apply_filter)
+        filter_layout.addWidget(self.status_combo)
+        layout.addLayout(filter_layout)
+
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.view.verticalHeader().setVisible(False)
+        # Ширина по содержимому пересчитывалась бы по всем загруженным строкам
+        self.view.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.view.setColumnWidth(0, 120)
+        self.view.setColumnWidth(2, 260)
+        self.view.doubleClicked.connect(lambda index: self.open_file())
+        layout.addWidget(self.view)
+
+        bottom_layout = QHBoxLayout()
+        self.count_label = QLabel()
+        bottom_layout.addWidget(self.count_label)
+        bottom_layout.addStretch()
+        requeue_button = QPushButton("Скачать снова")
+        requeue_button.clicked.connect(self.requeue)
+        bottom_layout.addWidget(requeue_button)
+        open_file_button = QPushButton("Открыть файл")
+        open_file_button.clicked.connect(self.open_file)
+        bottom_layout.addWidget(open_file_button)
+        open_folder_button = QPushButton("Открыть папку")
+        open_folder_button.clicked.connect(self.open_folder)
+        bottom_layout.addWidget(open_folder_button)
+        close_button = QPushButton("Закрыть")
+        close_button.clicked.connect(self.close)
+        bottom_layout.addWidget(close_button)
+        layout.addLayout(bottom_layout)
 
-        except Exception as e:
-            self.add_to_buffer(f"Исключение: {str(e)}")
-            self.finished.emit(False, f"Исключение: {str(e)}")
-            ConfigManager.log_download(self.url, False)
+        self.setLayout(layout)
 
-    def add_to_buffer(self, message):
-        while self.buffer_lock:
-            QThread.msleep(10)
-        self.buffer_lock = True
-        self.log_buffer.append(message)
-        self.buffer_lock = False
-        self.output_received.emit("")
+    def apply_filter(self):
+        search = self.search_input.text().strip()
+        status = self.status_combo.currentData()
+        self.model.set_filter(search, status)
+        self.update_count()
+
+    def update_count(self):
+        # COUNT(*) с фильтром проходит всю таблицу, поэтому выполняется только при смене фильтра
+        self.total = self.store.count(self.model.search, self.model.status)
+        self.show_count()
+
+    def show_count(self):
+        self.count_label.setText(f"Записей: {self.total}")
+
+    def add_record(self, record):
+        if self.model.add_record(record):
+            self.total += 1
+            self.show_count()
+
+    def selected_records(self):
+        rows = sorted({index.row() for index in self.view.selectionModel().selectedRows()})
+        return [self.model.record_at(row) for row in rows]
+
+    def requeue(self):
+        records = self.selected_records()
+        if not records:
+            QMessageBox.information(self, "История загрузок", "Выберите записи для повторной загрузки")
+            return
+        # Повторная загрузка из истории - явный запрос, проверка по истории её не отсекает
+        self.parent.add_urls(list(dict.fromkeys(record.url for record in records)), redownload=True)
 
-    def stop(self):
-        self._is_running = False
-        if self.process:
-            self.process.terminate()
+    def selected_file(self):
+        records = self.selected_records()
+        if not records:
+            return None
+        record = records[0]
+        if not record.filepath or not os.path.exists(record.filepath):
+            QMessageBox.warning(self, "Ошибка", "Файл не найден. Возможно, он был перемещён или удалён")
+            return None
+        return record.filepath
 
-class AboutDialog(QDialog):
-    def __init__(self, parent=None):
+    def open_file(self):
+        path = self.selected_file()
+        if path:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(path))
+
+    def open_folder(self):
+        path = self.selected_file()
+        if path:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.dirname(os.path.abspath(path))))
+
+def format_seconds(seconds):
+    if seconds is None:
+        return ""
+    if seconds < 60:
+        return f"{seconds:.1f} с"
+    return format_eta(seconds)
+
+class StatsDialog(QDialog):
+    REFRESH_MS = 1000
+    HEADERS = ["#", "Экстрактор", "Состояние", "Извлечение", "Первый байт", "Загрузка", "Обработка", "Скорость"]
+
+    def __init__(self, parent, queue):
         super().__init__(parent)
-        self.setWindowTitle("О программе")
+        self.setWindowTitle("Статистика загрузок")
+        self.setMinimumSize(760, 420)
+        self.queue = queue
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(self.REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.setup_ui()
+
+    def setup_ui(self):
         layout = QVBoxLayout()
-        label = QLabel(f"yt-dlp GUI\nВерсия {get_version()}\nГрафический интерфейс для yt-dlp")
-        layout.addWidget(label)
-        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok)
-        button_box.accepted.connect(self.accept)
+
+        summary_layout = QFormLayout()
+        self.current_label = QLabel()
+        self.window_labels = {window: QLabel() for window in DownloadMetrics.WINDOWS}
+        self.jobs_label = QLabel()
+        self.total_label = QLabel()
+        summary_layout.addRow("Скорость сейчас:", self.current_label)
+        for window, label in self.window_labels.items():
+            summary_layout.addRow(f"Средняя за {window} с:", label)
+        summary_layout.addRow("Задачи:", self.jobs_label)
+        summary_layout.addRow("Скачано за сеанс:", self.total_label)
+        layout.addLayout(summary_layout)
+
+        self.recent_table = QTableWidget(0, len(self.HEADERS))
+        self.recent_table.setHorizontalHeaderLabels(self.HEADERS)
+        self.recent_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.recent_table.verticalHeader().setVisible(False)
+        self.recent_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.recent_table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.recent_table)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        button_box.rejected.connect(self.close)
         layout.addWidget(button_box)
+
         self.setLayout(layout)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.refresh_timer.start()
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        metrics = self.queue.metrics
+        self.current_label.setText(f"{format_bytes(self.queue.total_speed())}/s")
+        for window, label in self.window_labels.items():
+            label.setText(f"{format_bytes(metrics.throughput(window))}/s")
+        finished = sum(metrics.jobs.values())
+        failed = sum(count for (_, state), count in metrics.jobs.items() if state == DownloadJob.FAILED)
+        self.jobs_label.setText(
+            f"активно {self.queue.running_count()}, в очереди {self.queue.pending_count()}, "
+            f"завершено {finished}, с ошибкой {failed}")
+        self.total_label.setText(format_bytes(metrics.downloaded_bytes))
+
+        recent = list(metrics.recent)
+        self.recent_table.setRowCount(len(recent))
+        for row, (job_id, extractor, state, timings) in enumerate(recent):
+            speed = timings.speed
+            values = [
+                str(job_id), extractor, DownloadJob.STATE_LABELS.get(state, state),
+                format_seconds(timings.extraction), format_seconds(timings.ttfb),
+                format_seconds(timings.download), format_seconds(timings.postprocess),
+                f"{format_bytes(speed)}/s" if speed else "",
+            ]
+            for column, value in enumerate(values):
+                self.recent_table.setItem(row, column, QTableWidgetItem(value))
+
+class ControlServer(QObject):
+    # Локальный JSON API запущенного окна; через него повторный запуск передаёт URL
+    HOST = "127.0.0.1"
+    DEFAULT_PORT = 9595
+    APP_NAME = "yt-dlp-gui"
+    MAX_HEADER_SIZE = 16 * 1024
+    MAX_BODY_SIZE = 1024 * 1024
+    MAX_URLS_PER_REQUEST = 500
+    RATE_LIMIT = 10.0
+    RATE_BURST = 50
+    ALLOWED_HOSTS = ("127.0.0.1", "localhost")
+    # Страницы сайтов не должны управлять загрузками; расширения браузера - могут
+    ALLOWED_ORIGINS = ("chrome-extension://", "moz-extension://", "safari-web-extension://")
+    STATUS_TEXT = {
+        200: "OK",
+        400: "Bad Request",
+        403: "Forbidden",
+        404: "Not Found",
+        405: "Method Not Allowed",
+        413: "Payload Too Large",
+        415: "Unsupported Media Type",
+        429: "Too Many Requests",
+    }
+
+    def __init__(self, window, port=None):
+        super().__init__(window)
+        self.window = window
+        self.port = int(port or self.DEFAULT_PORT)
+        # QtNetwork загружается только при включении API
+        self.server = None
+        self._buffers = {}
+        self._tokens = float(self.RATE_BURST)
+        self._tokens_updated = time.monotonic()
+        self.routes = {
+            ('GET', '/api/ping'): self.api_ping,
+            ('GET', '/api/stats'): self.api_stats,
+            ('GET', '/api/jobs'): self.api_jobs,
+            ('POST', '/api/enqueue'): self.api_enqueue,
+            ('POST', '/api/cancel'): self.api_cancel,
+            ('POST', '/api/pause'): self.api_pause,
+            ('POST', '/api/resume'): self.api_resume,
+            ('POST', '/api/priority'): self.api_priority,
+            ('POST', '/api/activate'): self.api_activate,
+            ('GET', '/metrics'): self.api_metrics,
+        }
+
+    @classmethod
+    def request_headers(cls):
+        headers = {"Content-Type": "application/json", "Host": cls.HOST}
+        token = ConfigManager.get_setting('api_token')
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return headers
+
+    @classmethod
+    def forward_to_running(cls, port, urls):
+        # Если окно уже открыто, передаём ему URL и поднимаем его вместо запуска второй копии
+        import http.client
+
+        port = int(port or cls.DEFAULT_PORT)
+        try:
+            conn = http.client.HTTPConnection(cls.HOST, port, timeout=2)
+            conn.request("GET", "/api/ping", headers=cls.request_headers())
+            response = conn.getresponse()
+            if response.status != 200 or json.loads(response.read()).get('app') != cls.APP_NAME:
+                return False
+            if urls:
+                conn.request("POST", "/api/enqueue", body=json.dumps({'urls': urls}), headers=cls.request_headers())
+                conn.getresponse().read()
+            conn.request("POST", "/api/activate", body="{}", headers=cls.request_headers())
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except (OSError, ValueError, http.client.HTTPException):
+            return False
+
+    def start(self):
+        from PyQt6.QtNetwork import QTcpServer, QHostAddress
+
+        if self.server is None:
+            self.server = QTcpServer(self)
+            self.server.newConnection.connect(self.on_new_connection)
+        return self.server.listen(QHostAddress(self.HOST), self.port)
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+
+    def is_listening(self):
+        return self.server is not None and self.server.isListening()
+
+    def on_new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self._buffers[socket] = b""
+            socket.readyRead.connect(lambda socket=socket: self.on_ready_read(socket))
+            socket.disconnected.connect(lambda socket=socket: self.on_disconnected(socket))
+
+    def on_disconnected(self, socket):
+        self._buffers.pop(socket, None)
+        socket.deleteLater()
+
+    def on_ready_read(self, socket):
+        if socket not in self._buffers:
+            socket.readAll()
+            return
+        data = self._buffers[socket] + bytes(socket.readAll())
+        self._buffers[socket] = data
+
+        header_end = data.find(b"\r\n\r\n")
+        if header_end < 0:
+            if len(data) > self.MAX_HEADER_SIZE:
+                self.respond(socket, 413, {'error': 'headers_too_large'})
+            return
+
+        try:
+            request_line, *header_lines = data[:header_end].decode('latin-1').split("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            self.respond(socket, 400, {'error': 'bad_request'})
+            return
+
+        if length > self.MAX_BODY_SIZE:
+            self.respond(socket, 413, {'error': 'body_too_large'})
+            return
+        body = data[header_end + 4:]
+        if len(body) < length:
+            return
+
+        status, payload = self.handle(method, path, headers, body[:length])
+        self.respond(socket, status, payload)
+
+    def respond(self, socket, status, payload):
+        self._buffers.pop(socket, None)
+        if isinstance(payload, str):
+            # Текстовый формат экспозиции Prometheus
+            body = payload.encode('utf-8')
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            content_type = "application/json; charset=utf-8"
+        head = (
+            f"HTTP/1.1 {status} {self.STATUS_TEXT[status]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n"
+        )
+        if status == 429:
+            head += "Retry-After: 1\r\n"
+        socket.write(head.encode('latin-1') + b"\r\n" + body)
+        socket.disconnectFromHost()
+
+    def allow_request(self):
+        # Token bucket: всплеск до RATE_BURST запросов, дальше не чаще RATE_LIMIT в секунду
+        now = time.monotonic()
+        self._tokens = min(self.RATE_BURST, self._tokens + (now - self._tokens_updated) * self.RATE_LIMIT)
+        self._tokens_updated = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def handle(self, method, path, headers, body):
+        origin = headers.get('origin')
+        if origin and not origin.startswith(self.ALLOWED_ORIGINS):
+            return 403, {'error': 'forbidden_origin'}
+        # Проверка Host защищает от DNS rebinding: чужой домен, указывающий на 127.0.0.1
+        if headers.get('host', '').rsplit(':', 1)[0] not in self.ALLOWED_HOSTS:
+            return 403, {'error': 'forbidden_host'}
+        token = ConfigManager.get_setting('api_token')
+        if token and headers.get('authorization') != f"Bearer {token}":
+            return 403, {'error': 'invalid_token'}
+        if not self.allow_request():
+            return 429, {'error': 'rate_limited'}
+
+        path = path.split('?', 1)[0]
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(route_path == path for _, route_path in self.routes):
+                return 405, {'error': 'method_not_allowed'}
+            return 404, {'error': 'not_found'}
+        if method != 'POST':
+            return handler()
+
+        # Обязательный application/json: браузер не отправит такой запрос со страницы без preflight
+        if headers.get('content-type', '').split(';')[0].strip().lower() != 'application/json':
+            return 415, {'error': 'expected_json'}
+        try:
+            data = json.loads(body.decode('utf-8') or '{}')
+        except (UnicodeDecodeError, ValueError):
+            return 400, {'error': 'invalid_json'}
+        if not isinstance(data, dict):
+            return 400, {'error': 'invalid_json'}
+        return handler(data)
+
+    def job_to_dict(self, job):
+        progress = job.progress
+        return {
+            'id': job.id,
+            'url': job.url,
+            'state': job.state,
+            'priority': job.priority,
+            'parent': job.parent.id if job.parent else None,
+            'percent': progress.percent if progress else None,
+            'speed': progress.speed if progress and job.is_active() else None,
+            'eta': progress.eta if progress and job.is_active() else None,
+            'message': job.message,
+        }
+
+    def api_ping(self):
+        return 200, {'app': self.APP_NAME, 'version': get_version()}
+
+    def api_stats(self):
+        queue = self.window.download_queue
+        states = {}
+        for job in queue.jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        return 200, {
+            'running': queue.running_count(),
+            'pending': queue.pending_count(),
+            'waiting_retry': queue.waiting_count(),
+            'max_workers': queue.max_workers,
+            'total_speed': queue.total_speed(),
+            'states': states,
+            'throughput': {f"{window}s": queue.metrics.throughput(window) for window in DownloadMetrics.WINDOWS},
+            'downloaded_bytes': queue.metrics.downloaded_bytes,
+            'bandwidth_limit': queue.bandwidth.limit,
+            'history': queue.history.stats() if queue.history is not None else None,
+        }
+
+    def api_metrics(self):
+        return 200, self.window.download_queue.metrics_text()
+
+    def api_jobs(self):
+        return 200, {'jobs': [self.job_to_dict(job) for job in self.window.download_queue.jobs]}
+
+    def api_enqueue(self, data):
+        urls = data.get('urls')
+        if urls is None and data.get('url'):
+            urls = [data['url']]
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) for url in urls):
+            return 400, {'error': 'expected_urls'}
+        if len(urls) > self.MAX_URLS_PER_REQUEST:
+            return 413, {'error': 'too_many_urls', 'limit': self.MAX_URLS_PER_REQUEST}
+        priority = self.parse_priority(data.get('priority', 'normal'))
+        if priority is None:
+            return 400, {'error': 'invalid_priority', 'allowed': list(DownloadJob.PRIORITY_NAMES)}
+
+        results = []
+        for url, job, reason, message in self.window.enqueue_urls(urls, priority):
+            if job:
+                results.append({'url': url, 'job': job.id})
+            else:
+                results.append({'url': url, 'skipped': reason, 'message': message})
+        added = sum(1 for result in results if 'job' in result)
+        if added:
+            self.window.status_bar.showMessage(f"Получено через API: {added} URL", 3000)
+        return 200, {'results': results}
+
+    def api_cancel(self, data):
+        queue = self.window.download_queue
+        if data.get('all'):
+            queue.cancel_all()
+        else:
+            job = self.find_job(data)
+            if job is None:
+                return 404, {'error': 'job_not_found'}
+            queue.cancel(job)
+        self.window.update_controls()
+        return 200, {'ok': True}
+
+    @staticmethod
+    def parse_priority(value):
+        # "high"/"normal"/"low" или число 1/0/-1
+        if isinstance(value, str):
+            value = DownloadJob.PRIORITY_NAMES.get(value)
+        if isinstance(value, int) and not isinstance(value, bool) and value in DownloadJob.PRIORITIES:
+            return value
+        return None
+
+    def find_job(self, data):
+        return next((job for job in self.window.download_queue.jobs if job.id == data.get('id')), None)
+
+    def api_pause(self, data):
+        job = self.find_job(data)
+        if job is None:
+            return 404, {'error': 'job_not_found'}
+        self.window.pause_jobs([job])
+        return 200, {'ok': True}
+
+    def api_resume(self, data):
+        job = self.find_job(data)
+        if job is None:
+            return 404, {'error': 'job_not_found'}
+        self.window.resume_jobs([job])
+        return 200, {'ok': True}
+
+    def api_priority(self, data):
+        job = self.find_job(data)
+        if job is None:
+            return 404, {'error': 'job_not_found'}
+        priority = self.parse_priority(data.get('priority'))
+        if priority is None:
+            return 400, {'error': 'invalid_priority', 'allowed': list(DownloadJob.PRIORITY_NAMES)}
+        self.window.download_queue.set_priority(job, priority)
+        return 200, {'ok': True}
+
+    def api_activate(self, data):
+        self.window.showNormal()
+        self.window.raise_()
+        self.window.activateWindow()
+        return 200, {'ok': True}
+
 class YTDLPGUI(QMainWindow):
+    CONSOLE_FRAME_MS = 16
+    CONSOLE_FRAME_BUDGET = 0.008
+    CONSOLE_MAX_LINES_PER_FRAME = 5000
+
     def __init__(self):
         super().__init__()
         ConfigManager.init_config()
@@ -668,16 +4725,59 @@ class YTDLPGUI(QMainWindow):
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
         self.status_bar.showMessage("Готов к работе")
+        self.throughput_label = QLabel()
+        self.status_bar.addPermanentWidget(self.throughput_label)
         
         self.init_hidden_widgets()
-        self.check_ytdlp_available()
+        self.metadata_cache = MetadataCache()
+        self.download_archive = DownloadArchive()
+        self.download_queue = DownloadQueue(ConfigManager.get_setting('max_workers'), self)
+        self.job_model = JobTableModel(self)
+        self.download_queue.archive = self.download_archive
+        self.history = HistoryStore()
+        self.history_dialog = None
+        self.stats_dialog = None
+        self.download_queue.history = self.history
+        self.download_queue.metadata_cache = self.metadata_cache
+        self.download_queue.job_added.connect(self.job_model.add_job)
+        self.download_queue.job_changed.connect(self.job_model.update_job)
+        self.download_queue.job_finished.connect(self.download_finished)
+        self.journal = JobJournal()
+        restored = self.journal.open()
+        if restored is not None:
+            self.journal.attach(self.download_queue)
+        self.update_checker = None
+        self.ffmpeg_installer = None
+        self.ffmpeg_progress_dialog = None
+        self.background_tasks = set()
+        self.ytdlp_downloader = None
+        self.ytdlp_progress_dialog = None
+        self.metadata_thread = None
+        self.saving_config = False
+        ConfigManager.config().changed.connect(self.on_config_changed)
+        self.control_server = ControlServer(self, ConfigManager.get_setting('api_port'))
+        startup_profile.mark("Модели и очередь")
+
         self.setup_ui()
+        startup_profile.mark("Построение интерфейса")
         self.load_config()
+        startup_profile.mark("Загрузка конфигурации")
+        # Проверка и возможная загрузка yt-dlp начинаются, когда окно уже показано
+        QTimer.singleShot(0, self.check_ytdlp_available)
+        if restored:
+            QTimer.singleShot(0, lambda: self.restore_jobs(restored))
+        elif restored is None:
+            QTimer.singleShot(0, lambda: self.status_bar.showMessage(
+                "Журнал задач используется другим процессом: незавершённые задачи не восстановлены", 10000))
 
         self.console_update_timer = QTimer(self)
-        self.console_update_timer.setInterval(100)
+        self.console_update_timer.setInterval(self.CONSOLE_FRAME_MS)
         self.console_update_timer.timeout.connect(self.update_console)
 
+        self.throughput_timer = QTimer(self)
+        self.throughput_timer.setInterval(500)
+        self.throughput_timer.timeout.connect(self.update_throughput)
+
         self.url_input.returnPressed.connect(self.start_download)
         self.paste_btn.setShortcut("Ctrl+V")
 
@@ -709,15 +4809,13 @@ class YTDLPGUI(QMainWindow):
         self.ffmpeg_location_input = QLineEdit()
 
     def update_console(self):
-        if hasattr(self, 'thread') and self.thread and not self.thread.buffer_lock:
-            self.thread.buffer_lock = True
-            if self.thread.log_buffer:
-                self.console_output.append('\n'.join(self.thread.log_buffer))
-                self.thread.log_buffer.clear()
-                self.console_output.verticalScrollBar().setValue(
-                    self.console_output.verticalScrollBar().maximum()
-                )
-            self.thread.buffer_lock = False
+        lines = self.download_queue.drain_output(self.CONSOLE_FRAME_BUDGET, self.CONSOLE_MAX_LINES_PER_FRAME)
+        if not lines:
+            if not self.download_queue.has_active():
+                self.console_update_timer.stop()
+            return
+
+        self.console_output.append_output(lines)
 
     def check_ytdlp_available(self):
         if not ConfigManager.check_ytdlp_exists():
@@ -725,29 +4823,38 @@ class YTDLPGUI(QMainWindow):
             self.download_ytdlp()
 
     def download_ytdlp(self):
+        if self.ytdlp_downloader is not None:
+            self.ytdlp_progress_dialog.show()
+            return
+
         url = YTDLP_DOWNLOAD_URL
         if os.name == 'nt':
             url += ".exe"
 
         destination = ConfigManager.get_ytdlp_path()
 
+        # Немодальный диалог: окно остаётся доступным, пока yt-dlp скачивается
         progress_dialog = QProgressDialog("Загрузка yt-dlp...", "Отмена", 0, 100, self)
         progress_dialog.setWindowTitle("Загрузка yt-dlp")
-        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setWindowModality(Qt.WindowModality.NonModal)
         progress_dialog.setAutoClose(True)
 
         downloader = DownloaderThread(url, destination)
         downloader.progress.connect(progress_dialog.setValue)
-        downloader.finished.connect(
-            lambda success, msg: self.on_ytdlp_download_finished(success, msg, progress_dialog)
-        )
+        downloader.finished.connect(self.on_ytdlp_download_finished)
         progress_dialog.canceled.connect(downloader.stop)
-        downloader.start()
 
-        progress_dialog.exec()
+        self.ytdlp_downloader = downloader
+        self.ytdlp_progress_dialog = progress_dialog
+        downloader.start()
+        progress_dialog.show()
 
-    def on_ytdlp_download_finished(self, success, message, progress_dialog):
-        progress_dialog.close()
+    def on_ytdlp_download_finished(self, success, message):
+        self.ytdlp_downloader.wait()
+        self.ytdlp_downloader = None
+        self.ytdlp_progress_dialog.close()
+        self.ytdlp_progress_dialog.deleteLater()
+        self.ytdlp_progress_dialog = None
 
         if success:
             if os.name != 'nt':
@@ -756,24 +4863,38 @@ class YTDLPGUI(QMainWindow):
         else:
             self.status_bar.showMessage(f"Ошибка загрузки: {message}", 5000)
 
+    def run_in_background(self, probe, callback):
+        # Проверки инструментов запускают внешние процессы и не должны блокировать окно
+        thread = ToolProbeThread(probe)
+        self.background_tasks.add(thread)
+
+        def on_finished(result):
+            thread.wait()
+            self.background_tasks.discard(thread)
+            callback(result)
+
+        thread.finished.connect(on_finished)
+        thread.start()
+
     def check_for_ytdlp_updates(self):
-        current_version = ConfigManager.get_ytdlp_version()
-        if not current_version:
-            self.status_bar.showMessage("Не удалось определить текущую версию yt-dlp", 5000)
+        if self.update_checker is not None:
             return
 
         self.status_bar.showMessage("Проверка обновлений yt-dlp...", 3000)
 
         self.update_checker = UpdateChecker()
-        self.update_checker.finished.connect(
-            lambda success, msg, latest_version: self.on_update_check_finished(
-                success, msg, current_version, latest_version)
-        )
+        self.update_checker.finished.connect(self.on_update_check_finished)
         self.update_checker.start()
 
     def on_update_check_finished(self, success, message, current_version, latest_version):
+        self.update_checker.wait()
+        self.update_checker = None
+
         if not success:
-            self.status_bar.showMessage(f"Ошибка проверки обновлений: {message}", 5000)
+            if current_version:
+                self.status_bar.showMessage(f"Ошибка проверки обновлений: {message}", 5000)
+            else:
+                self.status_bar.showMessage(message, 5000)
             return
 
         if latest_version and latest_version != current_version:
@@ -792,7 +4913,12 @@ class YTDLPGUI(QMainWindow):
             self.status_bar.showMessage(f"Установлена последняя версия yt-dlp: {current_version}", 5000)
 
     def check_ffmpeg_availability(self):
-        if ConfigManager.check_ffmpeg_exists():
+        self.status_bar.showMessage("Проверка FFmpeg...")
+        path = ConfigManager.get_ffmpeg_path()
+        self.run_in_background(lambda: ConfigManager.check_ffmpeg_exists(path), self.on_ffmpeg_checked)
+
+    def on_ffmpeg_checked(self, exists):
+        if exists:
             self.status_bar.showMessage("FFmpeg найден в системе", 5000)
         else:
             self.status_bar.showMessage("FFmpeg не найден. Укажите путь в 'Инструменты -> Указать FFmpeg' или установите FFmpeg", 5000)
@@ -805,12 +4931,20 @@ class YTDLPGUI(QMainWindow):
             self.ffmpeg_location_input.setText(folder)
             self.save_config()
             self.status_bar.showMessage(f"Путь к FFmpeg установлен: {folder}", 5000)
-            if ConfigManager.check_ffmpeg_exists():
-                self.status_bar.showMessage("FFmpeg успешно проверен", 5000)
-            else:
-                self.status_bar.showMessage("FFmpeg не найден в указанной папке", 5000)
+            path = ConfigManager.get_ffmpeg_path()
+            self.run_in_background(lambda: ConfigManager.check_ffmpeg_exists(path), self.on_ffmpeg_location_checked)
+
+    def on_ffmpeg_location_checked(self, exists):
+        if exists:
+            self.status_bar.showMessage("FFmpeg успешно проверен", 5000)
+        else:
+            self.status_bar.showMessage("FFmpeg не найден в указанной папке", 5000)
 
     def install_ffmpeg(self):
+        if self.ffmpeg_installer is not None:
+            self.ffmpeg_progress_dialog.show()
+            return
+
         reply = QMessageBox.question(
             self,
             "Установка FFmpeg",
@@ -819,145 +4953,51 @@ class YTDLPGUI(QMainWindow):
         )
 
         if reply == QMessageBox.StandardButton.Yes:
-            try:
-                headers = {"User-Agent": USER_AGENT}
-                response = requests.get(FFMPEG_RELEASES_URL, headers=headers)
-                response.raise_for_status()
-
-                release_info = response.json()
-                download_url = None
-                asset_name = None
-
-                if os.name == 'nt':
-                    target = "ffmpeg-master-latest-win64-gpl.zip"
-                elif sys.platform == 'darwin':
-                    target = "ffmpeg-master-latest-macos64-gpl.zip"
-                else:
-                    target = "ffmpeg-master-latest-linux64-gpl.tar.xz"
-
-                for asset in release_info['assets']:
-                    if asset['name'] == target:
-                        download_url = asset['browser_download_url']
-                        asset_name = asset['name']
-                        break
-
-                if not download_url:
-                    self.status_bar.showMessage(f"Не удалось найти сборку FFmpeg ({target})", 5000)
-                    return
-
-                self.status_bar.showMessage(f"Скачивание {asset_name}...", 3000)
-                self.download_and_install_ffmpeg(download_url)
-
-            except Exception as e:
-                self.status_bar.showMessage(f"Ошибка получения сборки FFmpeg: {str(e)}", 5000)
-
-    def download_and_install_ffmpeg(self, download_url):
-        temp_dir = tempfile.mkdtemp()
-        archive_ext = '.zip' if os.name == 'nt' or sys.platform == 'darwin' else '.tar.xz'
-        archive_path = os.path.join(temp_dir, f"ffmpeg{archive_ext}")
-
-        progress_dialog = QProgressDialog("Загрузка FFmpeg...", "Отмена", 0, 100, self)
-        progress_dialog.setWindowTitle("Загрузка FFmpeg")
-        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
-        progress_dialog.setAutoClose(True)
-
-        downloader = DownloaderThread(download_url, archive_path)
-        downloader.progress.connect(progress_dialog.setValue)
-        downloader.finished.connect(
-            lambda success, msg: self.on_ffmpeg_download_finished(success, msg, progress_dialog, archive_path, temp_dir)
-        )
-        progress_dialog.canceled.connect(downloader.stop)
-        downloader.start()
-
-        progress_dialog.exec()
-
-    def on_ffmpeg_download_finished(self, success, message, progress_dialog, archive_path, temp_dir):
-        progress_dialog.close()
+            # Поиск сборки, загрузка, распаковка и проверка идут в одном рабочем потоке;
+            # диалог не модальный для цикла событий, окно продолжает обновляться
+            progress_dialog = QProgressDialog("Поиск сборки FFmpeg...", "Отмена", 0, 100, self)
+            progress_dialog.setWindowTitle("Установка FFmpeg")
+            progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+            progress_dialog.setAutoClose(False)
+            progress_dialog.setAutoReset(False)
+            progress_dialog.setMinimumDuration(0)
+
+            installer = FFmpegInstallerThread()
+            installer.stage_changed.connect(progress_dialog.setLabelText)
+            installer.stage_changed.connect(lambda stage: progress_dialog.setValue(0))
+            installer.progress.connect(progress_dialog.setValue)
+            installer.finished.connect(self.on_ffmpeg_install_finished)
+            progress_dialog.canceled.connect(installer.stop)
+
+            self.ffmpeg_installer = installer
+            self.ffmpeg_progress_dialog = progress_dialog
+            installer.start()
+            progress_dialog.show()
+
+    def on_ffmpeg_install_finished(self, success, message):
+        installer = self.ffmpeg_installer
+        installer.wait()
+        self.ffmpeg_installer = None
+        self.ffmpeg_progress_dialog.close()
+        self.ffmpeg_progress_dialog.deleteLater()
+        self.ffmpeg_progress_dialog = None
 
         if not success:
-            self.status_bar.showMessage(f"Ошибка загрузки FFmpeg: {message}", 5000)
-            shutil.rmtree(temp_dir, ignore_errors=True)
-            return
-
-        archive_size_mb = os.path.getsize(archive_path) / (1024 * 1024)
-        if archive_size_mb < 10:
-            self.status_bar.showMessage(f"Скачанный архив слишком маленький ({archive_size_mb:.2f} МБ). Возможно, он поврежден.", 5000)
-            ConfigManager.log_download(f"Скачанный архив слишком маленький ({archive_size_mb:.2f} МБ). Возможно, он поврежден.", False)
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            self.status_bar.showMessage(f"Ошибка установки FFmpeg: {message}", 5000)
             return
 
-        try:
-            extract_dir = os.path.join(temp_dir, "extracted")
-            os.makedirs(extract_dir, exist_ok=True)
-
-            if archive_path.endswith('.zip'):
-                with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                    zip_ref.extractall(extract_dir)
-            else:
-                with tarfile.open(archive_path, 'r:xz') as tar_ref:
-                    tar_ref.extractall(extract_dir)
-
-            script_dir = os.path.dirname(os.path.abspath(__file__)) if not hasattr(sys, 'frozen') else os.path.dirname(sys.executable)
-            ffmpeg_dir = os.path.join(script_dir, "ffmpeg")
-            if not os.access(script_dir, os.W_OK):
-                self.status_bar.showMessage("Нет прав на запись в директорию скрипта. Укажите другой путь для FFmpeg.", 5000)
-                shutil.rmtree(temp_dir, ignore_errors=True)
-                return
-
-            os.makedirs(ffmpeg_dir, exist_ok=True)
-
-            ffmpeg_files = ['ffmpeg', 'ffprobe']
-            if os.name == 'nt':
-                ffmpeg_files = ['ffmpeg.exe', 'ffprobe.exe']
-
-            found_files = []
-            for root, _, files in os.walk(extract_dir):
-                for file in files:
-                    if file in ffmpeg_files:
-                        file_path = os.path.join(root, file)
-                        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-                        ConfigManager.log_download(f"Найден {file} по пути {file_path}, размер: {file_size_mb:.2f} MB")
-                        if file_size_mb < 10:
-                            self.status_bar.showMessage(f"Файл {file} слишком маленький ({file_size_mb:.2f} МБ). Возможно, архив поврежден.", 5000)
-                            ConfigManager.log_download(f"Файл {file} слишком маленький ({file_size_mb:.2f} МБ). Возможно, архив поврежден.", False)
-                            shutil.rmtree(temp_dir, ignore_errors=True)
-                            return
-                        found_files.append(file_path)
-
-            if len(found_files) < 2:
-                self.status_bar.showMessage("Не удалось найти ffmpeg и/или ffprobe в архиве", 5000)
-                shutil.rmtree(temp_dir, ignore_errors=True)
-                return
-
-            for src_path in found_files:
-                dest_path = os.path.join(ffmpeg_dir, os.path.basename(src_path))
-                shutil.move(src_path, dest_path)
-                if os.name != 'nt':
-                    os.chmod(dest_path, 0o755)
-                final_size_mb = os.path.getsize(dest_path) / (1024 * 1024)
-                ConfigManager.log_download(f"Перемещен {os.path.basename(src_path)} в {dest_path}, размер: {final_size_mb:.2f} MB")
-
-            self.ffmpeg_location_input.setText(ffmpeg_dir)
-            self.save_config()
-
-            if ConfigManager.check_ffmpeg_exists():
-                version = ConfigManager.get_ffmpeg_version()
-                if version:
-                    self.status_bar.showMessage(f"FFmpeg успешно проверен (версия: {version})", 5000)
-                else:
-                    self.status_bar.showMessage("FFmpeg установлен, но версия не определена", 5000)
-            else:
-                self.status_bar.showMessage("Установленный FFmpeg недействителен. Укажите другой путь.", 5000)
+        self.ffmpeg_location_input.setText(installer.ffmpeg_dir)
+        self.save_config()
 
-        except Exception as e:
-            self.status_bar.showMessage(f"Ошибка установки FFmpeg: {str(e)}", 5000)
-            ConfigManager.log_download(f"Ошибка установки FFmpeg: {str(e)}", False)
-        finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+        if installer.version:
+            self.status_bar.showMessage(f"FFmpeg успешно проверен (версия: {installer.version})", 5000)
+        else:
+            self.status_bar.showMessage("FFmpeg установлен, но версия не определена", 5000)
 
     def setup_ui(self):
         self.setWindowTitle("yt-dlp GUI")
         self.setMinimumSize(700, 500)
+        self.setAcceptDrops(True)
         self.resize(800, 600)
 
         self.create_menus()
@@ -969,6 +5009,17 @@ class YTDLPGUI(QMainWindow):
         menubar = self.menuBar()
 
         file_menu = menubar.addMenu("Файл")
+        bulk_add_action = QAction("Добавить список URL...", self)
+        bulk_add_action.setShortcut("Ctrl+Shift+V")
+        bulk_add_action.triggered.connect(lambda: self.show_bulk_add())
+        file_menu.addAction(bulk_add_action)
+        file_menu.addSeparator()
+
+        history_action = QAction("История загрузок...", self)
+        history_action.setShortcut("Ctrl+H")
+        history_action.triggered.connect(self.show_history)
+        file_menu.addAction(history_action)
+
         open_log_action = QAction("Открыть лог", self)
         open_log_action.triggered.connect(self.open_log_file)
         file_menu.addAction(open_log_action)
@@ -1010,6 +5061,31 @@ class YTDLPGUI(QMainWindow):
         cookies_action.triggered.connect(self.show_cookies_settings)
         params_menu.addAction(cookies_action)
 
+        workers_action = QAction("Параллельные загрузки...", self)
+        workers_action.triggered.connect(self.show_workers_settings)
+        params_menu.addAction(workers_action)
+
+        bandwidth_action = QAction("Ограничение скорости...", self)
+        bandwidth_action.triggered.connect(self.show_bandwidth_settings)
+        params_menu.addAction(bandwidth_action)
+
+        self.expand_playlists_action = QAction("Разбивать плейлисты на отдельные загрузки", self, checkable=True)
+        self.expand_playlists_action.setChecked(ConfigManager.get_setting('expand_playlists', True))
+        self.expand_playlists_action.toggled.connect(lambda checked: ConfigManager.set_setting('expand_playlists', checked))
+        params_menu.addAction(self.expand_playlists_action)
+
+        self.use_archive_action = QAction("Вести архив загрузок (пропускать скачанное)", self, checkable=True)
+        self.use_archive_action.setChecked(ConfigManager.get_setting('use_archive', True))
+        self.use_archive_action.toggled.connect(lambda checked: ConfigManager.set_setting('use_archive', checked))
+        params_menu.addAction(self.use_archive_action)
+
+        self.api_action = QAction(f"Локальный API (127.0.0.1:{self.control_server.port})", self, checkable=True)
+        self.api_action.setChecked(ConfigManager.get_setting('api_enabled', True))
+        self.api_action.toggled.connect(self.set_api_enabled)
+        params_menu.addAction(self.api_action)
+        if self.api_action.isChecked():
+            self.set_api_enabled(True)
+
         advanced_menu = params_menu.addMenu("Дополнительно")
         
         self.no_overwrite_action = QAction("Не перезаписывать файлы", advanced_menu, checkable=True)
@@ -1050,6 +5126,16 @@ class YTDLPGUI(QMainWindow):
         install_ffmpeg_action.triggered.connect(self.install_ffmpeg)
         tools_menu.addAction(install_ffmpeg_action)
 
+        tools_menu.addSeparator()
+
+        video_info_action = QAction("Информация о видео", self)
+        video_info_action.triggered.connect(self.show_video_info)
+        tools_menu.addAction(video_info_action)
+
+        stats_action = QAction("Статистика загрузок...", self)
+        stats_action.triggered.connect(self.show_stats)
+        tools_menu.addAction(stats_action)
+
         help_menu = menubar.addMenu("Помощь")
         docs_action = QAction("Документация", self)
         docs_action.triggered.connect(self.open_documentation)
@@ -1063,6 +5149,13 @@ class YTDLPGUI(QMainWindow):
         checkbox.setChecked(checked)
         self.save_config()
 
+    def set_api_enabled(self, enabled):
+        ConfigManager.set_setting('api_enabled', enabled)
+        if not enabled:
+            self.control_server.stop()
+        elif not self.control_server.is_listening() and not self.control_server.start():
+            self.status_bar.showMessage(f"Порт {self.control_server.port} занят, локальный API не запущен", 5000)
+
     def show_output_settings(self):
         dialog = OutputSettingsDialog(self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
@@ -1084,6 +5177,26 @@ class YTDLPGUI(QMainWindow):
             self.save_config()
             self.status_bar.showMessage("Настройки cookies обновлены", 3000)
 
+    def show_workers_settings(self):
+        count, ok = QInputDialog.getInt(
+            self, "Параллельные загрузки", "Количество одновременных загрузок:",
+            self.download_queue.max_workers, 1, 64
+        )
+        if ok:
+            self.download_queue.set_max_workers(count)
+            ConfigManager.set_setting('max_workers', count)
+            self.status_bar.showMessage(f"Одновременных загрузок: {count}", 3000)
+
+    def show_bandwidth_settings(self):
+        dialog = BandwidthSettingsDialog(self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            ConfigManager.set_setting('bandwidth_limit', dialog.limit)
+            ConfigManager.set_setting('bandwidth_schedule', dialog.rules)
+            bandwidth = self.download_queue.bandwidth
+            bandwidth.reload()
+            bandwidth.rebalance(force=True)
+            self.status_bar.showMessage(f"Ограничение скорости сейчас: {format_rate(bandwidth.limit)}", 3000)
+
     def setup_main_interface(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -1117,26 +5230,59 @@ class YTDLPGUI(QMainWindow):
         self.cancel_btn = QPushButton("Отменить")
         self.cancel_btn.clicked.connect(self.cancel_download)
         self.cancel_btn.setEnabled(False)
+
+        self.pause_btn = QPushButton("Пауза")
+        self.pause_btn.setToolTip("Приостановить или продолжить выделенные загрузки")
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.pause_btn.setEnabled(False)
         
         self.open_dir_btn = QPushButton("Папка")
         self.open_dir_btn.clicked.connect(self.open_download_folder)
         self.open_dir_btn.setEnabled(False)
         
         for btn in [self.clear_btn, self.paste_btn, self.download_btn, 
-                   self.cancel_btn, self.open_dir_btn]:
+                   self.cancel_btn, self.pause_btn, self.open_dir_btn]:
             btn.setFixedSize(80, 28)
             buttons_layout.addWidget(btn)
         
         buttons_layout.addStretch()
+        buttons_layout.addWidget(QLabel("Приоритет:"))
+        self.priority_combo = QComboBox()
+        self.priority_combo.setToolTip("Приоритет новых загрузок: срочные обходят очередь и при нехватке мест приостанавливают менее важные")
+        for priority in DownloadJob.PRIORITIES:
+            self.priority_combo.addItem(DownloadJob.PRIORITY_LABELS[priority], priority)
+        self.priority_combo.setCurrentIndex(self.priority_combo.findData(DownloadJob.PRIORITY_NORMAL))
+        buttons_layout.addWidget(self.priority_combo)
         url_layout.addLayout(buttons_layout)
         main_layout.addWidget(url_group)
+
+        queue_group = QGroupBox("Очередь загрузок")
+        queue_layout = QVBoxLayout(queue_group)
+        queue_layout.setContentsMargins(8, 12, 8, 12)
+
+        self.job_view = QTableView()
+        self.job_view.setModel(self.job_model)
+        self.job_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.job_view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.job_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.job_view.verticalHeader().setVisible(False)
+        self.job_view.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
+        self.job_view.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.job_view.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
+        self.job_view.setItemDelegateForColumn(JobTableModel.PROGRESS_COLUMN, ProgressBarDelegate(self.job_view))
+        self.job_view.setColumnWidth(JobTableModel.PROGRESS_COLUMN, 140)
+        self.job_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.job_view.customContextMenuRequested.connect(self.show_job_menu)
+        self.job_view.selectionModel().selectionChanged.connect(lambda: self.update_controls())
+        queue_layout.addWidget(self.job_view)
+
+        main_layout.addWidget(queue_group, stretch=1)
         
         console_group = QGroupBox("Вывод")
         console_layout = QVBoxLayout(console_group)
         console_layout.setContentsMargins(8, 12, 8, 12)
         
-        self.console_output = QTextEdit()
-        self.console_output.setReadOnly(True)
+        self.console_output = ConsoleWidget()
         self.console_output.setPlaceholderText("Здесь будет отображаться ход загрузки...")
         console_layout.addWidget(self.console_output)
         
@@ -1176,14 +5322,14 @@ class YTDLPGUI(QMainWindow):
             QMenu::item:selected {
                 background-color: #e0e0e0;
             }
-            QLineEdit, QComboBox, QTextEdit {
+            QLineEdit, QComboBox, QPlainTextEdit {
                 border: 1px solid #ddd;
                 border-radius: 4px;
                 padding: 6px;
                 background: white;
                 selection-background-color: #e0e0e0;
             }
-            QLineEdit:focus, QComboBox:focus, QTextEdit:focus {
+            QLineEdit:focus, QComboBox:focus, QPlainTextEdit:focus {
                 border: 1px solid #4d90fe;
             }
             QLineEdit[valid="false"] {
@@ -1215,7 +5361,7 @@ class YTDLPGUI(QMainWindow):
             QLabel {
                 color: #333;
             }
-            QTextEdit {
+            QPlainTextEdit {
                 font-family: monospace;
                 font-size: 10pt;
             }
@@ -1247,6 +5393,10 @@ class YTDLPGUI(QMainWindow):
     def paste_url(self):
         clipboard = QGuiApplication.clipboard()
         url = clipboard.text().strip()
+        if len(extract_urls(url)) > 1:
+            # Несколько ссылок в буфере - открываем массовое добавление вместо поля URL
+            self.show_bulk_add(url)
+            return
         if url:
             self.url_input.setText(url)
             self.status_bar.showMessage("URL вставлен из буфера обмена", 3000)
@@ -1271,8 +5421,8 @@ class YTDLPGUI(QMainWindow):
             self.status_bar.showMessage("Папка не найдена", 5000)
 
     def load_config(self):
-        config_text = ConfigManager.load_config()
-        if config_text is None:
+        params = ConfigManager.load_params()
+        if params is None:
             self.template_input.setText("%(title)s.%(ext)s")
             self.path_input.setText(str(Path.home() / "Videos"))
             self.merge_combo.setCurrentText("mp4")
@@ -1284,7 +5434,6 @@ class YTDLPGUI(QMainWindow):
             self.cookies_none_rb.setChecked(True)
             self.ffmpeg_location_input.clear()
         else:
-            params = ConfigManager.parse_config(config_text)
             self.template_input.setText(params['output'])
             self.path_input.setText(params['paths'])
             self.merge_combo.setCurrentText(params['merge_format'])
@@ -1327,45 +5476,52 @@ class YTDLPGUI(QMainWindow):
         self.metadata_action.setChecked(self.metadata_check.isChecked())
         self.thumbnail_action.setChecked(self.thumbnail_check.isChecked())
 
-    def save_config(self):
-        config_lines = []
-
-        config_lines.append(f'--output "{self.template_input.text()}"')
-        config_lines.append(f'--paths "{self.path_input.text()}"')
-        config_lines.append(f'--merge-output-format {self.merge_combo.currentText()}')
-
+    def collect_options(self):
+        proxy = None
         if self.proxy_use_rb.isChecked() and self.proxy_address_input.text().strip():
-            config_lines.append(f'--proxy {self.proxy_type_combo.currentText()}://{self.proxy_address_input.text().strip()}')
+            proxy = f"{self.proxy_type_combo.currentText()}://{self.proxy_address_input.text().strip()}"
 
+        cookies = None
+        cookies_from_browser = None
         if self.cookies_file_rb.isChecked() and self.cookies_file_input.text().strip():
-            config_lines.append(f'--cookies "{self.cookies_file_input.text().strip()}"')
+            cookies = self.cookies_file_input.text().strip()
         elif self.cookies_browser_rb.isChecked():
             browser = self.browser_combo.currentText()
             profile = self.browser_profile_input.text().strip()
-            if profile:
-                config_lines.append(f'--cookies-from-browser {browser}:{profile}')
-            else:
-                config_lines.append(f'--cookies-from-browser {browser}')
-
-        if self.no_overwrite_check.isChecked():
-            config_lines.append('--no-overwrites')
-        if self.sponsorblock_check.isChecked():
-            config_lines.append('--sponsorblock-remove all')
-        if self.metadata_check.isChecked():
-            config_lines.append('--add-metadata')
-        if self.thumbnail_check.isChecked():
-            config_lines.append('--embed-thumbnail')
-
-        if self.ffmpeg_location_input.text().strip():
-            config_lines.append(f'--ffmpeg-location "{self.ffmpeg_location_input.text().strip()}"')
-
-        config_text = "\n".join(config_lines)
-        if ConfigManager.save_config(config_text):
-            self.status_bar.showMessage("Конфигурация успешно сохранена", 3000)
+            cookies_from_browser = f"{browser}:{profile}" if profile else browser
+
+        return DownloadOptions(
+            output=self.template_input.text(),
+            paths=self.path_input.text(),
+            merge_format=self.merge_combo.currentText(),
+            proxy=proxy,
+            cookies=cookies,
+            cookies_from_browser=cookies_from_browser,
+            no_overwrites=self.no_overwrite_check.isChecked(),
+            sponsorblock_remove=self.sponsorblock_check.isChecked(),
+            add_metadata=self.metadata_check.isChecked(),
+            embed_thumbnail=self.thumbnail_check.isChecked(),
+            ffmpeg_location=self.ffmpeg_location_input.text().strip() or None,
+            download_archive=self.download_archive.path if self.use_archive_action.isChecked() else None,
+            extra_args=ConfigManager.config().extra_args
+        )
+
+    def save_config(self):
+        self.saving_config = True
+        try:
+            if ConfigManager.config().update(self.collect_options()):
+                self.status_bar.showMessage("Конфигурация успешно сохранена", 3000)
             return True
-        else:
+        except OSError:
             self.status_bar.showMessage("Не удалось сохранить конфигурацию", 5000)
             return False
+        finally:
+            self.saving_config = False
+
+    def on_config_changed(self):
+        # Файл изменили вне GUI (импорт, сброс или правка вручную) - обновляем виджеты
+        if not self.saving_config:
+            self.load_config()
 
     def set_proxy_enabled(self, enabled):
         self.proxy_type_combo.setEnabled(enabled)
@@ -1377,57 +5533,258 @@ class YTDLPGUI(QMainWindow):
         self.browser_profile_input.setEnabled(enabled and mode == 'browser')
 
     def start_download(self):
+        job, _, message = self.enqueue_url(self.url_input.text().strip())
+        if job:
+            self.url_input.clear()
+            self.status_bar.showMessage(message, 3000)
+        else:
+            self.status_bar.showMessage(message, 5000)
+
+    def enqueue_url(self, url):
+        # Общая точка входа для поля URL и локального API: (задача, причина отказа, сообщение)
+        return self.enqueue_urls([url])[0][1:]
+
+    def enqueue_urls(self, urls, priority=None, redownload=False):
+        # Настройки, архив и ключи задач в очереди собираются один раз на весь список,
+        # поэтому добавление тысячи ссылок не перебирает очередь для каждой
+        if priority is None:
+            priority = self.priority_combo.currentData()
+        if not ConfigManager.check_ytdlp_exists():
+            message = "yt-dlp не найден. Скачайте его через меню 'Инструменты'"
+            return [(url, None, 'no_ytdlp', message) for url in urls]
+
+        options = self.collect_options()
+        expand_playlists = self.expand_playlists_action.isChecked()
+        known = {}
+        for job in self.download_queue.jobs:
+            if job.state not in (DownloadJob.FAILED, DownloadJob.CANCELLED):
+                known.setdefault(job.url, job)
+                if job.video_key:
+                    known.setdefault(job.video_key, job)
+
+        results = []
+        for url in urls:
+            url = url.strip()
+            if not url or not re.match(r'^https?://', url):
+                results.append((url, None, 'invalid_url', "Введите корректный URL (начинающийся с http:// или https://)"))
+                continue
+
+            url = normalize_url(url)
+            video_key = extract_video_key(url) or self.metadata_cache.key_for_url(url) or self.history.key_for_url(url)
+            if not redownload and self.download_queue.is_downloaded(video_key, options):
+                results.append((url, None, 'archived', "Это видео уже скачано ранее (есть в истории или архиве загрузок)"))
+                continue
+            duplicate = known.get(url) or (video_key and known.get(video_key))
+            if duplicate:
+                results.append((url, None, 'duplicate', f"Это видео уже в очереди (#{duplicate.id})"))
+                continue
+
+            if expand_playlists and looks_like_playlist(url):
+                job = self.download_queue.enqueue_playlist(url, options, priority)
+                message = "Плейлист добавлен: видео появятся в очереди по мере разбора"
+            else:
+                job = self.download_queue.enqueue(url, options, video_key, priority=priority)
+                message = "Загрузка добавлена в очередь"
+            known[url] = job
+            if video_key:
+                known[video_key] = job
+            results.append((url, job, None, message))
+
+        if any(job for _, job, _, _ in results):
+            self.console_update_timer.start()
+            self.throughput_timer.start()
+            self.update_controls()
+        return results
+
+    def add_urls(self, urls, redownload=False):
+        results = self.enqueue_urls(urls, redownload=redownload)
+        if len(results) == 1:
+            _, job, _, message = results[0]
+            self.status_bar.showMessage(message, 3000 if job else 5000)
+            return results
+
+        added = sum(1 for _, job, _, _ in results if job)
+        reasons = {}
+        for _, job, reason, _ in results:
+            if reason:
+                reasons[reason] = reasons.get(reason, 0) + 1
+        labels = {
+            'duplicate': "уже в очереди",
+            'archived': "уже скачаны",
+            'invalid_url': "некорректные",
+            'no_ytdlp': "yt-dlp не найден",
+        }
+        skipped = ", ".join(f"{labels[reason]}: {count}" for reason, count in reasons.items())
+        self.status_bar.showMessage(f"Добавлено в очередь: {added}" + (f"; пропущено - {skipped}" if skipped else ""), 5000)
+        return results
+
+    def show_bulk_add(self, text=""):
+        dialog = BulkAddDialog(self, text)
+        if dialog.exec() == QDialog.DialogCode.Accepted and dialog.urls:
+            self.add_urls(dialog.urls)
+
+    def show_history(self):
+        if self.history_dialog is None:
+            self.history_dialog = HistoryDialog(self, self.history)
+            self.download_queue.history_added.connect(self.history_dialog.add_record)
+        self.history_dialog.show()
+        self.history_dialog.raise_()
+        self.history_dialog.activateWindow()
+
+    def show_stats(self):
+        if self.stats_dialog is None:
+            self.stats_dialog = StatsDialog(self, self.download_queue)
+        self.stats_dialog.show()
+        self.stats_dialog.raise_()
+        self.stats_dialog.activateWindow()
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls() or event.mimeData().hasText():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        text = read_dropped_text(event.mimeData())
+        urls = extract_urls(text)
+        if urls:
+            event.acceptProposedAction()
+            self.add_urls(urls)
+        else:
+            self.status_bar.showMessage("В перетащенных данных не найдено ссылок", 5000)
+
+    def current_video_info(self):
+        url = self.url_input.text().strip()
+        if not url:
+            return None
+        return self.metadata_cache.get(url)
+
+    def show_video_info(self):
         url = self.url_input.text().strip()
         if not url or not re.match(r'^https?://', url):
             self.status_bar.showMessage("Введите корректный URL (начинающийся с http:// или https://)", 5000)
             return
 
-        if not ConfigManager.check_ytdlp_exists():
-            self.status_bar.showMessage("yt-dlp не найден. Скачайте его через меню 'Инструменты'", 5000)
+        if self.metadata_thread is not None and self.metadata_thread.isRunning():
+            self.status_bar.showMessage("Информация о видео уже запрашивается", 3000)
             return
 
-        if self.save_config():
-            self.status_bar.showMessage("Настройки сохранены. Начинаю загрузку...", 3000)
-        else:
-            return
+        self.status_bar.showMessage("Получение информации о видео...")
+        self.metadata_thread = MetadataThread(url, self.collect_options(), self.metadata_cache)
+        self.metadata_thread.finished.connect(self.on_video_info_received)
+        self.metadata_thread.start()
 
-        self.console_output.clear()
-        self.toggle_controls(False)
-        
-        self.console_update_timer.start()
+    def on_video_info_received(self, success, message, info):
+        self.metadata_thread.wait()
+        if not success:
+            self.status_bar.showMessage(message, 5000)
+            return
 
-        self.thread = DownloadThread(url)
-        self.thread.output_received.connect(self.update_console)
-        self.thread.finished.connect(self.download_finished)
-        self.thread.start()
+        lines = [f"Название: {info.get('title', 'NA')}"]
+        if info.get('uploader'):
+            lines.append(f"Автор: {info['uploader']}")
+        if info.get('duration'):
+            lines.append(f"Длительность: {format_eta(info['duration'])}")
+        if info.get('_type') == 'playlist':
+            lines.append(f"Плейлист: {len(info.get('entries') or [])} видео")
+        elif info.get('formats'):
+            lines.append(f"Доступно форматов: {len(info['formats'])}")
+        self.console_output.append_output([(None, line) for line in lines])
+        self.status_bar.showMessage(message, 3000)
+
+    def selected_jobs(self):
+        rows = {index.row() for index in self.job_view.selectionModel().selectedRows()}
+        return [self.job_model.job_at(row) for row in sorted(rows)]
+
+    def show_job_menu(self, pos):
+        jobs = [job for job in self.selected_jobs() if not job.is_finished()]
+        if not jobs:
+            return
+        menu = QMenu(self)
+        menu.addAction("Пауза", lambda: self.pause_jobs(jobs))
+        menu.addAction("Продолжить", lambda: self.resume_jobs(jobs))
+        priority_menu = menu.addMenu("Приоритет")
+        for priority in DownloadJob.PRIORITIES:
+            action = priority_menu.addAction(DownloadJob.PRIORITY_LABELS[priority],
+                                             lambda priority=priority: self.set_jobs_priority(jobs, priority))
+            action.setCheckable(True)
+            action.setChecked(all(job.priority == priority for job in jobs))
+        menu.addSeparator()
+        menu.addAction("Отменить", lambda: [self.download_queue.cancel(job) for job in jobs])
+        menu.exec(self.job_view.viewport().mapToGlobal(pos))
+        self.update_controls()
+
+    def pause_jobs(self, jobs):
+        for job in jobs:
+            self.download_queue.pause(job)
+        self.status_bar.showMessage("Загрузки приостановлены: при продолжении докачаются с места остановки", 3000)
+
+    def resume_jobs(self, jobs):
+        for job in jobs:
+            self.download_queue.resume(job)
+        if self.download_queue.has_active():
+            self.console_update_timer.start()
+            self.throughput_timer.start()
+        self.update_controls()
+
+    def set_jobs_priority(self, jobs, priority):
+        for job in jobs:
+            self.download_queue.set_priority(job, priority)
+
+    def toggle_pause(self):
+        jobs = [job for job in self.selected_jobs() if not job.is_finished()]
+        if not jobs:
+            jobs = [job for job in self.download_queue.jobs if not job.is_finished() and not job.parent]
+        paused = [job for job in jobs if job.state == DownloadJob.PAUSED or
+                  (job.is_playlist() and any(child.state == DownloadJob.PAUSED for child in job.children))]
+        if paused:
+            self.resume_jobs(paused)
+        else:
+            self.pause_jobs(jobs)
+        self.update_controls()
 
     def cancel_download(self):
-        if hasattr(self, 'thread') and self.thread:
-            self.thread.stop()
-            self.console_output.append("\nЗагрузка отменена пользователем\n")
-            self.toggle_controls(True)
-            self.console_update_timer.stop()
-            self.status_bar.showMessage("Загрузка отменена", 3000)
-
-    def download_finished(self, success, message):
-        QTimer.singleShot(200, self.console_update_timer.stop)
-        
-        self.update_console()
-        
-        self.console_output.append(f"\n{message}\n")
-        self.toggle_controls(True)
+        jobs = [job for job in self.selected_jobs() if not job.is_finished()]
+        if jobs:
+            for job in jobs:
+                self.download_queue.cancel(job)
+        else:
+            self.download_queue.cancel_all()
+        self.status_bar.showMessage("Загрузка отменена", 3000)
 
-        if success:
+    def download_finished(self, job):
+        self.update_controls()
+        if not self.console_update_timer.isActive():
+            self.console_update_timer.start()
+
+        if not self.download_queue.has_active():
+            self.throughput_timer.stop()
+        self.update_throughput()
+
+        if job.state == DownloadJob.DONE:
             self.status_bar.showMessage("Загрузка завершена успешно!", 5000)
             self.open_dir_btn.setEnabled(True)
-        else:
-            self.status_bar.showMessage(f"Ошибка загрузки: {message}", 5000)
-
-    def toggle_controls(self, enabled):
-        for widget in [self.url_input, self.paste_btn, self.clear_btn, self.download_btn, self.open_dir_btn]:
-            widget.setEnabled(enabled)
+        elif job.state == DownloadJob.FAILED:
+            self.status_bar.showMessage(f"Ошибка загрузки: {job.message}", 5000)
+
+    def update_throughput(self):
+        queue = self.download_queue
+        queue.export_metrics()
+        if not queue.has_active():
+            self.throughput_label.clear()
+            return
+        limit = f" (лимит {format_bytes(queue.bandwidth.limit)}/s)" if queue.bandwidth.limit else ""
+        waiting = f"  Ожидают повтора: {queue.waiting_count()}" if queue.waiting_count() else ""
+        self.throughput_label.setText(
+            f"Скорость: {format_bytes(queue.total_speed())}/s{limit}  "
+            f"Активно: {queue.running_count()}  В очереди: {queue.pending_count()}{waiting}"
+        )
 
-        self.cancel_btn.setEnabled(not enabled)
+    def update_controls(self):
+        unfinished = any(not job.is_finished() for job in self.download_queue.jobs)
+        self.cancel_btn.setEnabled(unfinished)
+        self.pause_btn.setEnabled(unfinished)
+        selected = [job for job in self.selected_jobs() if not job.is_finished()]
+        paused = selected and all(job.state == DownloadJob.PAUSED for job in selected)
+        self.pause_btn.setText("Продолжить" if paused else "Пауза")
 
     def open_log_file(self):
         if os.path.exists(ConfigManager.LOG_FILE):
@@ -1442,9 +5799,8 @@ class YTDLPGUI(QMainWindow):
         )
         if file:
             try:
-                with open(ConfigManager.CONFIG_FILE, 'r', encoding='utf-8') as src, \
-                     open(file, 'w', encoding='utf-8') as dst:
-                    dst.write(src.read())
+                with open(file, 'w', encoding='utf-8') as dst:
+                    dst.write(ConfigManager.config().text())
                 self.status_bar.showMessage("Настройки успешно экспортированы", 5000)
             except Exception as e:
                 self.status_bar.showMessage(f"Не удалось экспортировать настройки: {str(e)}", 5000)
@@ -1455,18 +5811,15 @@ class YTDLPGUI(QMainWindow):
         )
         if file:
             try:
-                with open(file, 'r', encoding='utf-8') as src, \
-                     open(ConfigManager.CONFIG_FILE, 'w', encoding='utf-8') as dst:
-                    dst.write(src.read())
-                self.load_config()
+                with open(file, 'r', encoding='utf-8') as src:
+                    ConfigManager.config().save_text(src.read())
                 self.status_bar.showMessage("Настройки успешно импортированы", 5000)
             except Exception as e:
                 self.status_bar.showMessage(f"Не удалось импортировать настройки: {str(e)}", 5000)
 
     def copy_command_line(self):
         url = self.url_input.text().strip() or "[URL]"
-        cmd = [ConfigManager.get_ytdlp_path(), "--config-location", ConfigManager.CONFIG_FILE, url]
-        cmd_text = " ".join(cmd)
+        cmd_text = format_command(self.collect_options().to_command(url))
 
         clipboard = QGuiApplication.clipboard()
         clipboard.setText(cmd_text)
@@ -1482,9 +5835,7 @@ class YTDLPGUI(QMainWindow):
 
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                with open(ConfigManager.CONFIG_FILE, 'w', encoding='utf-8') as f:
-                    f.write(ConfigManager.DEFAULT_CONFIG)
-                self.load_config()
+                ConfigManager.config().save_text(ConfigManager.DEFAULT_CONFIG)
                 self.status_bar.showMessage("Настройки сброшены к значениям по умолчанию", 5000)
             except Exception as e:
                 self.status_bar.showMessage(f"Не удалось сбросить настройки: {str(e)}", 5000)
@@ -1497,11 +5848,305 @@ class YTDLPGUI(QMainWindow):
         about_dialog = AboutDialog()
         about_dialog.exec()
 
+    def restore_jobs(self, records):
+        if not ConfigManager.check_ytdlp_exists():
+            # Записи остаются в журнале и будут восстановлены при следующем запуске
+            self.status_bar.showMessage("Незавершённые загрузки не восстановлены: yt-dlp не найден", 5000)
+            return
+        jobs = self.download_queue.restore(records)
+        pending = sum(1 for job in jobs if not job.is_finished() and not job.is_playlist())
+        ConfigManager.log_download(f"Восстановлено из журнала задач: {pending}")
+        self.status_bar.showMessage(f"Продолжены незавершённые загрузки: {pending}", 5000)
+        self.console_update_timer.start()
+        self.throughput_timer.start()
+        self.update_controls()
+
+    def stop_workers(self):
+        # Потоки окна не имеют родителя: уничтожение работающего QThread при выходе
+        # аварийно завершает приложение, поэтому их нужно остановить и дождаться.
+        # Обработчики завершения отключаются, чтобы после закрытия не всплывали диалоги
+        workers = [self.ytdlp_downloader, self.ffmpeg_installer, self.update_checker, self.metadata_thread]
+        workers = [worker for worker in workers + list(self.background_tasks)
+                   if worker is not None and worker.isRunning()]
+        for worker in workers:
+            try:
+                worker.finished.disconnect()
+            except TypeError:
+                pass
+            if hasattr(worker, 'stop'):
+                worker.stop()
+        for worker in workers:
+            worker.wait()
+
     def closeEvent(self, event):
+        # Незавершённые задачи остаются в журнале и продолжатся при следующем запуске
+        self.journal.detach()
+        self.stop_workers()
+        self.download_queue.shutdown()
+        self.journal.close()
+        self.control_server.stop()
+        self.history.close()
         super().closeEvent(event)
 
+class HeadlessRunner(QObject):
+    EXIT_OK = 0
+    EXIT_FAILED = 1
+    EXIT_USAGE = 2
+    EXIT_NO_YTDLP = 3
+    EXIT_INTERRUPTED = 130
+
+    OUTPUT_INTERVAL_MS = 100
+    PROGRESS_INTERVAL = 1.0
+
+    def __init__(self, options, max_workers, expand_playlists=True, verbose=False, stream=None,
+                 journal=None, parent=None):
+        super().__init__(parent)
+        self.options = options
+        self.journal = journal
+        self.expand_playlists = expand_playlists
+        self.verbose = verbose
+        self.stream = stream or sys.stdout
+        self.exit_code = None
+        self.interrupted = False
+        self._states = {}
+        self._progress_emitted = {}
+        # Нормализованные URL уже добавленных задач: у ссылок не с YouTube нет ключа
+        # видео, и без этого одна и та же ссылка из списка скачивалась бы дважды
+        self._known_urls = set()
+
+        self.queue = DownloadQueue(max_workers, self)
+        if options.download_archive:
+            self.queue.archive = DownloadArchive(options.download_archive)
+        self.queue.history = HistoryStore()
+        self.queue.job_added.connect(self.on_job_added)
+        self.queue.job_changed.connect(self.on_job_changed)
+        self.queue.job_finished.connect(self.on_job_finished)
+
+        # Вывод yt-dlp нужно вычитывать и без консоли, иначе очередь будет расти
+        self.output_timer = QTimer(self)
+        self.output_timer.setInterval(self.OUTPUT_INTERVAL_MS)
+        self.output_timer.timeout.connect(self.drain_output)
+
+    def emit(self, event, **fields):
+        fields = dict(event=event, time=round(time.time(), 3), **fields)
+        self.stream.write(json.dumps(fields, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+    def job_fields(self, job):
+        fields = {'job': job.id, 'url': job.url, 'state': job.state}
+        if job.parent:
+            fields['parent'] = job.parent.id
+        return fields
+
+    def start(self, urls):
+        self.output_timer.start()
+        if self.journal is not None:
+            # Сначала продолжаются задачи прошлого запуска, те же URL из списка не добавляются повторно
+            records = self.journal.open()
+            self.journal.attach(self.queue)
+            for job in self.queue.restore(records):
+                if job.state not in (DownloadJob.FAILED, DownloadJob.CANCELLED):
+                    self._known_urls.add(job.url)
+        for url in urls:
+            self.add_url(url)
+        self.check_finished()
+
+    def add_url(self, url):
+        if not re.match(r'^https?://', url):
+            self.emit('skipped', url=url, reason='invalid_url')
+            return
+
+        url = normalize_url(url)
+        if url in self._known_urls:
+            self.emit('skipped', url=url, reason='duplicate')
+            return
+        video_key = extract_video_key(url) or self.queue.history.key_for_url(url)
+        if self.queue.is_downloaded(video_key, self.options):
+            self.emit('skipped', url=url, reason='archived')
+            return
+        if video_key and self.queue.find_duplicate(video_key):
+            self.emit('skipped', url=url, reason='duplicate')
+            return
+
+        self._known_urls.add(url)
+        if self.expand_playlists and looks_like_playlist(url):
+            self.queue.enqueue_playlist(url, self.options)
+        else:
+            self.queue.enqueue(url, self.options, video_key)
+
+    def on_job_added(self, job):
+        self._states[job.id] = job.state
+        self.emit('queued', **self.job_fields(job))
+
+    def on_job_changed(self, job):
+        if job.is_finished():
+            return
+        if self._states.get(job.id) != job.state:
+            self._states[job.id] = job.state
+            fields = self.job_fields(job)
+            if job.state == DownloadJob.RETRYING:
+                fields.update(message=job.message, error_class=job.error_class)
+            self.emit('state', **fields)
+
+        progress = job.progress
+        now = time.monotonic()
+        if progress and now - self._progress_emitted.get(job.id, 0) >= self.PROGRESS_INTERVAL:
+            self._progress_emitted[job.id] = now
+            self.emit('progress', percent=progress.percent, downloaded_bytes=progress.downloaded_bytes,
+                      total_bytes=progress.total_bytes, speed=progress.speed, eta=progress.eta,
+                      **self.job_fields(job))
+
+    def on_job_finished(self, job):
+        self._states.pop(job.id, None)
+        self._progress_emitted.pop(job.id, None)
+        duration = job.finished_at - job.started_at if job.started_at else None
+        timings = {name: round(value, 3) for name, value in job.timings._asdict().items()
+                   if value is not None} if job.timings else None
+        self.emit('finished', message=job.message, duration=duration and round(duration, 3), timings=timings,
+                  **self.job_fields(job))
+        self.check_finished()
+
+    def drain_output(self):
+        self.queue.export_metrics()
+        for job_id, line in self.queue.drain_output(0.01, 5000):
+            if self.verbose:
+                sys.stderr.write(f"[#{job_id}] {line}\n" if job_id is not None else line + "\n")
+
+    def interrupt(self):
+        if self.interrupted:
+            return
+        self.interrupted = True
+        self.emit('interrupted')
+        if self.journal is not None:
+            # Прерванные задачи не отмечаются в журнале как отменённые и продолжатся при следующем запуске
+            self.journal.detach()
+        self.queue.cancel_all()
+        self.check_finished()
+
+    def check_finished(self):
+        if self.exit_code is not None or self.queue.has_active():
+            return
+        # Плейлист завершается после своего последнего видео - ждём и его
+        if any(not job.is_finished() for job in self.queue.jobs):
+            return
+        self.drain_output()
+        self.output_timer.stop()
+        if self.journal is not None:
+            self.journal.close()
+
+        counts = {}
+        for job in self.queue.jobs:
+            if not job.is_playlist():
+                counts[job.state] = counts.get(job.state, 0) + 1
+        failed = counts.get(DownloadJob.FAILED, 0)
+        failed += sum(1 for job in self.queue.jobs if job.is_playlist() and job.state == DownloadJob.FAILED and not job.children)
+
+        if self.interrupted:
+            self.exit_code = self.EXIT_INTERRUPTED
+        elif failed:
+            self.exit_code = self.EXIT_FAILED
+        else:
+            self.exit_code = self.EXIT_OK
+        self.emit('summary', done=counts.get(DownloadJob.DONE, 0), failed=failed,
+                  cancelled=counts.get(DownloadJob.CANCELLED, 0), exit_code=self.exit_code)
+        QCoreApplication.exit(self.exit_code)
+
+def read_urls(path):
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+def run_headless(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="gui_yt-dlp.py --headless",
+        description="Пакетная загрузка без окна: URL читаются из файла или stdin, "
+                    "состояние задач выводится в stdout в формате JSON lines"
+    )
+    parser.add_argument("--input", "-i", default="-", help="Файл со списком URL, по одному в строке ('-' - stdin)")
+    parser.add_argument("--jobs", "-j", type=int, default=ConfigManager.get_setting('max_workers') or default_worker_count(),
+                        help="Количество одновременных загрузок")
+    parser.add_argument("--no-archive", action="store_true", help="Не использовать архив загрузок")
+    parser.add_argument("--no-expand-playlists", action="store_true", help="Передавать плейлисты yt-dlp целиком")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Дублировать вывод yt-dlp в stderr")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="Журнал задач: незавершённые загрузки продолжаются при повторном запуске с тем же журналом")
+    args = parser.parse_args(argv)
+
+    app = QCoreApplication([sys.argv[0]])
+    ConfigManager.init_config()
+    if not ConfigManager.check_ytdlp_exists():
+        print(json.dumps({'event': 'error', 'message': "yt-dlp не найден"}, ensure_ascii=False), flush=True)
+        return HeadlessRunner.EXIT_NO_YTDLP
+
+    try:
+        urls = read_urls(args.input)
+    except OSError as e:
+        print(json.dumps({'event': 'error', 'message': str(e)}, ensure_ascii=False), flush=True)
+        return HeadlessRunner.EXIT_USAGE
+    if not urls and not args.journal:
+        print(json.dumps({'event': 'error', 'message': "Список URL пуст"}, ensure_ascii=False), flush=True)
+        return HeadlessRunner.EXIT_USAGE
+
+    # Те же настройки, что и у окна: yt-dlp.conf, архив и параметры из yt-dlp-gui.json
+    config = ConfigManager.config()
+    params = dict(config.params)
+    params['extra_args'] = config.extra_args
+    use_archive = ConfigManager.get_setting('use_archive', True) and not args.no_archive
+    params['download_archive'] = DownloadArchive.ARCHIVE_FILE if use_archive else None
+    options = DownloadOptions.from_params(params)
+
+    expand_playlists = ConfigManager.get_setting('expand_playlists', True) and not args.no_expand_playlists
+    journal = JobJournal(args.journal) if args.journal else None
+    if journal is not None and not journal.lock():
+        print(json.dumps({'event': 'error', 'message': f"Журнал задач {args.journal} используется другим процессом"},
+                         ensure_ascii=False), flush=True)
+        return HeadlessRunner.EXIT_USAGE
+    runner = HeadlessRunner(options, args.jobs, expand_playlists, args.verbose, journal=journal)
+    # Обработчик сигнала срабатывает между итерациями цикла событий, таймер вывода их обеспечивает
+    signal.signal(signal.SIGINT, lambda *_: runner.interrupt())
+    QTimer.singleShot(0, lambda: runner.start(urls))
+    app.exec()
+    return runner.exit_code if runner.exit_code is not None else HeadlessRunner.EXIT_FAILED
+
 if __name__ == "__main__":
+    if "--headless" in sys.argv[1:]:
+        sys.exit(run_headless([arg for arg in sys.argv[1:] if arg != "--headless"]))
+
+    if StartupProfile.FLAG in sys.argv:
+        sys.argv.remove(StartupProfile.FLAG)
+        startup_profile.enabled = True
+    elif os.environ.get(StartupProfile.ENV_VAR):
+        startup_profile.enabled = True
+    startup_profile.mark("Импорт модулей")
+
     app = QApplication(sys.argv)
+    startup_profile.mark("Создание QApplication")
+    # Вторая копия окна восстановила бы те же задачи из журнала и докачивала бы
+    # те же файлы одновременно с первой, поэтому окно запускается только одно.
+    # URL из командной строки уходят в уже открытое окно через API, если оно включено
+    start_urls = [arg for arg in app.arguments()[1:] if re.match(r'^https?://', arg)]
+    instance_lock = QLockFile(ConfigManager.INSTANCE_LOCK_FILE)
+    instance_lock.setStaleLockTime(0)
+    if not instance_lock.tryLock(0):
+        if not (ConfigManager.get_setting('api_enabled', True) and
+                ControlServer.forward_to_running(ConfigManager.get_setting('api_port'), start_urls)):
+            QMessageBox.information(None, "yt-dlp GUI", "Программа уже запущена")
+        sys.exit(0)
+
     window = YTDLPGUI()
     window.show()
+    startup_profile.mark("Показ окна")
+    for url in start_urls:
+        QTimer.singleShot(0, lambda url=url: window.status_bar.showMessage(window.enqueue_url(url)[2], 5000))
+
+    def on_event_loop_started():
+        startup_profile.mark("Первый цикл событий")
+        startup_profile.report()
+
+    QTimer.singleShot(0, on_event_loop_started)
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,133 @@
+import importlib.util
+import os
+import shlex
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def load_gui_module():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gui_yt-dlp.py")
+    spec = importlib.util.spec_from_file_location("gui_yt_dlp", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+gui = load_gui_module()
+ConfigModel = gui.ConfigModel
+
+USER_CONFIG = (
+    "# my config\n"
+    "--format bestvideo+bestaudio\n"
+    "--proxy socks5://127.0.0.1:9050\n"
+    "--output \"%(title)s.%(ext)s\"\n"
+    "--paths \"/data/Videos\"\n"
+    "--merge-output-format mp4\n"
+    "--no-mtime\n"
+)
+
+
+def make_model(tmp_path, text):
+    model = ConfigModel(str(tmp_path / "yt-dlp.conf"))
+    model.set_text(text)
+    return model
+
+
+def options_for(model, **changes):
+    return gui.DownloadOptions.from_params(dict(model.params, extra_args=model.extra_args, **changes))
+
+
+@pytest.mark.parametrize("text", [
+    USER_CONFIG,
+    "",
+    "--output x.%(ext)s",
+    "\n\n# comment only\n\n",
+    "  --paths   'C:\\Users\\me\\Videos'   # inline comment\n",
+    "--output=\"%(id)s.%(ext)s\"\n-P /tmp\n",
+    "--output \"unterminated\n--no-mtime\n",
+])
+def test_text_round_trip_is_lossless(tmp_path, text):
+    assert make_model(tmp_path, text).text() == text
+
+
+@pytest.mark.parametrize("text, key, expected", [
+    ("--output \"%(title)s.%(ext)s\"", 'output', "%(title)s.%(ext)s"),
+    ("-o %(id)s.%(ext)s", 'output', "%(id)s.%(ext)s"),
+    ("--paths=\"/data/My Videos\"", 'paths', "/data/My Videos"),
+    ("-P 'C:\\Users\\me\\Videos'", 'paths', "C:\\Users\\me\\Videos"),
+    ("--proxy socks5://127.0.0.1:9050 # tor", 'proxy', "socks5://127.0.0.1:9050"),
+    ("-w", 'no_overwrites', True),
+    ("--embed-metadata", 'add_metadata', True),
+    ("--sponsorblock-remove all", 'sponsorblock_remove', True),
+])
+def test_managed_options_are_parsed(tmp_path, text, key, expected):
+    assert make_model(tmp_path, text).params[key] == expected
+
+
+def test_unknown_options_are_passed_through_in_order(tmp_path):
+    model = make_model(tmp_path, USER_CONFIG + "--sponsorblock-remove sponsor,intro\n--output \"unterminated\n")
+    # Неподходящие аргументы делают опцию пользовательской, строка с ошибкой кавычек не передаётся
+    assert model.extra_args == ('--format', 'bestvideo+bestaudio', '--no-mtime',
+                                '--sponsorblock-remove', 'sponsor,intro')
+    assert model.params['sponsorblock_remove'] is False
+
+
+@pytest.mark.parametrize("value, force, expected", [
+    ("plain", False, 'plain'),
+    ("plain", True, '"plain"'),
+    ("with space", False, '"with space"'),
+    ("it's", False, '"it\'s"'),
+    ('a"b', False, '"a\\"b"'),
+    ("#tag", False, '"#tag"'),
+    ("C:\\Users\\me\\Videos", False, '"C:\\Users\\me\\Videos"'),
+    ("C:\\dir\\", False, '"C:\\dir\\\\"'),
+    ("", False, '""'),
+])
+def test_quote_config_value(value, force, expected):
+    quoted = gui.quote_config_value(value, force)
+    assert quoted == expected
+    assert shlex.split(quoted, comments=True) == [value]
+
+
+def test_update_rewrites_only_changed_lines(tmp_path):
+    model = make_model(tmp_path, USER_CONFIG)
+    assert model.update(options_for(model, proxy=None, output="%(id)s.%(ext)s", embed_thumbnail=True))
+    # Отключённый прокси удалён, изменённый шаблон переписан на месте, новая опция дописана в конец
+    assert model.text() == (
+        "# my config\n"
+        "--format bestvideo+bestaudio\n"
+        "--output \"%(id)s.%(ext)s\"\n"
+        "--paths \"/data/Videos\"\n"
+        "--merge-output-format mp4\n"
+        "--no-mtime\n"
+        "--embed-thumbnail\n"
+    )
+    with open(model.path, 'r', encoding='utf-8') as f:
+        assert f.read() == model.text()
+
+
+def test_update_without_changes_does_not_write(tmp_path):
+    model = make_model(tmp_path, USER_CONFIG)
+    model.save_text(USER_CONFIG)
+    stamp = os.stat(model.path).st_mtime_ns
+    assert not model.update(options_for(model))
+    assert os.stat(model.path).st_mtime_ns == stamp
+
+
+def test_update_keeps_user_quoting_of_unchanged_values(tmp_path):
+    text = "-P '/data/Videos'\n--output=%(title)s.%(ext)s\n--merge-output-format mp4\n"
+    model = make_model(tmp_path, text)
+    model.update(options_for(model))
+    assert model.text() == text
+
+
+def test_reload_picks_up_external_edits(tmp_path):
+    model = make_model(tmp_path, "")
+    model.save_text(USER_CONFIG)
+    with open(model.path, 'a', encoding='utf-8') as f:
+        f.write("--cookies-from-browser firefox\n")
+    assert model.reload_if_changed()
+    assert model.params['cookies_from_browser'] == "firefox"
+    assert model.text().endswith("--no-mtime\n--cookies-from-browser firefox\n")
@@ -0,0 +1,67 @@
+import importlib.util
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def load_gui_module():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gui_yt-dlp.py")
+    spec = importlib.util.spec_from_file_location("gui_yt_dlp", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+gui = load_gui_module()
+EC = gui.ErrorClassifier
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("ERROR: [youtube] abc: Unable to download webpage: HTTP Error 429: Too Many Requests", EC.RATE_LIMITED),
+    ("ERROR: unable to download video data: HTTP Error 403: Forbidden", EC.FORBIDDEN),
+    ("ERROR: [download] Got error: The read operation timed out. Giving up after 10 retries", EC.NETWORK),
+    ("ERROR: unable to download video data: HTTP Error 503: Service Unavailable", EC.NETWORK),
+    ("ERROR: [youtube] abc: Sign in to confirm you're not a bot. Use --cookies-from-browser or --cookies "
+     "for the authentication", EC.AUTH),
+    ("ERROR: [youtube] abc: Sign in to confirm your age. This video may be inappropriate for some users.", EC.AUTH),
+    ("ERROR: [youtube] abc: Private video. Sign in if you've been granted access to this video", EC.AUTH),
+    ("ERROR: [youtube] abc: Video unavailable. This video has been removed by the uploader", EC.UNAVAILABLE),
+    ("ERROR: [generic] Unable to download webpage: HTTP Error 404: Not Found", EC.UNAVAILABLE),
+    ("ERROR: Unsupported URL: https://example.com/", EC.UNAVAILABLE),
+    ("ERROR: [youtube] abc: Unable to extract initial player response; please report this issue", EC.EXTRACTOR),
+    ("ERROR: Postprocessing: ffmpeg exited with code 1", EC.POSTPROCESS),
+    ("ERROR: Postprocessing: Conversion failed!", EC.POSTPROCESS),
+    ("ERROR: You have requested merging of multiple formats but ffmpeg is not installed. Aborting due to "
+     "--abort-on-error", EC.LOCAL),
+    ("ERROR: unable to write data: [Errno 28] No space left on device", EC.LOCAL),
+    ("ERROR: [youtube] abc: Requested format is not available. Use --list-formats", EC.UNKNOWN),
+    ("ERROR: you can pass cookies with --cookies", EC.UNKNOWN),
+])
+def test_classify_error_line(line, expected):
+    error_class, detail = EC.classify([line])
+    assert error_class == expected
+    assert detail == line[len("ERROR:"):].strip()
+
+
+def test_recovered_fragment_warning_is_not_permanent():
+    lines = ["WARNING: [download] Got error: HTTP Error 404: Not Found. Retrying fragment 3 (1/10)...",
+             "ERROR: something odd"]
+    assert EC.classify(lines)[0] == EC.UNKNOWN
+
+
+def test_error_line_wins_over_warnings():
+    lines = ["WARNING: [download] Got error: The read operation timed out. Retrying fragment 3 (1/10)...",
+             "ERROR: [youtube] abc: Video unavailable"]
+    assert EC.classify(lines)[0] == EC.UNAVAILABLE
+
+
+def test_transient_warning_used_when_error_unrecognized():
+    lines = ["WARNING: [download] Got error: The read operation timed out. Retrying fragment 3 (10/10)...",
+             "ERROR: fragment 3 not found, unable to continue"]
+    assert EC.classify(lines) == (EC.NETWORK, "fragment 3 not found, unable to continue")
+
+
+def test_no_output_is_unknown():
+    assert EC.classify([]) == (EC.UNKNOWN, None)
@@ -0,0 +1,78 @@
+import importlib.util
+import os
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def load_gui_module():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gui_yt-dlp.py")
+    spec = importlib.util.spec_from_file_location("gui_yt_dlp", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+gui = load_gui_module()
+
+VIDEO = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+@pytest.mark.parametrize("url", [
+    "https://youtu.be/dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?si=abc123",
+    "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://youtube.com/live/dQw4w9WgXcQ?feature=share",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ&pp=ygUEdGVzdA%3D%3D",
+    "https://music.youtube.com/watch?v=dQw4w9WgXcQ&feature=share",
+    "https://www.youtube.com/watch?feature=youtu.be&v=dQw4w9WgXcQ#t=42",
+    "  https://www.youtube.com/embed/dQw4w9WgXcQ  ",
+])
+def test_youtube_video_links_collapse_to_watch_url(url):
+    assert gui.normalize_url(url) == VIDEO
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://m.youtube.com/watch?v=dQw4w9WgXcQ&list=PL123&index=2&pp=xyz", VIDEO + "&list=PL123"),
+    ("https://youtu.be/dQw4w9WgXcQ?list=PL123&si=abc", VIDEO + "&list=PL123"),
+    ("https://www.youtube.com/playlist?list=PL123&si=x", "https://www.youtube.com/playlist?list=PL123"),
+    ("https://www.youtube.com/watch?list=PL123", "https://www.youtube.com/playlist?list=PL123"),
+])
+def test_youtube_playlist_is_kept(url, expected):
+    assert gui.normalize_url(url) == expected
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://vimeo.com/12345?utm_source=tw&share=copy#t=10", "https://vimeo.com/12345?share=copy"),
+    ("https://x.com/u/status/1?s=20&ref_src=twsrc", "https://x.com/u/status/1?s=20"),
+    ("https://www.instagram.com/reel/abc/?igshid=xyz", "https://www.instagram.com/reel/abc/"),
+    ("https://www.youtube.com/@channel/videos?si=abc", "https://www.youtube.com/@channel/videos"),
+    ("https://vimeo.com/12345?a=%20b", "https://vimeo.com/12345?a=%20b"),
+])
+def test_tracking_params_stripped_on_known_hosts(url, expected):
+    assert gui.normalize_url(url) == expected
+
+
+@pytest.mark.parametrize("url", [
+    "https://example.com/watch?id=5&ref=home&utm_source=x#frag",
+    "https://cdn.example.org/video.mp4?pp=1&si=token",
+    "https://example.com/a%20b?q=%2F",
+])
+def test_unknown_hosts_are_unchanged(url):
+    assert gui.normalize_url(url) == url
+
+
+def test_scheme_and_host_are_lowercased_but_path_is_not():
+    assert gui.normalize_url("HTTPS://Example.COM/Path?B=1&a=2") == "https://example.com/Path?B=1&a=2"
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://youtu.be/dQw4w9WgXcQ", "youtube dQw4w9WgXcQ"),
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQ&list=PL123", "youtube dQw4w9WgXcQ"),
+    ("https://www.youtube.com/watch?v=dQw4w9WgXcQX", None),
+    ("https://www.youtube.com/playlist?list=PL123", None),
+    ("https://vimeo.com/12345", None),
+])
+def test_extract_video_key(url, expected):
+    assert gui.extract_video_key(url) == expected